@@ -86,16 +86,23 @@ class AuthManager:
         return self.db.update_password(user_id, hashed_password.hex(), salt.hex())
 
     def generate_session_token(self, username):
-        """为登录成功的用户生成一个会话令牌。"""
+        """为登录成功的用户生成一个会话令牌 (写入数据库，所有Web工作进程共享)。"""
         token = secrets.token_hex(32)
+        self.db.save_session(token, username)
         self.active_sessions[token] = username
         return token
 
     def verify_session_token(self, token):
-        """验证会话令牌是否有效，并返回对应的用户名。"""
-        return self.active_sessions.get(token)
+        """
+        验证会话令牌是否有效，并返回对应的用户名。
+        以数据库为准，这样在其他进程中登录或登出的令牌也能被正确识别。
+        """
+        username = self.db.get_session_username(token)
+        if username is None:
+            self.active_sessions.pop(token, None)
+        return username
 
     def invalidate_session_token(self, token):
         """使会话令牌失效 (用户登出)"""
-        if token in self.active_sessions:
-            del self.active_sessions[token]
\ No newline at end of file
+        self.db.delete_session(token)
+        self.active_sessions.pop(token, None)
\ No newline at end of file
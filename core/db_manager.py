@@ -3,24 +3,138 @@
 import sqlite3
 import json
 import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from core.rule_engine import CompiledRuleset, RuleEngine
+
+# 统计汇总的触发器：成绩写入或删除时增量更新 map_stats / player_stats / player_map_stats。
+# 批量重新生成统计时会先删除这些触发器，改用 GROUP BY 一次性计算 (两处的统计口径需要保持一致)。
+RACE_STATS_TRIGGERS = {
+    "races_after_insert": """
+    CREATE TRIGGER IF NOT EXISTS races_after_insert AFTER INSERT ON races WHEN NEW.map_id IS NOT NULL BEGIN
+        INSERT OR IGNORE INTO map_stats (map_id) VALUES (NEW.map_id);
+        UPDATE map_stats SET races = races + 1 WHERE map_id = NEW.map_id;
+    END;
+    """,
+    "races_after_delete": """
+    CREATE TRIGGER IF NOT EXISTS races_after_delete AFTER DELETE ON races WHEN OLD.map_id IS NOT NULL BEGIN
+        UPDATE map_stats SET races = races - 1 WHERE map_id = OLD.map_id;
+    END;
+    """,
+    "race_results_after_insert": """
+    CREATE TRIGGER IF NOT EXISTS race_results_after_insert AFTER INSERT ON race_results BEGIN
+        INSERT OR IGNORE INTO player_stats (player_id) VALUES (NEW.player_id);
+        UPDATE player_stats SET races = races + 1, finishes = finishes + (NEW.position IS NOT NULL),
+            wins = wins + (NEW.position IS 1), podiums = podiums + COALESCE(NEW.position <= 3, 0),
+            position_sum = position_sum + COALESCE(NEW.position, 0), points = points + NEW.points
+        WHERE player_id = NEW.player_id;
+    END;
+    """,
+    "race_results_after_insert_map": """
+    CREATE TRIGGER IF NOT EXISTS race_results_after_insert_map AFTER INSERT ON race_results WHEN NEW.map_id IS NOT NULL BEGIN
+        INSERT OR IGNORE INTO map_stats (map_id) VALUES (NEW.map_id);
+        UPDATE map_stats SET entries = entries + 1, finishes = finishes + (NEW.position IS NOT NULL),
+            position_sum = position_sum + COALESCE(NEW.position, 0),
+            timed = timed + (NEW.finish_time IS NOT NULL), time_sum = time_sum + COALESCE(NEW.finish_time, 0),
+            best_time = CASE WHEN best_time IS NULL OR NEW.finish_time < best_time THEN NEW.finish_time ELSE best_time END
+        WHERE map_id = NEW.map_id;
+        INSERT OR IGNORE INTO player_map_stats (player_id, map_id) VALUES (NEW.player_id, NEW.map_id);
+        UPDATE player_map_stats SET races = races + 1, finishes = finishes + (NEW.position IS NOT NULL),
+            wins = wins + (NEW.position IS 1), position_sum = position_sum + COALESCE(NEW.position, 0),
+            timed = timed + (NEW.finish_time IS NOT NULL), time_sum = time_sum + COALESCE(NEW.finish_time, 0),
+            best_time = CASE WHEN best_time IS NULL OR NEW.finish_time < best_time THEN NEW.finish_time ELSE best_time END
+        WHERE player_id = NEW.player_id AND map_id = NEW.map_id;
+    END;
+    """,
+    # 删除 (更正某一轮的成绩) 时扣回统计；最佳用时无法扣回，按索引重新查询
+    "race_results_after_delete": """
+    CREATE TRIGGER IF NOT EXISTS race_results_after_delete AFTER DELETE ON race_results BEGIN
+        UPDATE player_stats SET races = races - 1, finishes = finishes - (OLD.position IS NOT NULL),
+            wins = wins - (OLD.position IS 1), podiums = podiums - COALESCE(OLD.position <= 3, 0),
+            position_sum = position_sum - COALESCE(OLD.position, 0), points = points - OLD.points
+        WHERE player_id = OLD.player_id;
+    END;
+    """,
+    "race_results_after_delete_map": """
+    CREATE TRIGGER IF NOT EXISTS race_results_after_delete_map AFTER DELETE ON race_results WHEN OLD.map_id IS NOT NULL BEGIN
+        UPDATE map_stats SET entries = entries - 1, finishes = finishes - (OLD.position IS NOT NULL),
+            position_sum = position_sum - COALESCE(OLD.position, 0),
+            timed = timed - (OLD.finish_time IS NOT NULL), time_sum = time_sum - COALESCE(OLD.finish_time, 0),
+            best_time = (SELECT MIN(finish_time) FROM race_results WHERE map_id = OLD.map_id)
+        WHERE map_id = OLD.map_id;
+        UPDATE player_map_stats SET races = races - 1, finishes = finishes - (OLD.position IS NOT NULL),
+            wins = wins - (OLD.position IS 1), position_sum = position_sum - COALESCE(OLD.position, 0),
+            timed = timed - (OLD.finish_time IS NOT NULL), time_sum = time_sum - COALESCE(OLD.finish_time, 0),
+            best_time = (SELECT MIN(finish_time) FROM race_results WHERE player_id = OLD.player_id AND map_id = OLD.map_id)
+        WHERE player_id = OLD.player_id AND map_id = OLD.map_id;
+    END;
+    """,
+}
+
 
 class DBManager:
     _instance = None
+    # 内存中最多保留的已编译规则集数，超出时淘汰最久未使用的
+    MAX_COMPILED_RULESETS = 32
+    # 会话令牌的有效期 (秒)：过期的令牌查询时视为无效，并在启动和登录时从数据库中删除
+    SESSION_TTL = 12 * 3600
+
     def __new__(cls, db_path='data/competition.db'):
         if cls._instance is None:
             cls._instance = super(DBManager, cls).__new__(cls)
             os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            cls._instance.db_path = db_path
             cls._instance.conn = sqlite3.connect(db_path, check_same_thread=False)
             cls._instance.conn.row_factory = sqlite3.Row
+            # WAL模式允许多个Web工作进程与桌面程序同时读写同一个数据库
+            cls._instance.conn.execute("PRAGMA journal_mode=WAL")
             cls._instance.cursor = cls._instance.conn.cursor()
+            # 已编译的规则集：(规则集ID, 版本号) -> CompiledRuleset。每个版本的内容保存后不再改变，缓存无需失效
+            cls._instance._compiled_rulesets: "OrderedDict[Tuple[int, int], CompiledRuleset]" = OrderedDict()
+            cls._instance._ruleset_lock = threading.Lock()
+            # 连接级写锁：所有线程共用同一个连接，任何写入和提交都必须经过 _transaction()，
+            # 否则一个线程的 commit 会把另一个线程写到一半的事务一并提交
+            cls._instance._write_lock = threading.RLock()
+            cls._instance._write_depth = 0
             cls._instance._create_tables()
         return cls._instance
 
+    @contextmanager
+    def _transaction(self):
+        """
+        在共用连接上执行一个写事务：持有写锁，正常结束时提交，出错时回滚。
+        同一线程中嵌套调用时并入外层事务，由最外层提交。
+        """
+        with self._write_lock:
+            if self._write_depth:
+                self._write_depth += 1
+                try:
+                    yield
+                finally:
+                    self._write_depth -= 1
+                return
+            # 调用方直接在 conn 上写入后尚未提交时，已处于隐式事务中，再 BEGIN 会报错，直接并入该事务
+            if not self.conn.in_transaction:
+                # 立即获取数据库写锁，其他进程 (Web工作进程) 的写入在 busy timeout 内排队等待
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._write_depth = 1
+            try:
+                yield
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            finally:
+                self._write_depth = 0
+
     def _create_tables(self):
         sql_script = """
             CREATE TABLE IF NOT EXISTS accounts ( id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, hashed_password TEXT, salt TEXT, ingame_id TEXT, display_name TEXT );
             CREATE TABLE IF NOT EXISTS maps ( id TEXT PRIMARY KEY, theme TEXT, name_cn TEXT, name_tw TEXT, name_kr TEXT, name_en TEXT, difficulty INTEGER, game_type TEXT, has_reverse_mode BOOLEAN NOT NULL DEFAULT 0, tags TEXT );
-            CREATE TABLE IF NOT EXISTS rulesets ( id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL, author TEXT, ruleset_json TEXT NOT NULL );
+            CREATE TABLE IF NOT EXISTS rulesets ( id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL, author TEXT, ruleset_json TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 1 );
             CREATE TABLE IF NOT EXISTS match_history ( id INTEGER PRIMARY KEY AUTOINCREMENT, match_name TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, ruleset_id INTEGER, result_json TEXT, FOREIGN KEY (ruleset_id) REFERENCES rulesets (id) );
             
             -- 新增: 地图池表
@@ -29,10 +143,409 @@ class DBManager:
                 name TEXT UNIQUE NOT NULL,
                 selected_maps TEXT -- 存储地图ID的JSON列表, e.g., ["village_R01", "forest_I01_rvs"]
             );
+
+            -- 新增: 按比赛名称读取逐轮记录 (积分引擎崩溃后重建排名)
+            CREATE INDEX IF NOT EXISTS idx_match_history_match ON match_history (match_name, id);
+
+            -- 新增: 逐轮成绩的规范化表 (与 match_history 同时写入)，每场比赛的每一轮为一条 races 记录
+            CREATE TABLE IF NOT EXISTS races (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                match_history_id INTEGER,
+                match_name TEXT NOT NULL,
+                round_number INTEGER NOT NULL,
+                map_id TEXT,
+                UNIQUE (match_name, round_number)
+            );
+            CREATE TABLE IF NOT EXISTS race_results (
+                race_id INTEGER NOT NULL,
+                player_id TEXT NOT NULL,
+                map_id TEXT,
+                position INTEGER,       -- 未完赛为 NULL
+                finish_time REAL,       -- 完赛用时 (秒)，没有记录时为 NULL
+                points INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (race_id, player_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_race_results_map_time ON race_results (map_id, finish_time);
+            CREATE INDEX IF NOT EXISTS idx_race_results_player_map_time ON race_results (player_id, map_id, finish_time);
+
+            -- 新增: 地图和选手的统计汇总，由触发器在成绩写入或删除时增量更新 (查询时不需要扫描成绩表)
+            CREATE TABLE IF NOT EXISTS map_stats (
+                map_id TEXT PRIMARY KEY,
+                races INTEGER NOT NULL DEFAULT 0, entries INTEGER NOT NULL DEFAULT 0,
+                finishes INTEGER NOT NULL DEFAULT 0, position_sum INTEGER NOT NULL DEFAULT 0,
+                timed INTEGER NOT NULL DEFAULT 0, time_sum REAL NOT NULL DEFAULT 0, best_time REAL
+            );
+            CREATE TABLE IF NOT EXISTS player_stats (
+                player_id TEXT PRIMARY KEY,
+                races INTEGER NOT NULL DEFAULT 0, finishes INTEGER NOT NULL DEFAULT 0,
+                wins INTEGER NOT NULL DEFAULT 0, podiums INTEGER NOT NULL DEFAULT 0,
+                position_sum INTEGER NOT NULL DEFAULT 0, points INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS player_map_stats (
+                player_id TEXT NOT NULL, map_id TEXT NOT NULL,
+                races INTEGER NOT NULL DEFAULT 0, finishes INTEGER NOT NULL DEFAULT 0,
+                wins INTEGER NOT NULL DEFAULT 0, position_sum INTEGER NOT NULL DEFAULT 0,
+                timed INTEGER NOT NULL DEFAULT 0, time_sum REAL NOT NULL DEFAULT 0, best_time REAL,
+                PRIMARY KEY (player_id, map_id)
+            );
+            -- 新增: 规则集的历史版本 (rulesets 中保存当前版本，每次修改后版本号加一)
+            CREATE TABLE IF NOT EXISTS ruleset_versions (
+                ruleset_id INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                ruleset_json TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (ruleset_id, version)
+            );
+
+            -- 新增: 会话令牌表 (多个Web工作进程共享登录状态)
+            CREATE TABLE IF NOT EXISTS sessions (
+                token TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_created ON sessions (created_at);
+
+            -- 新增: 地图库版本号，地图或地图池的任何改动都会使其递增 (由触发器维护，对所有进程可见)
+            CREATE TABLE IF NOT EXISTS catalog_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0);
+            CREATE TRIGGER IF NOT EXISTS maps_after_insert AFTER INSERT ON maps BEGIN UPDATE catalog_version SET version = version + 1; END;
+            CREATE TRIGGER IF NOT EXISTS maps_after_update AFTER UPDATE ON maps BEGIN UPDATE catalog_version SET version = version + 1; END;
+            CREATE TRIGGER IF NOT EXISTS maps_after_delete AFTER DELETE ON maps BEGIN UPDATE catalog_version SET version = version + 1; END;
+            CREATE TRIGGER IF NOT EXISTS map_pools_after_insert AFTER INSERT ON map_pools BEGIN UPDATE catalog_version SET version = version + 1; END;
+            CREATE TRIGGER IF NOT EXISTS map_pools_after_update AFTER UPDATE ON map_pools BEGIN UPDATE catalog_version SET version = version + 1; END;
+            CREATE TRIGGER IF NOT EXISTS map_pools_after_delete AFTER DELETE ON map_pools BEGIN UPDATE catalog_version SET version = version + 1; END;
         """
-        self.cursor.executescript(sql_script)
-        self.conn.commit()
+        with self._write_lock:
+            self.cursor.executescript(sql_script + "".join(RACE_STATS_TRIGGERS.values()))
+            with self._transaction():
+                # 旧版数据库的 rulesets 表没有版本号：补上该列，并把当前内容记为第1版
+                columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(rulesets)")}
+                if "version" not in columns:
+                    self.conn.execute("ALTER TABLE rulesets ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+                self.conn.execute("INSERT OR IGNORE INTO ruleset_versions (ruleset_id, version, ruleset_json) "
+                                  "SELECT id, version, ruleset_json FROM rulesets")
+                self.delete_expired_sessions()
+
+    # --- 规则集管理方法 ---
+    # 规则集在保存时校验并编译，编译结果按 (规则集ID, 版本号) 缓存在内存中；
+    # 开始比赛时按ID (和版本号) 取出的是已编译的 CompiledRuleset，规则引擎求值时不再重新编译。
+    def _cached_ruleset(self, key: Tuple[int, int]) -> Optional[CompiledRuleset]:
+        with self._ruleset_lock:
+            compiled = self._compiled_rulesets.get(key)
+            if compiled is not None:
+                self._compiled_rulesets.move_to_end(key)
+            return compiled
+
+    def _cache_ruleset(self, compiled: CompiledRuleset):
+        with self._ruleset_lock:
+            key = (compiled.ruleset_id, compiled.version)
+            self._compiled_rulesets[key] = compiled
+            self._compiled_rulesets.move_to_end(key)
+            while len(self._compiled_rulesets) > self.MAX_COMPILED_RULESETS:
+                self._compiled_rulesets.popitem(last=False)
+
+    def save_ruleset(self, name: str, author: Optional[str], ruleset: dict) -> Tuple[int, int]:
+        """
+        校验并保存规则集，返回 (规则集ID, 版本号)。同名规则集已存在且内容有变化时保存为新版本，旧版本仍可读取。
+        规则集结构不正确或条件无法编译时抛出 RuleCompileError，数据库不做任何修改。
+        """
+        ruleset_json = json.dumps(ruleset, ensure_ascii=False)
+        compiled = RuleEngine().precompile_ruleset(json.loads(ruleset_json))
+        # 事务开始时即获取数据库写锁，避免多个进程同时保存同一个规则集时分配到相同的版本号
+        with self._transaction():
+            row = self.conn.execute("SELECT id, author, version, ruleset_json FROM rulesets WHERE name = ?",
+                                    (name,)).fetchone()
+            if row is None:
+                ruleset_id = self.conn.execute(
+                    "INSERT INTO rulesets (name, author, ruleset_json, version) VALUES (?, ?, ?, 1)",
+                    (name, author, ruleset_json)).lastrowid
+                version = 1
+            elif row["ruleset_json"] == ruleset_json and row["author"] == author:
+                ruleset_id, version = row["id"], row["version"]
+            else:
+                ruleset_id, version = row["id"], row["version"] + 1
+                self.conn.execute("UPDATE rulesets SET author = ?, ruleset_json = ?, version = ? WHERE id = ?",
+                                  (author, ruleset_json, version, ruleset_id))
+            self.conn.execute("INSERT OR IGNORE INTO ruleset_versions (ruleset_id, version, ruleset_json) "
+                              "VALUES (?, ?, ?)", (ruleset_id, version, ruleset_json))
+        compiled.ruleset_id, compiled.version = ruleset_id, version
+        self._cache_ruleset(compiled)
+        return ruleset_id, version
+
+    def load_ruleset(self, ruleset_id: int, version: Optional[int] = None) -> Optional[CompiledRuleset]:
+        """
+        取出已编译的规则集 (默认为当前版本)，不存在时返回 None。
+        指定版本号且已在缓存中时不访问数据库。
+        """
+        if version is None:
+            row = self.conn.execute("SELECT version FROM rulesets WHERE id = ?", (ruleset_id,)).fetchone()
+            if row is None:
+                return None
+            version = row["version"]
+        compiled = self._cached_ruleset((ruleset_id, version))
+        if compiled is not None:
+            return compiled
+        row = self.conn.execute("SELECT ruleset_json FROM ruleset_versions WHERE ruleset_id = ? AND version = ?",
+                                (ruleset_id, version)).fetchone()
+        if row is None:
+            return None
+        # 保存时已校验过；规则语言此后若有变化，无法编译的规则只被忽略，不影响读取
+        compiled = RuleEngine().precompile_ruleset(json.loads(row["ruleset_json"]), strict=False,
+                                                   ruleset_id=ruleset_id, version=version)
+        self._cache_ruleset(compiled)
+        return compiled
+
+    def get_ruleset_by_name(self, name: str, version: Optional[int] = None) -> Optional[dict]:
+        """根据名称获取规则集：{"id", "name", "author", "version", "ruleset": CompiledRuleset}"""
+        row = self.conn.execute("SELECT id, name, author FROM rulesets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        compiled = self.load_ruleset(row["id"], version)
+        if compiled is None:
+            return None
+        return {"id": row["id"], "name": row["name"], "author": row["author"], "version": compiled.version,
+                "ruleset": compiled}
+
+    def get_all_rulesets(self):
+        """获取所有规则集的ID、名称、作者和当前版本号"""
+        return self.conn.execute("SELECT id, name, author, version FROM rulesets ORDER BY name").fetchall()
+
+    def get_ruleset_versions(self, ruleset_id: int) -> List[Dict]:
+        """规则集的全部历史版本 (从新到旧)：[{"version", "created_at"}]"""
+        rows = self.conn.execute("SELECT version, created_at FROM ruleset_versions WHERE ruleset_id = ? "
+                                 "ORDER BY version DESC", (ruleset_id,))
+        return [dict(row) for row in rows]
+
+    def delete_ruleset(self, name: str) -> bool:
+        """删除规则集及其全部历史版本"""
+        row = self.conn.execute("SELECT id FROM rulesets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return False
+        with self._transaction():
+            self.conn.execute("DELETE FROM ruleset_versions WHERE ruleset_id = ?", (row["id"],))
+            self.conn.execute("DELETE FROM rulesets WHERE id = ?", (row["id"],))
+        with self._ruleset_lock:
+            for key in [key for key in self._compiled_rulesets if key[0] == row["id"]]:
+                del self._compiled_rulesets[key]
+        return True
     
+    # --- 比赛记录 (积分引擎每轮写入一条，使用独立游标) ---
+    def save_match_round(self, match_name: str, ruleset_id: Optional[int], result: dict) -> int:
+        """
+        写入一轮成绩，并在同一个事务中写入规范化的成绩表 (统计汇总由触发器更新)。
+        :param result: {"round", "results": {选手ID: 名次}, "awarded": {选手ID: 得分}, "map_id", "times": {选手ID: 用时}}
+        """
+        with self._transaction():
+            cursor = self.conn.execute(
+                "INSERT INTO match_history (match_name, ruleset_id, result_json) VALUES (?, ?, ?)",
+                (match_name, ruleset_id, json.dumps(result, ensure_ascii=False)))
+            self._insert_race(cursor.lastrowid, match_name, result)
+        return cursor.lastrowid
+
+    def _insert_race(self, match_history_id: int, match_name: str, result: dict):
+        """把一轮成绩写入 races / race_results；同一轮已有成绩时视为更正，先删除原来的成绩"""
+        round_number = result.get("round")
+        results = result.get("results")
+        if round_number is None or not results:
+            return
+        existing = self.conn.execute("SELECT id FROM races WHERE match_name = ? AND round_number = ?",
+                                     (match_name, round_number)).fetchone()
+        if existing is not None:
+            self.conn.execute("DELETE FROM race_results WHERE race_id = ?", (existing["id"],))
+            self.conn.execute("DELETE FROM races WHERE id = ?", (existing["id"],))
+        map_id = result.get("map_id")
+        race_id = self.conn.execute(
+            "INSERT INTO races (match_history_id, match_name, round_number, map_id) VALUES (?, ?, ?, ?)",
+            (match_history_id, match_name, round_number, map_id)).lastrowid
+        awarded = result.get("awarded") or {}
+        times = result.get("times") or {}
+        self.conn.executemany(
+            "INSERT INTO race_results (race_id, player_id, map_id, position, finish_time, points) VALUES (?, ?, ?, ?, ?, ?)",
+            [(race_id, player_id, map_id, position, times.get(player_id), awarded.get(player_id, 0))
+             for player_id, position in results.items()])
+
+    def rebuild_race_analytics(self) -> int:
+        """
+        按 match_history 中的全部记录重新生成成绩表和统计汇总 (用于导入旧数据)，返回生成的轮数。
+        在同一个事务中暂时删除统计触发器，批量写入成绩后用 GROUP BY 一次性计算汇总，再恢复触发器。
+        """
+        with self._transaction():
+            for name in RACE_STATS_TRIGGERS:
+                self.conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+            for table in ("race_results", "races", "map_stats", "player_stats", "player_map_stats"):
+                self.conn.execute(f"DELETE FROM {table}")
+            # 同一轮有多条记录时以最后一条 (更正) 为准
+            latest = {}
+            for row in self.conn.execute("SELECT id, match_name, result_json FROM match_history ORDER BY id"):
+                result = json.loads(row["result_json"]) if row["result_json"] else None
+                if isinstance(result, dict) and result.get("round") is not None and result.get("results"):
+                    latest[(row["match_name"], result["round"])] = (row["id"], result)
+            race_rows, result_rows = [], []
+            for race_id, ((match_name, round_number), (history_id, result)) in enumerate(latest.items(), 1):
+                map_id = result.get("map_id")
+                race_rows.append((race_id, history_id, match_name, round_number, map_id))
+                awarded = result.get("awarded") or {}
+                times = result.get("times") or {}
+                result_rows.extend((race_id, player_id, map_id, position, times.get(player_id),
+                                    awarded.get(player_id, 0)) for player_id, position in result["results"].items())
+            self.conn.executemany("INSERT INTO races (id, match_history_id, match_name, round_number, map_id) "
+                                  "VALUES (?, ?, ?, ?, ?)", race_rows)
+            self.conn.executemany("INSERT INTO race_results (race_id, player_id, map_id, position, finish_time, points) "
+                                  "VALUES (?, ?, ?, ?, ?, ?)", result_rows)
+            self.conn.execute("""
+                INSERT INTO map_stats (map_id, races, entries, finishes, position_sum, timed, time_sum, best_time)
+                SELECT r.map_id, (SELECT COUNT(*) FROM races WHERE races.map_id = r.map_id), COUNT(*), COUNT(r.position),
+                       COALESCE(SUM(r.position), 0), COUNT(r.finish_time), COALESCE(SUM(r.finish_time), 0), MIN(r.finish_time)
+                FROM race_results r WHERE r.map_id IS NOT NULL GROUP BY r.map_id""")
+            self.conn.execute("""
+                INSERT INTO player_stats (player_id, races, finishes, wins, podiums, position_sum, points)
+                SELECT player_id, COUNT(*), COUNT(position), SUM(position IS 1), SUM(COALESCE(position <= 3, 0)),
+                       COALESCE(SUM(position), 0), SUM(points)
+                FROM race_results GROUP BY player_id""")
+            self.conn.execute("""
+                INSERT INTO player_map_stats (player_id, map_id, races, finishes, wins, position_sum, timed, time_sum, best_time)
+                SELECT player_id, map_id, COUNT(*), COUNT(position), SUM(position IS 1), COALESCE(SUM(position), 0),
+                       COUNT(finish_time), COALESCE(SUM(finish_time), 0), MIN(finish_time)
+                FROM race_results WHERE map_id IS NOT NULL GROUP BY player_id, map_id""")
+            for sql in RACE_STATS_TRIGGERS.values():
+                self.conn.execute(sql)
+        return len(race_rows)
+
+    # --- 地图与选手统计 (直接读取汇总表，不扫描成绩) ---
+    def get_map_stats(self, map_ids: Optional[List[str]] = None) -> List[Dict]:
+        """
+        各地图的统计，按被选次数从多到少排列：
+        [{"map_id", "name", "races", "pick_rate", "average_position", "finish_rate", "average_time", "best_time"}]
+        """
+        total = self.conn.execute("SELECT COALESCE(SUM(races), 0) AS total FROM map_stats").fetchone()["total"]
+        sql = ("SELECT s.*, m.name_cn FROM map_stats s LEFT JOIN maps m ON m.id = s.map_id "
+               "WHERE s.races > 0")
+        params: tuple = ()
+        if map_ids is not None:
+            sql += f" AND s.map_id IN ({', '.join('?' * len(map_ids))})"
+            params = tuple(map_ids)
+        stats = []
+        for row in self.conn.execute(sql + " ORDER BY s.races DESC, s.map_id", params):
+            stats.append({
+                "map_id": row["map_id"],
+                "name": row["name_cn"],
+                "races": row["races"],
+                "pick_rate": row["races"] / total if total else 0.0,
+                "average_position": row["position_sum"] / row["finishes"] if row["finishes"] else None,
+                "finish_rate": row["finishes"] / row["entries"] if row["entries"] else None,
+                "average_time": row["time_sum"] / row["timed"] if row["timed"] else None,
+                "best_time": row["best_time"],
+            })
+        return stats
+
+    def get_player_stats(self, player_ids: Optional[List[str]] = None) -> List[Dict]:
+        """
+        各选手的统计，按胜场从多到少排列：
+        [{"player_id", "races", "wins", "win_rate", "podiums", "podium_rate", "average_position", "finish_rate", "points"}]
+        """
+        sql = "SELECT * FROM player_stats WHERE races > 0"
+        params: tuple = ()
+        if player_ids is not None:
+            sql += f" AND player_id IN ({', '.join('?' * len(player_ids))})"
+            params = tuple(player_ids)
+        stats = []
+        for row in self.conn.execute(sql + " ORDER BY wins DESC, points DESC, player_id", params):
+            races = row["races"]
+            stats.append({
+                "player_id": row["player_id"],
+                "races": races,
+                "wins": row["wins"],
+                "win_rate": row["wins"] / races,
+                "podiums": row["podiums"],
+                "podium_rate": row["podiums"] / races,
+                "average_position": row["position_sum"] / row["finishes"] if row["finishes"] else None,
+                "finish_rate": row["finishes"] / races,
+                "points": row["points"],
+            })
+        return stats
+
+    def get_player_map_stats(self, player_id: str) -> List[Dict]:
+        """
+        某个选手在各地图上的统计，按参赛次数从多到少排列：
+        [{"map_id", "races", "wins", "win_rate", "average_position", "average_time", "best_time"}]
+        """
+        rows = self.conn.execute("SELECT * FROM player_map_stats WHERE player_id = ? AND races > 0 "
+                                 "ORDER BY races DESC, map_id", (player_id,))
+        return [{
+            "map_id": row["map_id"],
+            "races": row["races"],
+            "wins": row["wins"],
+            "win_rate": row["wins"] / row["races"],
+            "average_position": row["position_sum"] / row["finishes"] if row["finishes"] else None,
+            "average_time": row["time_sum"] / row["timed"] if row["timed"] else None,
+            "best_time": row["best_time"],
+        } for row in rows]
+
+    def get_match_history(self, match_name: str) -> List[Dict]:
+        """按写入顺序返回一场比赛的全部记录：[{"id", "timestamp", "ruleset_id", "result"}]"""
+        rows = self.conn.execute("SELECT id, timestamp, ruleset_id, result_json FROM match_history "
+                                 "WHERE match_name = ? ORDER BY id", (match_name,))
+        return [{"id": row["id"], "timestamp": row["timestamp"], "ruleset_id": row["ruleset_id"],
+                 "result": json.loads(row["result_json"]) if row["result_json"] else None} for row in rows]
+
+    # --- 会话管理方法 (使用独立游标，可在Web服务的线程池中并发调用) ---
+    def _session_cutoff(self):
+        # created_at 为 UTC 的 'YYYY-MM-DD HH:MM:SS'，与 datetime('now', ...) 的格式相同，可直接比较
+        return f"-{int(self.SESSION_TTL)} seconds"
+
+    def save_session(self, token, username):
+        """保存新登录的令牌，同时清理已过期的令牌"""
+        with self._transaction():
+            self.delete_expired_sessions()
+            self.conn.execute("INSERT OR REPLACE INTO sessions (token, username) VALUES (?, ?)", (token, username))
+
+    def get_session_username(self, token):
+        """令牌对应的用户名；令牌不存在或已超过 SESSION_TTL 时返回 None"""
+        row = self.conn.execute("SELECT username FROM sessions WHERE token = ? AND created_at > datetime('now', ?)",
+                                (token, self._session_cutoff())).fetchone()
+        return row["username"] if row else None
+
+    def delete_session(self, token):
+        with self._transaction():
+            cursor = self.conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+        return cursor.rowcount > 0
+
+    def delete_expired_sessions(self) -> int:
+        """删除已过期的会话令牌，返回删除的数量"""
+        with self._transaction():
+            cursor = self.conn.execute("DELETE FROM sessions WHERE created_at <= datetime('now', ?)",
+                                       (self._session_cutoff(),))
+        return cursor.rowcount
+
+    # --- 地图库只读查询 (供Web服务的缓存在线程池中调用，使用独立游标) ---
+    def get_catalog_version(self):
+        row = self.conn.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()
+        return row["version"] if row else 0
+
+    def get_catalog_snapshot(self):
+        """
+        读取版本号、全部地图和地图池。先读版本号：若读取期间有新的改动，
+        数据只会比版本号更新，下次检查时版本号变化会再次重新加载，不会长期停留在旧数据上。
+        """
+        version = self.get_catalog_version()
+        maps = [dict(row) for row in self.conn.execute("SELECT * FROM maps ORDER BY theme, id")]
+        pools = {row["name"]: json.loads(row["selected_maps"] or "[]")
+                 for row in self.conn.execute("SELECT name, selected_maps FROM map_pools ORDER BY name")}
+        return version, maps, pools
+
+    def get_maps_by_ids(self, map_ids: List[str]) -> Dict[str, Dict]:
+        """按地图ID批量读取地图信息：{地图ID: 地图行}，不存在的ID不出现在结果中"""
+        result = {}
+        # SQLite 单条语句的参数个数有上限，分批查询
+        for i in range(0, len(map_ids), 500):
+            chunk = map_ids[i:i + 500]
+            rows = self.conn.execute(f"SELECT * FROM maps WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            result.update((row["id"], dict(row)) for row in rows)
+        return result
+
     # --- 新增/修改的地图池管理方法 ---
     def get_all_map_pools(self):
         """获取所有地图池的名称和ID"""
@@ -50,17 +563,17 @@ class DBManager:
     def save_map_pool(self, name, selected_maps_list):
         """保存或更新一个地图池"""
         maps_json = json.dumps(selected_maps_list)
-        self.cursor.execute(
-            "INSERT OR REPLACE INTO map_pools (id, name, selected_maps) VALUES ((SELECT id FROM map_pools WHERE name = ?), ?, ?)",
-            (name, name, maps_json)
-        )
-        self.conn.commit()
+        with self._transaction():
+            self.cursor.execute(
+                "INSERT OR REPLACE INTO map_pools (id, name, selected_maps) VALUES ((SELECT id FROM map_pools WHERE name = ?), ?, ?)",
+                (name, name, maps_json)
+            )
 
     def delete_map_pool(self, name):
         """删除一个地图池"""
-        self.cursor.execute("DELETE FROM map_pools WHERE name = ?", (name,))
-        self.conn.commit()
-        return self.cursor.rowcount > 0
+        with self._transaction():
+            self.cursor.execute("DELETE FROM map_pools WHERE name = ?", (name,))
+            return self.cursor.rowcount > 0
 
     def save_maps_batch(self, map_data_list):
         # --- 核心修改: gameType现在直接从map_data_list获取，不再自行解析 ---
@@ -86,30 +599,35 @@ class DBManager:
                 map_data.get('has_reverse_mode', False),
                 json.dumps(map_data.get('tags', []))
             ))
-        self.cursor.executemany(sql, batch_data)
-        self.conn.commit()
+        with self._transaction():
+            self.cursor.executemany(sql, batch_data)
 
     # ... 其余所有方法保持不变 ...
     def create_account(self, username, hashed_password, salt, ingame_id=None, display_name=None):
         try:
-            db_username = username if username else None; self.cursor.execute( "INSERT INTO accounts (username, hashed_password, salt, ingame_id, display_name) VALUES (?, ?, ?, ?, ?)", (db_username, hashed_password, salt, ingame_id, display_name) ); self.conn.commit(); return self.cursor.lastrowid
+            with self._transaction():
+                db_username = username if username else None; self.cursor.execute( "INSERT INTO accounts (username, hashed_password, salt, ingame_id, display_name) VALUES (?, ?, ?, ?, ?)", (db_username, hashed_password, salt, ingame_id, display_name) ); return self.cursor.lastrowid
         except sqlite3.IntegrityError: return None
     def get_account_by_username(self, username):
-        self.cursor.execute("SELECT * FROM accounts WHERE username = ?", (username,)); return self.cursor.fetchone()
+        return self.conn.execute("SELECT * FROM accounts WHERE username = ?", (username,)).fetchone()
     def get_account_by_id(self, user_id):
         self.cursor.execute("SELECT * FROM accounts WHERE id = ?", (user_id,)); return self.cursor.fetchone()
     def get_all_accounts(self):
         self.cursor.execute("SELECT id, username, ingame_id, display_name FROM accounts ORDER BY username"); return self.cursor.fetchall()
     def update_account(self, user_id, username, ingame_id, display_name):
         try:
-            db_username = username if username else None; self.cursor.execute( "UPDATE accounts SET username = ?, ingame_id = ?, display_name = ? WHERE id = ?", (db_username, ingame_id, display_name, user_id) ); self.conn.commit(); return True
+            with self._transaction():
+                db_username = username if username else None; self.cursor.execute( "UPDATE accounts SET username = ?, ingame_id = ?, display_name = ? WHERE id = ?", (db_username, ingame_id, display_name, user_id) ); return True
         except sqlite3.IntegrityError: return False
     def update_password(self, user_id, hashed_password, salt):
-        self.cursor.execute( "UPDATE accounts SET hashed_password = ?, salt = ? WHERE id = ?", (hashed_password, salt, user_id) ); self.conn.commit(); return True
+        with self._transaction():
+            self.cursor.execute( "UPDATE accounts SET hashed_password = ?, salt = ? WHERE id = ?", (hashed_password, salt, user_id) ); return True
     def delete_account(self, user_id):
-        self.cursor.execute("DELETE FROM accounts WHERE id = ?", (user_id,)); self.conn.commit(); return self.cursor.rowcount > 0
+        with self._transaction():
+            self.cursor.execute("DELETE FROM accounts WHERE id = ?", (user_id,)); return self.cursor.rowcount > 0
     def clear_maps_table(self):
-        self.cursor.execute("DELETE FROM maps"); self.conn.commit()
+        with self._transaction():
+            self.cursor.execute("DELETE FROM maps")
     def get_all_maps_structured_by_theme(self):
         self.cursor.execute("SELECT * FROM maps ORDER BY theme, id"); all_maps = self.cursor.fetchall()
         structured_maps = {}
@@ -121,7 +639,8 @@ class DBManager:
     def update_map_details(self, map_id, field_name, new_value):
         allowed_fields = ['name_cn', 'name_tw', 'name_kr', 'name_en', 'difficulty', 'tags']
         if field_name not in allowed_fields: return False
-        sql = f"UPDATE maps SET {field_name} = ? WHERE id = ?"; self.cursor.execute(sql, (new_value, map_id)); self.conn.commit()
-        return self.cursor.rowcount > 0
+        sql = f"UPDATE maps SET {field_name} = ? WHERE id = ?"
+        with self._transaction():
+            self.cursor.execute(sql, (new_value, map_id)); return self.cursor.rowcount > 0
     def close(self):
         if self.conn: self.conn.close()
\ No newline at end of file
@@ -0,0 +1,270 @@
+# 文件名: core/map_draw.py
+
+import random
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+# 从地图池中随机抽取地图：
+# 每张地图有一个权重 (例如按难度，或让历史上较少被选的地图更容易被抽到)，按权重抽取。
+# 权重保存在树状数组 (Fenwick tree) 中，抽取、移除和恢复一张地图都是 O(log n)，不需要每次重建候选列表：
+#   - 不放回抽取：抽中的地图权重置零；repeat_gap=K 时在之后的 K 次抽取中排除，再恢复原权重；
+#   - 同一主题不连续出现：地图按主题排列，同一主题在树中是连续的一段，排除上一张的主题只需跳过这一段的权重；
+#   - 正向与反向 (<地图ID>_rvs) 是同一条赛道，默认一起排除。
+# 使用固定的 seed 时抽取顺序可以复现 (例如赛后核对，或在多个客户端上重放)。
+
+REVERSE_SUFFIX = "_rvs"
+
+# 权重按该比例换算为整数，树中只做整数加减，多次移除和恢复后不会累积浮点误差
+WEIGHT_SCALE = 1_000_000
+
+
+class MapEntry:
+    """地图池中的一张地图"""
+
+    __slots__ = ("display_id", "map_id", "theme", "difficulty", "picks")
+
+    def __init__(self, display_id: str, theme: Optional[str] = None, difficulty: Optional[int] = None, picks: int = 0):
+        self.display_id = display_id
+        # 反向地图与正向地图是同一条赛道
+        self.map_id = display_id[:-len(REVERSE_SUFFIX)] if display_id.endswith(REVERSE_SUFFIX) else display_id
+        self.theme = theme or self.map_id.split("_")[0]
+        self.difficulty = difficulty
+        self.picks = picks  # 历史上被选中的次数
+
+    def __repr__(self):
+        return f"MapEntry({self.display_id!r}, theme={self.theme!r}, difficulty={self.difficulty!r}, picks={self.picks!r})"
+
+
+# --- 常用的权重函数 ---
+def weight_by_difficulty(weights: Dict[int, float], default: float = 1.0) -> Callable[[MapEntry], float]:
+    """按难度设置权重，例如 {1: 0.5, 2: 1, 3: 2} 让高难度地图更容易被抽到；未列出的难度使用 default"""
+    def weight(entry: MapEntry) -> float:
+        try:
+            return weights.get(int(entry.difficulty), default)
+        except (TypeError, ValueError):
+            return default
+    return weight
+
+
+def weight_by_pick_history(strength: float = 1.0) -> Callable[[MapEntry], float]:
+    """历史上被选得越多的地图权重越低：1 / (1 + 被选次数) ^ strength"""
+    def weight(entry: MapEntry) -> float:
+        return 1.0 / (1 + entry.picks) ** strength
+    return weight
+
+
+def combine_weights(*weights: Callable[[MapEntry], float]) -> Callable[[MapEntry], float]:
+    """多个权重函数相乘"""
+    def weight(entry: MapEntry) -> float:
+        result = 1.0
+        for fn in weights:
+            result *= fn(entry)
+        return result
+    return weight
+
+
+class _FenwickTree:
+    """非负整数权重的树状数组：单点修改、前缀和、按累计权重查找均为 O(log n)"""
+
+    __slots__ = ("_tree", "_values", "_top")
+
+    def __init__(self, values: Sequence[int]):
+        n = len(values)
+        self._values = list(values)
+        self._tree = [0] * (n + 1)
+        for i, value in enumerate(self._values, 1):
+            self._tree[i] += value
+            parent = i + (i & -i)
+            if parent <= n:
+                self._tree[parent] += self._tree[i]
+        self._top = 1 << (n.bit_length() - 1) if n else 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def value(self, index: int) -> int:
+        return self._values[index]
+
+    def set(self, index: int, value: int):
+        delta = value - self._values[index]
+        if delta == 0:
+            return
+        self._values[index] = value
+        i = index + 1
+        n = len(self._values)
+        while i <= n:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, end: int) -> int:
+        """前 end 个元素的权重之和"""
+        total = 0
+        i = end
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def total(self) -> int:
+        return self.prefix(len(self._values))
+
+    def find(self, target: int) -> int:
+        """累计权重首次超过 target 的元素序号 (0 <= target < total)"""
+        position = 0
+        step = self._top
+        n = len(self._values)
+        while step:
+            nxt = position + step
+            if nxt <= n and self._tree[nxt] <= target:
+                position = nxt
+                target -= self._tree[nxt]
+            step >>= 1
+        return position
+
+
+class MapDrawEngine:
+    """
+    按权重从地图池中抽取地图。
+    :param weight: 权重函数 MapEntry -> 非负数，默认所有地图权重相同；权重为 0 的地图不会被抽到
+    :param repeat_gap: 抽中的地图在之后多少次抽取中排除；None 表示不放回 (直到 reset)，0 表示可以连续抽中
+    :param avoid_same_theme: 不连续抽到同一主题 (只剩这一主题可抽时放宽)
+    :param link_reverse: 正向与反向地图视为同一条赛道，一起排除
+    """
+
+    def __init__(self, entries: Sequence[MapEntry], weight: Optional[Callable[[MapEntry], float]] = None,
+                 seed=None, repeat_gap: Optional[int] = None, avoid_same_theme: bool = True,
+                 link_reverse: bool = True):
+        # 同一主题的地图排在一起 (主题内保持地图池中的顺序)，主题在树中对应连续的一段
+        first_seen: Dict[str, int] = {}
+        for i, entry in enumerate(entries):
+            first_seen.setdefault(entry.theme, i)
+        self.entries: List[MapEntry] = sorted(entries, key=lambda e: first_seen[e.theme])
+        self.repeat_gap = repeat_gap
+        self.avoid_same_theme = avoid_same_theme
+        self.link_reverse = link_reverse
+
+        self._weights = [self._scale(weight(entry) if weight is not None else 1.0) for entry in self.entries]
+        self._tree = _FenwickTree(self._weights)
+        self._index = {entry.display_id: i for i, entry in enumerate(self.entries)}
+        self._tracks: Dict[str, List[int]] = {}
+        self._theme_ranges: Dict[str, Tuple[int, int]] = {}
+        for i, entry in enumerate(self.entries):
+            self._tracks.setdefault(entry.map_id, []).append(i)
+            start, _ = self._theme_ranges.get(entry.theme, (i, i))
+            self._theme_ranges[entry.theme] = (start, i + 1)
+
+        self._rng = random.Random(seed)
+        # 被排除的地图：序号 -> 恢复时的抽取次数 (None 为不放回)；按恢复时间排列的队列
+        self._blocked: Dict[int, Optional[int]] = {}
+        self._releases: Deque[Tuple[int, int]] = deque()
+        self._banned = set()
+        self.draws = 0
+        self.last_theme: Optional[str] = None
+        self.history: List[str] = []
+
+    @staticmethod
+    def _scale(weight: float) -> int:
+        if weight < 0:
+            raise ValueError(f"地图权重不能为负数: {weight}")
+        return max(1, round(weight * WEIGHT_SCALE)) if weight > 0 else 0
+
+    @classmethod
+    def from_pool(cls, db, pool_name: str, weight: Optional[Callable[[MapEntry], float]] = None,
+                  **options) -> "MapDrawEngine":
+        """
+        由 map_pools 中保存的地图池创建 (地图的主题和难度取自 maps 表，被选次数取自地图统计)。
+        其余参数与构造函数相同。
+        """
+        pool = db.get_map_pool_by_name(pool_name)
+        if pool is None:
+            raise ValueError(f"地图池 '{pool_name}' 不存在")
+        display_ids = list(dict.fromkeys(pool["selected_maps"]))
+        entries = [MapEntry(display_id) for display_id in display_ids]
+        maps = db.get_maps_by_ids(list({entry.map_id for entry in entries}))
+        picks = {row["map_id"]: row["races"] for row in db.get_map_stats(display_ids)}
+        for entry in entries:
+            info = maps.get(entry.map_id)
+            if info is not None:
+                entry.theme = info["theme"] or entry.theme
+                entry.difficulty = info["difficulty"]
+            entry.picks = picks.get(entry.display_id, 0)
+        return cls(entries, weight, **options)
+
+    # --- 排除与恢复 ---
+    def _exclude(self, index: int, release: Optional[int]):
+        current = self._blocked.get(index, 0)
+        if index in self._blocked and (current is None or (release is not None and current >= release)):
+            return  # 已经被排除得更久
+        self._blocked[index] = release
+        self._tree.set(index, 0)
+        if release is not None:
+            self._releases.append((release, index))
+
+    def _restore(self, index: int):
+        self._blocked.pop(index, None)
+        if index not in self._banned:
+            self._tree.set(index, self._weights[index])
+
+    def _release_expired(self):
+        while self._releases and self._releases[0][0] <= self.draws:
+            release, index = self._releases.popleft()
+            if self._blocked.get(index, -1) == release:
+                self._restore(index)
+
+    def ban(self, display_id: str):
+        """禁用一张地图 (例如被选手禁掉)，直到 unban"""
+        index = self._index[display_id]
+        self._banned.add(index)
+        self._tree.set(index, 0)
+
+    def unban(self, display_id: str):
+        index = self._index[display_id]
+        self._banned.discard(index)
+        if index not in self._blocked:
+            self._tree.set(index, self._weights[index])
+
+    def reset(self):
+        """恢复全部被抽过的地图 (禁用的地图仍然禁用)，抽取记录清空；随机数状态不重置"""
+        for index in list(self._blocked):
+            self._restore(index)
+        self._releases.clear()
+        self.draws = 0
+        self.last_theme = None
+        self.history = []
+
+    # --- 抽取 ---
+    def available(self) -> int:
+        """当前可以抽到的地图数 (不考虑主题限制)"""
+        return sum(1 for i in range(len(self._tree)) if self._tree.value(i) > 0)
+
+    def draw(self) -> str:
+        """抽取一张地图，返回地图ID (反向地图为 <地图ID>_rvs)；没有可抽取的地图时抛出 LookupError"""
+        self._release_expired()
+        total = self._tree.total()
+        if total == 0:
+            raise LookupError("地图池中没有可以抽取的地图")
+        skip_start = skip_weight = 0
+        if self.avoid_same_theme and self.last_theme is not None:
+            start, end = self._theme_ranges[self.last_theme]
+            skip_start = self._tree.prefix(start)
+            skip_weight = self._tree.prefix(end) - skip_start
+            if skip_weight == total:
+                skip_weight = 0  # 只剩这一主题可抽，放宽限制
+        target = self._rng.randrange(total - skip_weight)
+        if skip_weight and target >= skip_start:
+            target += skip_weight  # 跳过上一张地图所在主题的那一段
+        index = self._tree.find(target)
+        entry = self.entries[index]
+
+        release = None if self.repeat_gap is None else self.draws + self.repeat_gap + 1
+        if release is None or self.repeat_gap > 0:
+            for blocked in (self._tracks[entry.map_id] if self.link_reverse else (index,)):
+                self._exclude(blocked, release)
+        self.draws += 1
+        self.last_theme = entry.theme
+        self.history.append(entry.display_id)
+        return entry.display_id
+
+    def draw_many(self, count: int) -> List[str]:
+        """连续抽取多张地图 (例如一次排出整场比赛的地图顺序)"""
+        return [self.draw() for _ in range(count)]
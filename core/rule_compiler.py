@@ -0,0 +1,153 @@
+# 文件名: core/rule_compiler.py
+
+import ast
+from types import CodeType
+from typing import Iterable, Optional, Set
+
+# 规则条件的原生编译：
+# 规则语言的常用子集 (读取比赛/选手的数据字段、比较、布尔运算、算术、白名单方法调用、列表/集合推导式)
+# 经白名单校验后直接编译为 Python 字节码，以原生速度执行，不再由 asteval 逐个节点解释。
+# 子集之外的表达式返回 None，由调用方继续使用 asteval 解释执行；子集不超出 asteval 支持的语法，
+# 因此关闭原生编译时所有规则仍然可以执行。
+# 原生执行无法中途打断，耗时没有上界的表达式 (嵌套过深的推导式、序列重复、字符串格式化) 也不编译，
+# 交给带执行预算的 asteval 解释器，超出预算时可以及时中止。
+# 属性只能是白名单中的数据字段，或者被直接调用的白名单方法；函数和方法不能作为值传递
+# (例如 sorted(..., key=game_state.players.remove)、key='...'.format)，否则原生执行可以调用任意方法。
+# 乘法与取模只有在两个操作数都能确定是数值时才编译：字段的类型在编译时无法得知，
+# 'x' * n、p.name * n、'%0999999999d' % n 这样的表达式结果大小取决于运行时的数值。
+
+# 规则中可以直接调用的内置函数
+NATIVE_FUNCTIONS = {
+    "len": len, "min": min, "max": max, "abs": abs, "sum": sum,
+    "any": any, "all": all, "sorted": sorted, "round": round,
+}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot,
+    ast.IfExp, ast.Constant, ast.Name, ast.Load, ast.Store, ast.Attribute, ast.Call, ast.keyword,
+    ast.Subscript, ast.Slice, ast.Tuple, ast.List, ast.ListComp, ast.SetComp, ast.comprehension,
+) + ((ast.Index,) if hasattr(ast, "Index") else ())  # Python 3.8 的下标包装节点
+
+_CONSTANT_TYPES = (str, int, float, bool, type(None))
+
+# 推导式的循环最多嵌套两层 (遍历选手两两组合)，更深的嵌套耗时随选手数的高次方增长
+MAX_NATIVE_LOOP_DEPTH = 2
+
+# 取值一定是数值的字段、内置函数和 GameState 方法
+NUMERIC_ATTRIBUTES = {"round_number", "rank", "total_score"}
+NUMERIC_FUNCTIONS = {"len", "abs", "round"}
+NUMERIC_METHODS = {"get_team_total"}
+
+# 以可调用对象为取值的关键字参数 (sorted/min/max 的 key)
+_CALLABLE_KEYWORDS = {"key"}
+
+# 操作数为序列或字符串时耗时没有上界的运算
+_UNBOUNDED_OPS = (ast.Mult, ast.Mod)
+
+
+def _bound_names(tree: ast.AST) -> Set[str]:
+    """推导式中绑定的循环变量"""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.comprehension):
+            for target in ast.walk(node.target):
+                if isinstance(target, ast.Name):
+                    names.add(target.id)
+    return names
+
+
+def _loop_depth(node: ast.AST) -> int:
+    """推导式循环的最大嵌套层数 (保守估计：推导式中任何位置的推导式都算作内层)"""
+    inner = max((_loop_depth(child) for child in ast.iter_child_nodes(node)), default=0)
+    if isinstance(node, (ast.ListComp, ast.SetComp)):
+        return len(node.generators) + inner
+    return inner
+
+
+def _is_numeric(node: ast.AST) -> bool:
+    """能否在编译时确定表达式的取值是数值 (不能确定的一律按非数值处理)"""
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, (int, float))
+    if isinstance(node, ast.Attribute):
+        return node.attr in NUMERIC_ATTRIBUTES
+    if isinstance(node, ast.Call):
+        func = node.func
+        if isinstance(func, ast.Name):
+            return func.id in NUMERIC_FUNCTIONS
+        return isinstance(func, ast.Attribute) and func.attr in NUMERIC_METHODS
+    if isinstance(node, ast.UnaryOp):
+        return isinstance(node.op, (ast.USub, ast.UAdd)) and _is_numeric(node.operand)
+    if isinstance(node, ast.BinOp):
+        return _is_numeric(node.left) and _is_numeric(node.right)
+    if isinstance(node, ast.IfExp):
+        return _is_numeric(node.body) and _is_numeric(node.orelse)
+    return False
+
+
+def is_native_subset(expression: ast.AST, allowed_methods: Iterable[str], allowed_fields: Iterable[str]) -> bool:
+    """检查表达式是否完全落在可原生编译的子集内"""
+    allowed_methods, allowed_fields = set(allowed_methods), set(allowed_fields)
+    names = {"game_state"} | set(NATIVE_FUNCTIONS) | _bound_names(expression)
+    # 处于调用位置的函数/方法 (只有这些位置可以出现函数名和方法名)
+    callees = {id(node.func) for node in ast.walk(expression) if isinstance(node, ast.Call)}
+    for node in ast.walk(expression):
+        if not isinstance(node, _ALLOWED_NODES):
+            return False
+        if isinstance(node, ast.Name):
+            if node.id.startswith("_") or node.id not in names:
+                return False
+            if node.id in NATIVE_FUNCTIONS and id(node) not in callees:
+                return False
+        elif isinstance(node, ast.Attribute):
+            # 只允许读取数据字段或调用白名单方法，杜绝 __class__ / __globals__ 之类的逃逸和任意方法调用
+            if id(node) in callees:
+                if node.attr not in allowed_methods:
+                    return False
+            elif node.attr not in allowed_fields:
+                return False
+        elif isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Name):
+                if func.id not in NATIVE_FUNCTIONS:
+                    return False
+            elif not isinstance(func, ast.Attribute):
+                return False
+            if any(keyword.arg is None or keyword.arg in _CALLABLE_KEYWORDS for keyword in node.keywords):
+                return False  # 不允许 **kwargs 和 key=
+        elif isinstance(node, ast.Constant):
+            if not isinstance(node.value, _CONSTANT_TYPES):
+                return False
+        elif isinstance(node, ast.comprehension):
+            if node.is_async:
+                return False
+        elif isinstance(node, ast.BinOp):
+            if isinstance(node.op, _UNBOUNDED_OPS) and not (_is_numeric(node.left) and _is_numeric(node.right)):
+                return False
+    return _loop_depth(expression) <= MAX_NATIVE_LOOP_DEPTH
+
+
+def compile_native(tree: ast.Module, allowed_methods: Iterable[str],
+                   allowed_fields: Iterable[str]) -> Optional[CodeType]:
+    """
+    将 asteval 解析得到的单表达式AST编译为字节码；不在子集内时返回 None。
+    :param allowed_methods: 可以调用的方法名
+    :param allowed_fields: 可以读取的数据字段名
+    执行时以 native_globals() 作为全局命名空间，并把 game_state 放入其中
+    (推导式内部只能看到全局命名空间，因此不能通过局部命名空间传入)。
+    """
+    if len(tree.body) != 1 or not isinstance(tree.body[0], ast.Expr):
+        return None
+    expression = ast.Expression(body=tree.body[0].value)
+    if not is_native_subset(expression, allowed_methods, allowed_fields):
+        return None
+    try:
+        return compile(expression, "<rule>", "eval")
+    except (SyntaxError, ValueError, TypeError):
+        return None
+
+
+def native_globals() -> dict:
+    """原生执行时的全局命名空间：没有任何内置函数，只有白名单中的函数"""
+    return {"__builtins__": {}, **NATIVE_FUNCTIONS}
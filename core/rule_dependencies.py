@@ -0,0 +1,173 @@
+# 文件名: core/rule_dependencies.py
+
+import ast
+from operator import attrgetter
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from core.rule_compiler import NATIVE_FUNCTIONS
+
+# 规则条件的依赖分析：
+# 找出一个条件读取了比赛状态的哪些输入，输入用 (类别, 名称) 表示：
+#   ("game", "round_number")   GameState 的标量字段 (trigger/round_number/mode)
+#   ("player", "total_score")  所有选手的某个字段 (按 players 列表顺序)
+#   ("players", "count")       选手人数
+# 只有这些输入的取值都没变时，条件的结果才能直接复用。
+# 分析是保守的：选手对象被整体使用 (比较、作为返回值等) 时依赖全部选手字段；
+# 无法确定读取了什么 (未知的属性、直接使用 game_state 本身等) 时返回 None，表示每次都要重新求值。
+# 只对通过原生子集校验的条件做分析，这些条件没有副作用、结果只取决于 game_state。
+# 分析本身也不依赖这一前提：调用白名单内置函数和 GameState 查询方法之外的函数、或带关键字参数的调用
+# 都可能有副作用，一律视为无法确定。
+
+Input = Tuple[str, str]
+
+PLAYER_COUNT = ("players", "count")
+
+
+class _Unknown(Exception):
+    """条件读取了无法追踪的输入"""
+
+
+class _InputCollector:
+    def __init__(self, expression: ast.AST, game_fields: Iterable[str], player_fields: Iterable[str],
+                 method_inputs: Dict[str, Tuple[Tuple[str, ...], str]]):
+        self.game_fields = set(game_fields)
+        self.player_fields = tuple(player_fields)
+        # 方法名 -> (读取的选手字段, 返回值类型 'player' / 'players' / 'value')
+        self.method_inputs = method_inputs
+        self.inputs: Set[Input] = set()
+        self.parents: Dict[ast.AST, ast.AST] = {}
+        for node in ast.walk(expression):
+            for child in ast.iter_child_nodes(node):
+                self.parents[child] = node
+        self.player_names = self._player_names(expression)
+
+    def _player_names(self, expression: ast.AST) -> Set[str]:
+        """遍历选手集合的推导式所绑定的循环变量 (同名变量还绑定了其他值时无法区分)"""
+        player_names, other_names = set(), set()
+        for node in ast.walk(expression):
+            if not isinstance(node, ast.comprehension):
+                continue
+            targets = {t.id for t in ast.walk(node.target) if isinstance(t, ast.Name)}
+            if self._is_players(node.iter):
+                if not isinstance(node.target, ast.Name):
+                    raise _Unknown()
+                player_names |= targets
+            else:
+                other_names |= targets
+        if player_names & other_names:
+            raise _Unknown()
+        return player_names
+
+    @staticmethod
+    def _is_game_state(node: ast.AST) -> bool:
+        return isinstance(node, ast.Name) and node.id == "game_state"
+
+    def _method_result(self, node: ast.AST) -> Optional[str]:
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and self._is_game_state(node.func.value) and node.func.attr in self.method_inputs):
+            return self.method_inputs[node.func.attr][1]
+        return None
+
+    def _is_players(self, node: ast.AST) -> bool:
+        """node 的值是否为选手列表"""
+        if isinstance(node, ast.Attribute):
+            return self._is_game_state(node.value) and node.attr == "players"
+        if isinstance(node, ast.Subscript):
+            return isinstance(node.slice, ast.Slice) and self._is_players(node.value)
+        return self._method_result(node) == "players"
+
+    def _is_player(self, node: ast.AST) -> bool:
+        """node 的值是否为单个选手对象"""
+        if isinstance(node, ast.Name):
+            return isinstance(node.ctx, ast.Load) and node.id in self.player_names
+        if isinstance(node, ast.Subscript):
+            return not isinstance(node.slice, ast.Slice) and self._is_players(node.value)
+        return self._method_result(node) == "player"
+
+    def _use_all_player_fields(self):
+        self.inputs.update(("player", name) for name in self.player_fields)
+        self.inputs.add(PLAYER_COUNT)
+
+    def _is_len_argument(self, node: ast.AST) -> bool:
+        parent = self.parents.get(node)
+        return (isinstance(parent, ast.Call) and isinstance(parent.func, ast.Name) and parent.func.id == "len"
+                and parent.args == [node])
+
+    def collect(self) -> FrozenSet[Input]:
+        for node in self.parents:
+            parent = self.parents[node]
+            if isinstance(node, ast.Call):
+                func = node.func
+                builtin = isinstance(func, ast.Name) and func.id in NATIVE_FUNCTIONS
+                query = (isinstance(func, ast.Attribute) and self._is_game_state(func.value)
+                         and func.attr in self.method_inputs)
+                if node.keywords or not (builtin or query):
+                    raise _Unknown()
+            if isinstance(node, ast.Name) and node.id == "game_state":
+                if not (isinstance(parent, ast.Attribute) and parent.value is node):
+                    raise _Unknown()  # game_state 本身被传递或比较
+            elif isinstance(node, ast.Attribute) and self._is_game_state(node.value):
+                if node.attr in self.game_fields:
+                    self.inputs.add(("game", node.attr))
+                elif node.attr in self.method_inputs:
+                    if not (isinstance(parent, ast.Call) and parent.func is node):
+                        raise _Unknown()
+                    self.inputs.update(("player", name) for name in self.method_inputs[node.attr][0])
+                    self.inputs.add(PLAYER_COUNT)
+                elif node.attr != "players":
+                    raise _Unknown()
+            elif isinstance(node, ast.Attribute) and self._is_player(node.value):
+                if node.attr not in self.player_fields:
+                    raise _Unknown()
+                self.inputs.add(("player", node.attr))
+
+            if self._is_players(node):
+                self.inputs.add(PLAYER_COUNT)
+                # 只用于遍历、下标或 len() 时不会读取选手的其他字段
+                used_as_iter = isinstance(parent, ast.comprehension) and parent.iter is node
+                used_as_base = isinstance(parent, ast.Subscript) and parent.value is node
+                if not (used_as_iter or used_as_base or self._is_len_argument(node)):
+                    self._use_all_player_fields()
+            elif self._is_player(node):
+                # len([p for p in ...]) 只统计个数，元素本身不会被读取
+                counted = isinstance(parent, ast.ListComp) and parent.elt is node and self._is_len_argument(parent)
+                if not ((isinstance(parent, ast.Attribute) and parent.value is node) or counted):
+                    self._use_all_player_fields()
+        return frozenset(self.inputs)
+
+
+def analyze_inputs(expression: ast.AST, game_fields: Iterable[str], player_fields: Iterable[str],
+                   method_inputs: Dict[str, Tuple[Tuple[str, ...], str]]) -> Optional[FrozenSet[Input]]:
+    """
+    返回条件读取的全部输入；无法确定时返回 None。
+    :param method_inputs: GameState 查询方法 -> (读取的选手字段, 返回值类型 'player' / 'players' / 'value')
+    """
+    try:
+        return _InputCollector(expression, game_fields, player_fields, method_inputs).collect()
+    except _Unknown:
+        return None
+
+
+def make_input_reader(inputs: Iterable[Input]) -> Callable[[object], tuple]:
+    """
+    生成读取一组输入当前取值的函数 (用 attrgetter 在C层面取值，比逐项读取快得多)。
+    返回值只用于与上次的取值比较是否相等：(GameState 字段的取值, 每名选手相关字段的取值)
+    """
+    inputs = set(inputs)
+    game_fields = sorted(name for kind, name in inputs if kind == "game")
+    player_fields = sorted(name for kind, name in inputs if kind == "player")
+    read_game = attrgetter(*game_fields) if game_fields else None
+    read_player = attrgetter(*player_fields) if player_fields else None
+    count_only = PLAYER_COUNT in inputs and read_player is None
+
+    def read(game_state) -> tuple:
+        game = read_game(game_state) if read_game is not None else None
+        if read_player is not None:
+            players = tuple(map(read_player, game_state.players))
+        elif count_only:
+            players = len(game_state.players)
+        else:
+            players = None
+        return game, players
+
+    return read
@@ -1,83 +1,819 @@
 # 文件名: core/rule_engine.py
 
+import ast
+import random
+import time
+import weakref
 from asteval import Interpreter
-from dataclasses import dataclass, field
-from typing import List, Optional
+from types import CodeType
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from core.rule_compiler import compile_native, native_globals
+from core.rule_dependencies import Input, analyze_inputs, make_input_reader
+from core.rule_vectorizer import NUMPY_AVAILABLE, StateBatch, vectorize
+
+if NUMPY_AVAILABLE:
+    import numpy as np
 
 
 # --- 定义用于承载比赛状态的数据结构 ---
+# 规则求值是热点路径：两个类都使用 __slots__ (没有逐实例的 __dict__)，
+# GameState 的按排名/ID/名称/队伍查找使用首次查询时建立的索引，之后为 O(1)。
+# 修改选手的索引字段、对 players 列表做原地增删改或重新赋值 players，都会使相关 GameState 的索引失效。
+# (Python 3.9 的 dataclass 不支持 slots=True，因此手写构造函数与比较方法，公开属性与原先的 dataclass 一致)
 
-@dataclass
 class PlayerState:
     """单个选手在某一时刻的状态"""
-    id: str
-    name: str
-    rank: int
-    total_score: int
-    is_connected: bool = True
-    team_id: Optional[str] = None
+
+    __slots__ = ("id", "name", "rank", "total_score", "is_connected", "team_id", "_owners")
+
+    # 修改这些字段会使包含该选手的所有 GameState 的索引失效
+    _INDEXED_FIELDS = frozenset(("id", "name", "rank", "total_score", "team_id"))
+    _FIELDS = ("id", "name", "rank", "total_score", "is_connected", "team_id")
+
+    def __init__(self, id: str, name: str, rank: int, total_score: int,
+                 is_connected: bool = True, team_id: Optional[str] = None):
+        # 为该选手建立过索引的 GameState：id -> 弱引用 (GameState 不可哈希，不能放进 WeakSet)；
+        # 同一个选手可以出现在多个比赛状态中
+        object.__setattr__(self, "_owners", None)
+        self.id = id
+        self.name = name
+        self.rank = rank
+        self.total_score = total_score
+        self.is_connected = is_connected
+        self.team_id = team_id
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in self._INDEXED_FIELDS:
+            owners = self._owners
+            if owners:
+                for owner in list(owners.values()):
+                    owner.invalidate_indexes()
+
+    def __reduce__(self):
+        # 序列化 (以及 copy) 时只保留公开字段，所属 GameState 的弱引用不能也不需要复制
+        return PlayerState, tuple(getattr(self, name) for name in self._FIELDS)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._FIELDS)
+        return f"PlayerState({fields})"
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self._FIELDS)
+
+    __hash__ = None  # 与 dataclass(eq=True) 一致：可变对象不可哈希
+
+
+class _PlayerList(list):
+    """GameState.players 使用的列表：原地增删改 (append/remove/切片赋值等) 时使所属 GameState 的索引失效"""
+
+    __slots__ = ("_owner",)
+
+    def __init__(self, players, owner: "GameState"):
+        super().__init__(players)
+        self._owner = owner
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def _changed(self):
+        self._owner.invalidate_indexes()
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def __iadd__(self, other):
+        super().__iadd__(other)
+        self._changed()
+        return self
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self._changed()
+        return self
+
+    def append(self, player):
+        super().append(player)
+        self._changed()
+
+    def extend(self, players):
+        super().extend(players)
+        self._changed()
+
+    def insert(self, index, player):
+        super().insert(index, player)
+        self._changed()
+
+    def remove(self, player):
+        super().remove(player)
+        self._changed()
+
+    def pop(self, index=-1):
+        player = super().pop(index)
+        self._changed()
+        return player
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        super().reverse()
+        self._changed()
 
 
-@dataclass
 class GameState:
-    """完整的比赛实时状态，将作为API暴露给规则表达式"""
-    round_number: int
-    mode: str  # 'individual' or 'team'
-    players: List[PlayerState]
-    trigger: str = 'after_round'  # 触发时机
+    """
+    完整的比赛实时状态，将作为API暴露给规则表达式。
+    与原先的 dataclass 不同，赋值给 players 的列表会被复制 (选手对象本身不复制)：
+    之后对调用方手中的原列表做的增删不会反映到 GameState 中，需要通过 game_state.players 修改，
+    或重新赋值 players。
+    """
+
+    __slots__ = ("round_number", "mode", "players", "trigger", "_index", "__weakref__")
+
+    _FIELDS = ("round_number", "mode", "players", "trigger")
+
+    def __init__(self, round_number: int, mode: str, players: List[PlayerState], trigger: str = 'after_round'):
+        object.__setattr__(self, "_index", None)
+        self.round_number = round_number
+        self.mode = mode  # 'individual' or 'team'
+        self.players = players
+        self.trigger = trigger  # 触发时机
+
+    def __setattr__(self, name, value):
+        if name == "players":
+            # 复制为 GameState 自己的列表，之后通过 game_state.players 做的原地修改也能使索引失效；
+            # 调用方手中的原列表与 GameState 不再关联 (普通列表的修改无法被感知，无法据此使索引失效)
+            value = _PlayerList(value, self)
+        object.__setattr__(self, name, value)
+        if name == "players":
+            self.invalidate_indexes()
+
+    def __reduce__(self):
+        return GameState, (self.round_number, self.mode, list(self.players), self.trigger)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._FIELDS)
+        return f"GameState({fields})"
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self._FIELDS)
 
+    __hash__ = None
+
+    # --- 索引 ---
+    def invalidate_indexes(self):
+        """
+        丢弃已建立的索引，下次查询时重建。
+        修改选手的排名/ID/名称/总分/队伍、对 players 原地增删改或重新赋值 players 时都会自动调用。
+        """
+        object.__setattr__(self, "_index", None)
+
+    def _get_index(self):
+        index = self._index
+        if index is None:
+            by_rank, by_id, by_name, by_team, team_totals = {}, {}, {}, {}, {}
+            for p in self.players:
+                # setdefault 保留第一个匹配项，与原先的线性查找结果一致
+                by_rank.setdefault(p.rank, p)
+                by_id.setdefault(p.id, p)
+                by_name.setdefault(p.name, p)
+                if p.team_id is not None:
+                    by_team.setdefault(p.team_id, []).append(p)
+                    team_totals[p.team_id] = team_totals.get(p.team_id, 0) + p.total_score
+                owners = p._owners
+                if owners is None:
+                    owners = weakref.WeakValueDictionary()
+                    object.__setattr__(p, "_owners", owners)
+                owners[id(self)] = self
+            index = (by_rank, by_id, by_name, by_team, team_totals)
+            object.__setattr__(self, "_index", index)
+        return index
+
+    # --- 规则表达式可调用的查询方法 (均为 O(1)) ---
     def get_player_by_rank(self, rank: int) -> Optional[PlayerState]:
         """根据排名获取选手对象"""
-        for p in self.players:
-            if p.rank == rank:
-                return p
-        return None
+        return self._get_index()[0].get(rank)
+
+    def get_player_by_id(self, player_id: str) -> Optional[PlayerState]:
+        """根据选手ID获取选手对象"""
+        return self._get_index()[1].get(player_id)
+
+    def get_player_by_name(self, name: str) -> Optional[PlayerState]:
+        """根据选手名称获取选手对象"""
+        return self._get_index()[2].get(name)
+
+    def get_team_players(self, team_id: str) -> List[PlayerState]:
+        """获取某个队伍的全部选手 (队伍不存在时为空列表)"""
+        return list(self._get_index()[3].get(team_id, ()))
+
+    def get_team_total(self, team_id: str) -> int:
+        """某个队伍所有选手的总分之和"""
+        return self._get_index()[4].get(team_id, 0)
+
+    def get_team_totals(self) -> Dict[str, int]:
+        """所有队伍的总分 {队伍ID: 总分}"""
+        return dict(self._get_index()[4])
+
+    def get_winning_team(self) -> Optional[str]:
+        """总分最高的队伍ID (没有队伍时为 None，并列时取先出现的队伍)"""
+        team_totals = self._get_index()[4]
+        if not team_totals:
+            return None
+        return max(team_totals, key=team_totals.get)
+
+
+# 规则中可以调用的 GameState 方法 (原生编译的白名单，只包含 get_ 开头的只读查询)
+GAME_STATE_METHODS = frozenset(name for name, value in vars(GameState).items()
+                               if callable(value) and name.startswith("get_"))
+
+# 各查询方法读取的选手字段及返回值类型，供增量求值的依赖分析使用 (新增查询方法时需要同步补充)
+GAME_STATE_METHOD_INPUTS = {
+    "get_player_by_rank": (("rank",), "player"),
+    "get_player_by_id": (("id",), "player"),
+    "get_player_by_name": (("name",), "player"),
+    "get_team_players": (("team_id",), "players"),
+    "get_team_total": (("team_id", "total_score"), "value"),
+    "get_team_totals": (("team_id", "total_score"), "value"),
+    "get_winning_team": (("team_id", "total_score"), "value"),
+}
+GAME_STATE_INPUT_FIELDS = ("round_number", "mode", "trigger")
+# 规则中可以读取的数据字段 (原生编译的白名单)
+STATE_FIELDS = frozenset(GameState._FIELDS) | frozenset(PlayerState._FIELDS)
+
+
+_UNREAD = object()
+
+
+# 没有规则匹配时使用的动作
+DEFAULT_ACTION = {"type": "default", "message": "无匹配规则，由管理员选图"}
+
+
+class RuleCompileError(ValueError):
+    """规则条件表达式无法解析或包含解释器不支持的语法 (或规则集本身的结构不正确)"""
+
+
+class RuleStats:
+    """单个条件的求值统计 (耗时单位为秒)"""
+
+    __slots__ = ("calls", "total_time", "max_time", "errors", "budget_exceeded")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.errors = 0
+        self.budget_exceeded = 0
+
+    def add(self, elapsed: float, outcome: Optional[str], weight: int = 1):
+        """记录一次求值；抽样记录时一次被抽到的求值代表 weight 次求值"""
+        self.calls += weight
+        self.total_time += elapsed * weight
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        if outcome == "error":
+            self.errors += 1
+        elif outcome == "budget":
+            self.budget_exceeded += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "total_time": self.total_time,
+            "mean_time": self.total_time / self.calls if self.calls else 0.0,
+            "max_time": self.max_time,
+            "errors": self.errors,
+            "budget_exceeded": self.budget_exceeded,
+        }
+
+
+class CompiledCondition:
+    """
+    一个已编译的条件：asteval 的AST，以及 (落在原生子集内时) 对应的字节码和读取的输入。
+    inputs 为 None 时无法确定条件依赖哪些输入，每次都要重新求值。
+    read_inputs 读取这些输入的当前取值，读取相同输入的条件共用同一个函数。
+    stats 为该条件的求值统计 (与 RuleEngine 中按条件文本登记的是同一个对象，求值时不必再按文本查找)。
+    """
+
+    __slots__ = ("source", "tree", "native", "inputs", "read_inputs", "stats")
+
+    def __init__(self, source: str, tree: ast.AST, native: Optional[CodeType],
+                 inputs: Optional[Tuple[Input, ...]] = None, read_inputs: Optional[Callable] = None,
+                 stats: Optional[RuleStats] = None):
+        self.source = source
+        self.tree = tree
+        self.native = native
+        self.inputs = inputs
+        self.read_inputs = read_inputs
+        self.stats = stats
+
+
+class CompiledRuleset(dict):
+    """
+    已校验并编译的规则集 (由 RuleEngine.precompile_ruleset 生成)：本身就是规则集字典，额外携带编译结果，
+    求值时直接使用，不再检查规则是否被修改，因此应当视为只读；修改规则集请另存为新版本。
+    ruleset_id / version 为数据库中的规则集ID和版本号 (未保存的规则集为 None)。
+    """
+
+    __slots__ = ("compiled", "ruleset_id", "version")
 
-    # 未来可以添加更多便捷方法，如 get_winning_team(), get_player_by_name() 等
+    def __init__(self, ruleset: dict, compiled: List[Tuple[dict, Optional[CompiledCondition]]],
+                 ruleset_id: Optional[int] = None, version: Optional[int] = None):
+        super().__init__(ruleset)
+        self.compiled = compiled
+        self.ruleset_id = ruleset_id
+        self.version = version
+
+    def __reduce__(self):
+        # 字节码不能序列化：传给其他进程时只传规则集本身，由对方重新编译
+        return dict, (dict(self),)
+
+
+class RuleBudgetExceeded(RuntimeError):
+    """单次条件求值超出了步数或时间预算"""
+
+
+class _BudgetedInterpreter(Interpreter):
+    """
+    带执行预算的 asteval 解释器：每执行一个AST节点计一步，步数或耗时超出预算时中止本次求值。
+    asteval 会把 run() 中抛出的异常逐层记录为求值错误并向上传递，因此中止后不会继续执行剩余的节点。
+    """
+
+    # 每执行这么多个节点检查一次时钟
+    CLOCK_INTERVAL = 64
+
+    def __init__(self):
+        super().__init__()
+        self._steps_left: Optional[int] = None
+        self._deadline: Optional[float] = None
+        self._clock = 0
+        self.budget_exceeded: Optional[str] = None
+
+    def start_budget(self, max_steps: Optional[int], max_time: Optional[float]):
+        """为下一次求值设置预算 (None 表示不限制)"""
+        self._steps_left = max_steps
+        self._deadline = time.perf_counter() + max_time if max_time else None
+        self._clock = 0
+        self.budget_exceeded = None
+
+    def run(self, node, expr=None, lineno=None, with_raise=True):
+        if self._steps_left is not None:
+            self._steps_left -= 1
+            if self._steps_left < 0:
+                self._exceed(node, "执行步数超出预算")
+        if self._deadline is not None:
+            self._clock += 1
+            if self._clock % self.CLOCK_INTERVAL == 0 and time.perf_counter() > self._deadline:
+                self._exceed(node, "执行时间超出预算")
+        return super().run(node, expr=expr, lineno=lineno, with_raise=with_raise)
+
+    def _exceed(self, node, message: str):
+        self.budget_exceeded = message
+        self.raise_exception(node, exc=RuleBudgetExceeded, msg=message)
+
+
+class _EvaluationContext:
+    """一次求值独占的执行环境：asteval 解释器及原生执行用的全局命名空间 (二者都会写入 game_state)"""
+
+    __slots__ = ("interp", "native_globals")
+
+    def __init__(self):
+        # 创建一个安全的ASTEVAL解释器实例
+        self.interp = _BudgetedInterpreter()
+        self.native_globals = native_globals()
 
 
 class RuleEngine:
     _instance = None
+    # 池中最多保留的空闲执行环境数，超出部分用完即丢弃
+    MAX_POOLED_CONTEXTS = 16
+    # 抽样统计时建议的间隔：每 16 次正常求值记录 1 次 (按 16 次计入)
+    PROFILE_SAMPLE_EVERY = 16
+    # 单次条件求值的默认预算：正常的条件只需执行几百个节点、耗时不到1毫秒
+    DEFAULT_MAX_STEPS = 100_000
+    DEFAULT_MAX_TIME = 0.1
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(RuleEngine, cls).__new__(cls)
-            # 创建一个安全的ASTEVAL解释器实例
-            cls._instance.interp = Interpreter()
+            # RuleEngine 是单例，桌面线程、Web线程池和并行模拟可能同时求值。
+            # 解释器的符号表和原生执行的全局命名空间都会写入本次的 game_state，不能共享，
+            # 因此每次求值从池中借出一个独占的执行环境，用完归还；
+            # list.pop/append 在 GIL 下是原子操作，借还不需要加锁。
+            cls._instance._contexts: List[_EvaluationContext] = []
+            # 原生编译开关：关闭后所有条件都由 asteval 解释执行
+            cls._instance.native_enabled = True
+            # 表达式文本 -> (字节码, 读取的输入)
+            cls._instance._native_cache: Dict[str, Tuple[Optional[CodeType], Optional[Tuple[Input, ...]]]] = {}
+            # 增量求值：条件文本 -> (上次求值时各输入的取值, 结果)；输入取值不变时直接复用结果。
+            # 多线程同时求值时各自写入完整的元组，最坏情况只是多求值一次；命中/未命中计数只用于观测，不加锁
+            cls._instance.incremental_enabled = True
+            # 一组输入 -> 读取函数
+            cls._instance._input_readers: Dict[Tuple[Input, ...], Callable] = {}
+            cls._instance._result_cache: Dict[str, Tuple[tuple, bool]] = {}
+            # 批量求值：条件文本 -> 向量化后的函数 (不可向量化时为 None)
+            cls._instance._vector_cache: Dict[str, Optional[Callable]] = {}
+            cls._instance.result_hits = 0
+            cls._instance.result_misses = 0
+            # 条件表达式只解析一次：表达式文本 -> 已校验的AST (编译失败时为 RuleCompileError)
+            cls._instance._expression_cache: Dict[str, Union[ast.AST, RuleCompileError]] = {}
+            # 条件文本 -> 已编译的条件 (编译失败时为 None)。只缓存条件本身，规则 (动作等) 每次取自调用方的规则集，
+            # 条件相同而动作不同的规则集不会互相串用
+            cls._instance._condition_cache: Dict[str, Optional[CompiledCondition]] = {}
+            # 执行预算：asteval 解释执行的条件超出步数或时间时中止并按不满足处理 (None 表示不限制)
+            cls._instance.max_steps = cls.DEFAULT_MAX_STEPS
+            cls._instance.max_time = cls.DEFAULT_MAX_TIME
+            # 逐条件的求值统计：条件文本 -> RuleStats (与命中计数一样只用于观测，不加锁)。
+            # 默认关闭，排查慢规则时通过 set_profiling_enabled 开启。开启后默认逐次记录；
+            # 求值量很大时可以改为抽样记录正常的求值，抽样使用独立的随机数生成器，不影响全局的 random
+            cls._instance.profiling_enabled = False
+            cls._instance.profile_sample_every = 1
+            # 求值时只读取这一个属性：关闭统计时为 0，否则为抽样间隔
+            cls._instance._profile_every = 0
+            cls._instance._profile_random = random.Random().random
+            cls._instance._rule_stats: Dict[str, RuleStats] = {}
         return cls._instance
 
-    def _evaluate_expression(self, expression_str: str, game_state: GameState) -> bool:
+    def _acquire_context(self) -> _EvaluationContext:
+        try:
+            return self._contexts.pop()
+        except IndexError:
+            return _EvaluationContext()
+
+    def _release_context(self, context: _EvaluationContext):
+        context.native_globals.pop('game_state', None)
+        context.interp.symtable.pop('game_state', None)
+        if len(self._contexts) < self.MAX_POOLED_CONTEXTS:
+            self._contexts.append(context)
+
+    def compile_expression(self, expression_str: str) -> ast.AST:
         """
-        在安全环境中执行单个条件表达式。
+        解析并校验一个条件表达式，返回可直接交给解释器执行的AST (结果会被缓存)。
+        表达式必须是单个表达式，且只能使用解释器支持的语法，否则抛出 RuleCompileError。
         """
-        # 将 game_state 对象注入到解释器的"符号表"中
-        # 这样表达式字符串中就可以直接使用 'game_state' 这个变量了
-        self.interp.symtable['game_state'] = game_state
+        cached = self._expression_cache.get(expression_str)
+        if cached is None:
+            cached = self._expression_cache[expression_str] = self._compile(expression_str)
+        if isinstance(cached, RuleCompileError):
+            raise cached
+        return cached
+
+    def _compile(self, expression_str: str) -> Union[ast.AST, RuleCompileError]:
+        context = self._acquire_context()
+        interp = context.interp
         try:
-            result = self.interp.eval(expression_str)
-            return bool(result)
-        except Exception as e:
-            print(f"错误: 规则表达式 '{expression_str}' 执行失败: {e}")
-            return False
+            interp.error = []
+            try:
+                tree = interp.parse(expression_str)
+            except Exception as e:
+                detail = interp.error[-1].get_error()[1] if interp.error else str(e)
+                return RuleCompileError(f"规则表达式 '{expression_str}' 无法解析: {detail}")
+            if len(tree.body) != 1 or not isinstance(tree.body[0], ast.Expr):
+                return RuleCompileError(f"规则表达式 '{expression_str}' 必须是单个表达式")
+            for node in ast.walk(tree):
+                if isinstance(node, (ast.stmt, ast.expr)) and type(node).__name__.lower() not in interp.node_handlers:
+                    return RuleCompileError(f"规则表达式 '{expression_str}' 使用了不支持的语法: {type(node).__name__}")
+            return tree
+        finally:
+            interp.error = []
+            self._release_context(context)
 
-    def get_next_action(self, ruleset: dict, game_state: GameState):
+    def compile_condition(self, expression_str: str) -> CompiledCondition:
+        """编译条件：先校验并解析为AST，再尝试原生编译 (不在子集内时只保留AST，由 asteval 执行)"""
+        tree = self.compile_expression(expression_str)
+        try:
+            native, inputs = self._native_cache[expression_str]
+        except KeyError:
+            native = compile_native(tree, GAME_STATE_METHODS, STATE_FIELDS)
+            inputs = None
+            if native is not None:
+                # 只有原生子集内的条件是无副作用的纯表达式，可以按输入复用结果
+                found = analyze_inputs(tree, GAME_STATE_INPUT_FIELDS, PlayerState._FIELDS, GAME_STATE_METHOD_INPUTS)
+                inputs = tuple(sorted(found)) if found is not None else None
+            self._native_cache[expression_str] = (native, inputs)
+        read_inputs = None
+        if inputs is not None:
+            read_inputs = self._input_readers.get(inputs)
+            if read_inputs is None:
+                read_inputs = self._input_readers[inputs] = make_input_reader(inputs)
+        return CompiledCondition(expression_str, tree, native, inputs, read_inputs, self._stats_for(expression_str))
+
+    def set_native_enabled(self, enabled: bool):
+        """开启或关闭原生编译 (已编译的条件会被清空)"""
+        self.native_enabled = enabled
+        self._condition_cache.clear()
+
+    def set_incremental_enabled(self, enabled: bool):
+        """开启或关闭增量求值 (已缓存的条件结果会被清空)"""
+        self.incremental_enabled = enabled
+        self._result_cache.clear()
+
+    def get_evaluation_stats(self) -> Dict[str, int]:
+        """增量求值的命中 (复用上次结果) 与未命中 (实际求值) 次数"""
+        return {"hits": self.result_hits, "misses": self.result_misses}
+
+    def reset_evaluation_stats(self):
+        self.result_hits = 0
+        self.result_misses = 0
+
+    def set_budget(self, max_steps: Optional[int] = DEFAULT_MAX_STEPS, max_time: Optional[float] = DEFAULT_MAX_TIME):
         """
-        遍历规则集，找到第一个满足条件的规则，并返回其动作。
-        这是对外暴露的主接口。
+        设置单次条件求值的预算，超出时本次求值中止并按条件不满足处理。
+        :param max_steps: asteval 最多执行的AST节点数，None 表示不限制
+        :param max_time: 最长执行时间 (秒)，None 表示不限制
+        原生执行的条件无法中途打断，只统计超时次数；耗时没有上界的条件不会被原生编译。
+        """
+        self.max_steps = max_steps
+        self.max_time = max_time
+
+    def set_profiling_enabled(self, enabled: bool, sample_every: int = 1):
+        """
+        开启或关闭逐条件的求值统计 (默认关闭；关闭时已有的统计保留，直到 reset_rule_stats)。
+        :param sample_every: 正常的求值每多少次随机抽样记录一次 (例如 PROFILE_SAMPLE_EVERY)；
+                             默认 1 表示逐次记录，调用次数、耗时和最大耗时都是精确值
         """
-        rules = ruleset.get("map_selection_rules", [])
+        if sample_every < 1:
+            raise ValueError("sample_every 必须是正整数。")
+        self.profile_sample_every = int(sample_every)
+        self.profiling_enabled = enabled
+        self._profile_every = self.profile_sample_every if enabled else 0
+
+    def get_rule_stats(self) -> Dict[str, dict]:
+        """
+        逐条件的求值统计：条件文本 -> {calls, total_time, mean_time, max_time, errors, budget_exceeded}
+        只统计开启统计期间实际执行的求值，增量求值复用结果和批量求值的向量化执行不计入。
+        抽样记录 (sample_every > 1) 时 calls 和 total_time 是估计值，max_time 只取自被抽到的求值；
+        errors 和 budget_exceeded 总是精确值。
+        """
+        return {source: stats.as_dict() for source, stats in list(self._rule_stats.items()) if stats.calls}
+
+    def reset_rule_stats(self):
+        # 原地清零：已编译的条件持有各自的统计对象
+        for stats in list(self._rule_stats.values()):
+            stats.reset()
 
-        for rule in rules:
+    def format_rule_report(self, ruleset: Optional[dict] = None, limit: Optional[int] = 20) -> str:
+        """
+        按累计耗时从高到低列出各条件的求值统计。
+        :param ruleset: 给出时用规则的说明 (comment) 代替条件文本，并只列出该规则集中的条件
+        :param limit: 最多列出的条目数，None 表示全部
+        """
+        stats = self.get_rule_stats()
+        labels = {source: source for source in stats}
+        if ruleset is not None:
+            labels = {}
+            for rule in ruleset.get("map_selection_rules", []):
+                source = rule.get("condition")
+                if source in stats:
+                    labels.setdefault(source, rule.get("comment") or source)
+        rows = sorted(labels, key=lambda source: stats[source]["total_time"], reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+        lines = [f"{'调用':>8} {'累计(ms)':>10} {'平均(us)':>10} {'最大(ms)':>10} {'错误':>6} {'超预算':>6}  规则"]
+        for source in rows:
+            s = stats[source]
+            label = labels[source]
+            if len(label) > 60:
+                label = label[:57] + "..."
+            lines.append(f"{s['calls']:>8} {s['total_time'] * 1e3:>10.2f} {s['mean_time'] * 1e6:>10.1f} "
+                         f"{s['max_time'] * 1e3:>10.2f} {s['errors']:>6} {s['budget_exceeded']:>6}  {label}")
+        if not rows:
+            lines.append("(暂无求值记录)")
+        return "\n".join(lines)
+
+    def _stats_for(self, source: str) -> RuleStats:
+        stats = self._rule_stats.get(source)
+        if stats is None:
+            stats = self._rule_stats.setdefault(source, RuleStats())
+        return stats
+
+    def compile_ruleset(self, ruleset: dict) -> List[Tuple[dict, Optional[CompiledCondition]]]:
+        """
+        编译规则集中的全部条件，返回 [(规则, 已编译的条件)]；没有条件的规则被跳过，编译失败的规则为 None。
+        已编译的条件按条件文本缓存，规则本身总是取自传入的规则集，规则被修改后也会使用新的条件。
+        CompiledRuleset 直接返回其携带的编译结果。
+        """
+        if isinstance(ruleset, CompiledRuleset):
+            return ruleset.compiled
+        compiled = []
+        for rule in ruleset.get("map_selection_rules", []):
             condition = rule.get("condition")
             if not condition:
                 continue
+            node = self._condition_cache.get(condition, _UNREAD)
+            if node is _UNREAD:
+                # 多个线程可能同时编译同一个条件，结果相同，后写入的覆盖先写入的即可
+                try:
+                    node = self.compile_condition(condition)
+                except RuleCompileError as e:
+                    print(f"错误: {e}，该规则将被忽略。")
+                    node = None
+                self._condition_cache[condition] = node
+            compiled.append((rule, node))
+        return compiled
+
+    def precompile_ruleset(self, ruleset: dict, strict: bool = True, ruleset_id: Optional[int] = None,
+                           version: Optional[int] = None) -> CompiledRuleset:
+        """
+        校验并编译规则集，返回可直接用于求值的 CompiledRuleset。
+        :param strict: 为 True 时规则集结构不正确或任何条件无法编译都抛出 RuleCompileError；
+                       为 False 时与 compile_ruleset 一样忽略无法编译的规则
+        """
+        if strict:
+            rules = ruleset.get("map_selection_rules") if isinstance(ruleset, dict) else None
+            if not isinstance(rules, list):
+                raise RuleCompileError("规则集必须包含 map_selection_rules 列表")
+            for i, rule in enumerate(rules, 1):
+                if not isinstance(rule, dict) or "action" not in rule:
+                    raise RuleCompileError(f"第 {i} 条规则必须是包含 action 的对象")
+                condition = rule.get("condition")
+                if condition is not None and not isinstance(condition, str):
+                    raise RuleCompileError(f"第 {i} 条规则的 condition 必须是字符串")
+                if condition:
+                    try:
+                        self.compile_condition(condition)
+                    except RuleCompileError as e:
+                        raise RuleCompileError(f"第 {i} 条规则 ({rule.get('comment', '无注释')}): {e}") from e
+        return CompiledRuleset(ruleset, self.compile_ruleset(ruleset), ruleset_id, version)
+
+    def _evaluate_expression(self, expression: Union[str, ast.AST, CompiledCondition], game_state: GameState) -> bool:
+        """
+        在安全环境中执行单个条件表达式 (表达式文本、compile_expression 返回的AST 或已编译的条件)。
+        执行出错或超出预算时按不满足处理。可在多个线程中同时调用。
+        """
+        native = stats = None
+        if isinstance(expression, CompiledCondition):
+            source, tree, stats = expression.source, expression.tree, expression.stats
+            if self.native_enabled:
+                native = expression.native
+        elif isinstance(expression, str):
+            source = expression
+            try:
+                tree = self.compile_expression(expression)
+            except RuleCompileError as e:
+                print(f"错误: {e}")
+                if self.profiling_enabled:
+                    self._stats_for(source).add(0.0, "error")
+                return False
+        else:
+            source, tree = ast.unparse(expression), expression
+
+        context = self._acquire_context()
+        outcome = None
+        start = time.perf_counter()
+        try:
+            if native is not None:
+                context.native_globals['game_state'] = game_state
+                result = bool(eval(native, context.native_globals))
+            else:
+                # 将 game_state 对象注入到解释器的"符号表"中
+                # 这样表达式字符串中就可以直接使用 'game_state' 这个变量了
+                interp = context.interp
+                interp.symtable['game_state'] = game_state
+                interp.start_budget(self.max_steps, self.max_time)
+                value = interp.eval(tree, show_errors=False)
+                if interp.budget_exceeded is not None:
+                    print(f"错误: 规则表达式 '{source}' {interp.budget_exceeded}，已中止。")
+                    result, outcome = False, "budget"
+                elif interp.error:
+                    error = interp.error[0]  # 最先记录的是原始异常，之后的是逐层向上传递时的记录
+                    print(f"错误: 规则表达式 '{source}' 执行失败: {error.exc.__name__}: {error.msg}")
+                    result, outcome = False, "error"
+                else:
+                    result = bool(value)
+        except Exception as e:
+            print(f"错误: 规则表达式 '{source}' 执行失败: {e}")
+            result, outcome = False, "error"
+        finally:
+            elapsed = time.perf_counter() - start
+            # 中途出错的 asteval 解释器可能残留推导式的循环变量，不放回池中
+            if outcome is None or native is not None:
+                self._release_context(context)
+        if native is not None and outcome is None and self.max_time and elapsed > self.max_time:
+            # 原生执行无法中途打断，只能事后记录
+            print(f"警告: 规则表达式 '{source}' 执行耗时 {elapsed * 1e3:.1f}ms，超出预算。")
+            outcome = "budget"
+        every = self._profile_every
+        if every:
+            # 抽样记录时出错和超出预算的求值总是记录，被抽到的正常求值按 every 次计入
+            if every == 1 and outcome is None and stats is not None:
+                # 逐次记录的常见情况 (已编译的条件正常求值) 直接累加，省去方法调用
+                stats.calls += 1
+                stats.total_time += elapsed
+                if elapsed > stats.max_time:
+                    stats.max_time = elapsed
+            elif every == 1 or outcome is not None or self._profile_random() * every < 1:
+                (stats or self._stats_for(source)).add(elapsed, outcome, 1 if outcome is not None else every)
+        return result
+
+    def _evaluate_incremental(self, condition: CompiledCondition, game_state: GameState, values: dict) -> bool:
+        """
+        条件的全部输入与上次求值时相同则直接复用上次的结果，否则重新求值。
+        :param values: 本轮决策中已读取的输入取值 (读取函数 -> 取值)，读取相同输入的规则只读取一次
+        """
+        read_inputs = condition.read_inputs
+        if read_inputs is None or not self.incremental_enabled:
+            self.result_misses += 1
+            return self._evaluate_expression(condition, game_state)
+        current = values.get(read_inputs, _UNREAD)
+        if current is _UNREAD:
+            current = values[read_inputs] = read_inputs(game_state)
+        cached = self._result_cache.get(condition.source)
+        if cached is not None and cached[0] == current:
+            self.result_hits += 1
+            return cached[1]
+        self.result_misses += 1
+        result = self._evaluate_expression(condition, game_state)
+        self._result_cache[condition.source] = (current, result)
+        return result
+
+    def match_rule(self, ruleset: dict, game_state: GameState) -> Optional[dict]:
+        """
+        返回规则集中第一个条件成立的规则 (规则集中的原字典)，都不成立时返回 None。不输出任何信息。
+        比赛状态变化后，只有读取了变化部分的条件会被重新求值，其余条件复用上次的结果。
+        """
+        values = {}
+        for rule, node in self.compile_ruleset(ruleset):
+            if node is None:
+                continue
+            if self._evaluate_incremental(node, game_state, values):
+                return rule
+        return None
+
+    def _vectorized(self, condition: CompiledCondition) -> Optional[Callable]:
+        try:
+            return self._vector_cache[condition.source]
+        except KeyError:
+            # 只有原生子集内 (无副作用) 的条件才尝试向量化
+            vectorized = vectorize(condition.tree) if condition.native is not None else None
+            self._vector_cache[condition.source] = vectorized
+            return vectorized
 
-            if self._evaluate_expression(condition, game_state):
-                # 找到第一个满足条件的规则，立即返回其动作
-                print(f"规则匹配成功: {rule.get('comment', '无注释')}")
+    def evaluate_batch(self, ruleset: dict, states: Union[Sequence[GameState], StateBatch]) -> "np.ndarray":
+        """
+        对一批比赛状态求值同一个规则集，返回每个状态第一个条件成立的规则在规则集中的序号 (都不成立时为 -1)。
+        可向量化的条件一次性对所有尚未匹配的状态求值；其余条件 (或向量化求值出错时) 逐个状态求值。
+        :param states: GameState 列表，或已按列存放的 StateBatch
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("NumPy 未安装，无法批量求值规则。")
+        if len(states) == 0:
+            return np.full(0, -1, dtype=np.int64)
+        batch = states if isinstance(states, StateBatch) else StateBatch.from_states(states)
+        result = np.full(len(batch), -1, dtype=np.int64)
+        # 规则在规则集中的序号 (compile_ruleset 返回的就是规则集中的规则对象)
+        positions = {id(rule): i for i, rule in enumerate(ruleset.get("map_selection_rules", []))}
+        pending = np.ones(len(batch), dtype=bool)
+        for rule, condition in self.compile_ruleset(ruleset):
+            if condition is None:
+                continue
+            vectorized = self._vectorized(condition)
+            matched = None
+            if vectorized is not None:
+                try:
+                    matched = vectorized(batch) & pending
+                except Exception:
+                    matched = None  # 例如不同类型之间的比较，交给逐个求值按原语义处理
+            if matched is None:
+                matched = np.zeros(len(batch), dtype=bool)
+                for row in np.flatnonzero(pending):
+                    matched[row] = self._evaluate_expression(condition, batch.game_state(row))
+            result[matched] = positions[id(rule)]
+            pending &= ~matched
+            if not pending.any():
+                break
+        return result
+
+    def get_next_action(self, ruleset: dict, game_state: GameState):
+        """
+        遍历规则集，找到第一个满足条件的规则，并返回其动作。
+        这是对外暴露的主接口。
+        """
+        rule = self.match_rule(ruleset, game_state)
+        if rule is not None:
+            # 找到第一个满足条件的规则，立即返回其动作
+            print(f"规则匹配成功: {rule.get('comment', '无注释')}")
 
-                # 此处可以增加对 action 的解析和标准化，例如递归处理 if-then-else
-                return rule.get("action")
+            # 此处可以增加对 action 的解析和标准化，例如递归处理 if-then-else
+            return rule.get("action")
 
         print("未匹配到任何规则，将使用默认动作。")
-        return {"type": "default", "message": "无匹配规则，由管理员选图"}
\ No newline at end of file
+        return dict(DEFAULT_ACTION)
\ No newline at end of file
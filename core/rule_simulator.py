@@ -0,0 +1,261 @@
+# 文件名: core/rule_simulator.py
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from core.rule_engine import DEFAULT_ACTION, RuleEngine
+from core.rule_vectorizer import StateBatch
+from core.scoring_engine import DEFAULT_POINTS
+
+# 规则集的蒙特卡洛模拟：赛前随机生成大量比赛，逐轮计分并调用规则引擎，
+# 统计每条规则的触发频率 (例如加赛图多久出现一次)、比赛轮数和冠军分布。
+# 比赛被分成若干批，交给进程池并行模拟；同一批比赛逐轮同步推进，规则由 RuleEngine.evaluate_batch 批量求值，
+# 每批返回 NumPy 数组，最后在主进程中汇总。
+#
+# 比赛模型：
+#   每名选手有一个固定的实力值 (正态分布，标准差为 skill_spread)，每轮的成绩为 实力值 + Gumbel 噪声，
+#   按成绩排名即 Plackett-Luce 模型 (实力越强越容易跑在前面，但任何名次都有可能)。
+#   选手每轮有 retire_rate 的概率未完赛 (0分)，有 disconnect_rate 的概率在选图时处于掉线状态。
+#   常规轮数结束或领先者达到目标分数时比赛结束；第一名并列时最多再加赛 overtime_rounds 轮。
+
+
+@dataclass
+class SimulationConfig:
+    """一组模拟比赛的参数"""
+    players: int = 8
+    teams: int = 0                # 0 为个人赛；大于 0 时选手按顺序轮流分到各队
+    points: Tuple[int, ...] = DEFAULT_POINTS
+    max_rounds: int = 7           # 常规轮数
+    target_score: Optional[int] = None  # 领先者达到该分数 (且不并列) 时提前结束
+    overtime_rounds: int = 3      # 常规轮数结束时第一名并列，最多加赛的轮数
+    skill_spread: float = 1.0     # 选手实力的差距，0 表示实力完全相同
+    retire_rate: float = 0.05
+    disconnect_rate: float = 0.02
+
+    @property
+    def mode(self) -> str:
+        return 'team' if self.teams > 0 else 'individual'
+
+    def team_ids(self) -> List[Optional[str]]:
+        if self.teams <= 0:
+            return [None] * self.players
+        return [f"team{i % self.teams + 1}" for i in range(self.players)]
+
+
+def _strength_order(strength) -> "np.ndarray":
+    """每场比赛中各选手 (或队伍) 的实力排名，0 为实力最强"""
+    order = np.argsort(-strength, axis=1, kind="stable")
+    seeds = np.empty_like(order)
+    np.put_along_axis(seeds, order, np.broadcast_to(np.arange(strength.shape[1]), order.shape), axis=1)
+    return seeds
+
+
+def _simulate_chunk(ruleset: dict, config: SimulationConfig, matches: int, seed) -> dict:
+    """
+    在当前进程中模拟一批比赛 (进程池的工作函数)。
+    这一批比赛同步推进：每一轮把所有尚未结束的比赛放进同一个 StateBatch，由规则引擎批量求值。
+    """
+    rng = np.random.default_rng(seed)
+    engine = RuleEngine()
+    n_rules = len(ruleset.get("map_selection_rules", []))
+    n = config.players
+    max_total = config.max_rounds + config.overtime_rounds
+
+    points = np.zeros(n, dtype=np.int64)
+    table = np.asarray(config.points[:n], dtype=np.int64)
+    points[:len(table)] = table
+    # 选手在列中的顺序固定，ID/名称/队伍对所有比赛相同
+    ids = np.array([f"p{i + 1}" for i in range(n)], dtype=object)
+    names = np.array([f"选手{i + 1}" for i in range(n)], dtype=object)
+    team_ids = np.array(config.team_ids(), dtype=object)
+    team_onehot = None
+    if config.teams > 0:
+        team_onehot = np.zeros((n, config.teams), dtype=np.int64)
+        team_onehot[np.arange(n), np.arange(n) % config.teams] = 1
+
+    # 一次生成这一批比赛 (含可能的加赛) 所需的全部随机数
+    skill = rng.normal(0.0, config.skill_spread, (matches, n)) if config.skill_spread > 0 else np.zeros((matches, n))
+    performances = skill[:, None, :] + rng.gumbel(size=(matches, max_total, n))
+    performances[rng.random((matches, max_total, n)) < config.retire_rate] = -np.inf
+    connected = rng.random((matches, max_total, n)) >= config.disconnect_rate
+    # 冠军的实力排名，用于判断冠军是否为赛前的热门
+    seeds = _strength_order(skill @ team_onehot if team_onehot is not None else skill)
+
+    scores = np.zeros((matches, n), dtype=np.int64)
+    rounds = np.zeros(matches, dtype=np.int32)
+    winners = np.full(matches, -1, dtype=np.int32)       # 冠军的实力排名 (0 为实力最强者)，-1 为加赛后仍并列
+    # 每场比赛中各规则被选中的次数，最后一列为没有规则匹配 (默认动作)
+    rule_counts = np.zeros((matches, n_rules + 1), dtype=np.int32)
+    active = np.ones(matches, dtype=bool)
+    positions = np.arange(n)
+
+    for r in range(1, max_total + 1):
+        rows = np.flatnonzero(active)
+        if len(rows) == 0:
+            break
+        performance = performances[rows, r - 1]
+        finish = np.argsort(-performance, axis=1, kind="stable")
+        race_points = np.empty_like(finish)
+        np.put_along_axis(race_points, finish, np.broadcast_to(points, finish.shape), axis=1)
+        race_points[performance == -np.inf] = 0  # 未完赛
+        scores[rows] += race_points
+        current = scores[rows]
+        # 总分相同时，本轮名次靠前者排名靠前
+        race_position = np.empty_like(finish)
+        np.put_along_axis(race_position, finish, np.broadcast_to(positions, finish.shape), axis=1)
+        rank = np.empty_like(finish)
+        np.put_along_axis(rank, np.lexsort((race_position, -current), axis=1),
+                          np.broadcast_to(positions + 1, finish.shape), axis=1)
+
+        size = len(rows)
+        batch = StateBatch(
+            game={"round_number": np.full(size, r, dtype=np.int64),
+                  "mode": np.full(size, config.mode, dtype=object),
+                  "trigger": np.full(size, 'after_round', dtype=object)},
+            players={"id": np.broadcast_to(ids, (size, n)), "name": np.broadcast_to(names, (size, n)),
+                     "rank": rank, "total_score": current, "is_connected": connected[rows, r - 1],
+                     "team_id": np.broadcast_to(team_ids, (size, n))},
+            count=np.full(size, n, dtype=np.int64),
+        )
+        matched = engine.evaluate_batch(ruleset, batch)
+        rule_counts[rows, np.where(matched >= 0, matched, n_rules)] += 1
+
+        totals = current @ team_onehot if team_onehot is not None else current
+        ordered = np.sort(totals, axis=1)
+        best = ordered[:, -1]
+        second = ordered[:, -2] if totals.shape[1] > 1 else np.full(size, -np.inf)
+        decided = best > second
+        done = decided & (best >= config.target_score) if config.target_score is not None else np.zeros(size, bool)
+        if r >= config.max_rounds:
+            done |= decided | (r >= max_total)
+        finished = rows[done]
+        rounds[finished] = r
+        won = rows[done & decided]
+        leader = totals[done & decided].argmax(axis=1)
+        winners[won] = seeds[won, leader]
+        active[finished] = False
+
+    return {"rounds": rounds, "winners": winners, "rule_counts": rule_counts}
+
+
+def _split(matches: int, chunk_size: int) -> List[int]:
+    """把比赛分成若干批，每批不超过 chunk_size 场"""
+    return [min(chunk_size, matches - start) for start in range(0, matches, chunk_size)]
+
+
+def simulate(ruleset: dict, config: Optional[SimulationConfig] = None, matches: int = 10000,
+             workers: Optional[int] = None, seed: Optional[int] = None, chunk_size: int = 500) -> dict:
+    """
+    模拟 matches 场比赛并返回统计结果 (见 summarize)。
+    :param workers: 进程数，默认使用全部CPU；为 1 时在当前进程中模拟
+    :param seed: 随机种子，相同的种子和参数得到相同的结果 (与进程数无关)
+    :param chunk_size: 每批比赛的场数，批次越小负载越均衡，但进程间通信越多
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("NumPy 未安装，无法运行规则集模拟。")
+    config = config or SimulationConfig()
+    if config.players < 2:
+        raise ValueError("至少需要 2 名选手")
+    if matches < 1:
+        raise ValueError("至少需要模拟 1 场比赛")
+    if chunk_size < 1:
+        raise ValueError("每批比赛的场数必须为正整数")
+    workers = workers or os.cpu_count() or 1
+    # 编译失败的规则在模拟开始前就报告，而不是在每个工作进程里各报一次
+    RuleEngine().compile_ruleset(ruleset)
+
+    sizes = _split(matches, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = max(1, min(workers, len(sizes)))
+    start = time.perf_counter()
+    if workers == 1:
+        parts = [_simulate_chunk(ruleset, config, size, s) for size, s in zip(sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(_simulate_chunk, [ruleset] * len(sizes), [config] * len(sizes), sizes, seeds))
+    elapsed = time.perf_counter() - start
+    return summarize(ruleset, config, parts, elapsed, workers)
+
+
+def summarize(ruleset: dict, config: SimulationConfig, parts: List[dict], elapsed: float, workers: int = 1) -> dict:
+    """汇总各批次的模拟结果"""
+    rounds = np.concatenate([part["rounds"] for part in parts])
+    winners = np.concatenate([part["winners"] for part in parts])
+    rule_counts = np.concatenate([part["rule_counts"] for part in parts])
+    matches = len(rounds)
+    total_rounds = int(rounds.sum())
+
+    rules = []
+    decisions = rule_counts.sum(axis=0)
+    fired = (rule_counts > 0).mean(axis=0)
+    per_match = rule_counts.mean(axis=0)
+    entries = list(ruleset.get("map_selection_rules", [])) + [{"comment": "没有规则匹配 (默认动作)", "action": DEFAULT_ACTION}]
+    action_types: Dict[str, int] = {}
+    for i, rule in enumerate(entries):
+        action_type = (rule.get("action") or {}).get("type", "unknown")
+        action_types[action_type] = action_types.get(action_type, 0) + int(decisions[i])
+        rules.append({
+            "index": i if i < len(entries) - 1 else None,
+            "comment": rule.get("comment", ""),
+            "action_type": action_type,
+            "decisions": int(decisions[i]),
+            "decision_share": float(decisions[i] / total_rounds) if total_rounds else 0.0,
+            "match_rate": float(fired[i]),          # 至少被选中一次的比赛所占比例
+            "per_match": float(per_match[i]),       # 平均每场比赛被选中的次数
+        })
+
+    length_counts = np.bincount(rounds)
+    outcome_size = config.teams if config.teams > 0 else config.players
+    winner_counts = np.bincount(winners[winners >= 0], minlength=outcome_size)
+    return {
+        "matches": matches,
+        "rounds": total_rounds,
+        "elapsed": elapsed,
+        "workers": workers,
+        "rounds_per_second": total_rounds / elapsed if elapsed > 0 else float("inf"),
+        "match_length": {
+            "mean": float(rounds.mean()),
+            "std": float(rounds.std()),
+            "p50": float(np.percentile(rounds, 50)),
+            "p90": float(np.percentile(rounds, 90)),
+            "min": int(rounds.min()),
+            "max": int(rounds.max()),
+            "distribution": {int(k): float(v / matches) for k, v in enumerate(length_counts) if v},
+        },
+        "overtime_rate": float((rounds > config.max_rounds).mean()),
+        "unresolved_rate": float((winners < 0).mean()),
+        # 冠军的赛前实力排名分布：第 0 项为实力最强的选手 (或队伍) 夺冠的比例
+        "winner_seed_distribution": [float(c / matches) for c in winner_counts],
+        "rules": rules,
+        "action_types": {k: v / total_rounds for k, v in action_types.items()} if total_rounds else {},
+    }
+
+
+def format_report(summary: dict) -> str:
+    """把统计结果格式化为便于阅读的文本"""
+    length = summary["match_length"]
+    lines = [
+        f"模拟 {summary['matches']} 场比赛，共 {summary['rounds']} 轮，耗时 {summary['elapsed']:.2f} s "
+        f"({summary['workers']} 个进程，{summary['rounds_per_second']:,.0f} 轮/秒)",
+        f"比赛轮数: 平均 {length['mean']:.2f} (标准差 {length['std']:.2f})，中位数 {length['p50']:.0f}，"
+        f"p90 {length['p90']:.0f}，范围 {length['min']}-{length['max']}",
+        f"进入加赛的比赛: {summary['overtime_rate']:.1%}，加赛后仍并列: {summary['unresolved_rate']:.1%}",
+        "冠军的赛前实力排名: " + ", ".join(f"第{i + 1}强 {share:.1%}"
+                                    for i, share in enumerate(summary["winner_seed_distribution"][:4])),
+        "",
+        f"{'规则':<28} {'动作':<16} {'占全部决策':>10} {'出现过的比赛':>12} {'每场次数':>9}",
+    ]
+    for rule in summary["rules"]:
+        comment = rule["comment"] if len(rule["comment"]) <= 26 else rule["comment"][:25] + "…"
+        lines.append(f"{comment:<28} {rule['action_type']:<16} {rule['decision_share']:>10.1%} "
+                     f"{rule['match_rate']:>12.1%} {rule['per_match']:>9.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,378 @@
+# 文件名: core/rule_vectorizer.py
+
+import ast
+import operator
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# 规则条件的批量 (向量化) 求值：
+# 模拟器和解说用的 "假如" 面板需要对成千上万个比赛状态求值同一个规则集。
+# 把这些状态按列存放 (StateBatch，每个字段一个数组，选手字段为 状态数 x 最大选手数 的二维数组)，
+# 规则条件中常用的子集被编译为对整列的 NumPy 运算，一次得到所有状态的结果。
+#
+# 可向量化的子集 (均为原生子集的一部分)：
+#   game_state.round_number / mode / trigger、len(game_state.players)
+#   game_state.get_player_by_rank/id/name(常量).字段、game_state.players[常量].字段
+#   game_state.get_player_by_...(常量) is None / is not None、game_state.get_team_total(常量)
+#   len([p for p in game_state.players if ...]) (条件中只能使用 p 的字段、比赛字段和常量)
+#   比较、and/or/not、+ - *、负号、条件表达式
+# 其他条件返回 None，由调用方对每个状态单独求值。
+# 与逐个求值的语义保持一致：某个状态中找不到选手 (对 None 取属性) 时，该状态的条件结果为 False。
+
+GAME_FIELDS = ("round_number", "mode", "trigger")
+PLAYER_FIELDS = ("id", "name", "rank", "total_score", "is_connected", "team_id")
+# 查询方法 -> 用于匹配选手的字段
+GATHER_METHODS = {"get_player_by_rank": "rank", "get_player_by_id": "id", "get_player_by_name": "name"}
+
+_COMPARE_OPS = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt,
+    ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+_BINARY_OPS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul}
+
+
+def _column(rows, dtype=None):
+    """数值/布尔列保持原生类型，其余 (字符串、含 None 等) 使用 object 数组，比较语义与 Python 一致"""
+    if dtype is None:
+        array = np.array(rows)
+        if array.dtype.kind in "biuf":
+            return array
+        dtype = object
+    array = np.empty((len(rows), len(rows[0])) if rows and isinstance(rows[0], list) else len(rows), dtype=dtype)
+    array[...] = rows
+    return array
+
+
+class StateBatch:
+    """
+    按列存放的一批比赛状态。
+    game: 字段名 -> 形状为 (状态数,) 的数组；players: 字段名 -> (状态数, 最大选手数) 的数组；
+    count: 每个状态的选手人数 (选手依次存放在前 count 列，其余列为填充值)。
+    """
+
+    def __init__(self, game: Dict[str, "np.ndarray"], players: Dict[str, "np.ndarray"], count: "np.ndarray",
+                 states: Optional[Sequence] = None):
+        self.game = game
+        self.players = players
+        self.count = count
+        self.valid = np.arange(players["rank"].shape[1]) < count[:, None]
+        self._states = states
+
+    def __len__(self):
+        return len(self.count)
+
+    @classmethod
+    def from_states(cls, states: Sequence) -> "StateBatch":
+        """由 GameState 列表构造"""
+        width = max((len(s.players) for s in states), default=0)
+        pads = {"id": None, "name": None, "rank": 0, "total_score": 0, "is_connected": False, "team_id": None}
+        players = {}
+        for field in PLAYER_FIELDS:
+            rows = []
+            for s in states:
+                row = [getattr(p, field) for p in s.players]
+                row.extend([pads[field]] * (width - len(row)))
+                rows.append(row)
+            if rows:
+                players[field] = _column(rows, object if pads[field] is None else None)
+            else:
+                # 空批次的选手列也是二维的 (0, 0)，与非空批次一致
+                players[field] = np.empty((0, 0), dtype=object if pads[field] is None else type(pads[field]))
+        game = {field: _column([getattr(s, field) for s in states], object if field != "round_number" else None)
+                for field in GAME_FIELDS}
+        count = np.array([len(s.players) for s in states], dtype=np.int64)
+        return cls(game, players, count, list(states))
+
+    def game_state(self, row: int):
+        """第 row 个状态的 GameState (由数组构造的批次会按需生成)，用于无法向量化的条件"""
+        if self._states is not None:
+            return self._states[row]
+        from core.rule_engine import GameState, PlayerState
+        players = [PlayerState(*(_to_python(self.players[field][row, i]) for field in PLAYER_FIELDS))
+                   for i in range(int(self.count[row]))]
+        return GameState(*(_to_python(self.game[field][row]) for field in ("round_number", "mode")),
+                         players, _to_python(self.game["trigger"][row]))
+
+
+def _to_python(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class _NotVectorizable(Exception):
+    pass
+
+
+# 编译得到的函数: (batch) -> (取值, 出错掩码或 None)。
+# 取值为形状 (状态数,) 的数组或标量；在推导式内部为 (状态数, 选手数) 的数组。
+Vectorized = Callable[[StateBatch], Tuple[object, Optional["np.ndarray"]]]
+
+
+def _truthy(value):
+    if isinstance(value, np.ndarray):
+        return value.astype(bool)
+    return bool(value)
+
+
+def _merge_errors(*errors):
+    result = None
+    for error in errors:
+        if error is not None:
+            result = error if result is None else (result | error)
+    return result
+
+
+def _is_game_state(node) -> bool:
+    return isinstance(node, ast.Name) and node.id == "game_state"
+
+
+def _const_key(node: ast.AST):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, str)) and not isinstance(node.value, bool):
+        return node.value
+    raise _NotVectorizable()
+
+
+def _subscript_index(node: ast.Subscript) -> int:
+    index = node.slice
+    if hasattr(ast, "Index") and isinstance(index, getattr(ast, "Index")):  # Python 3.8
+        index = index.value
+    if isinstance(index, ast.UnaryOp) and isinstance(index.op, ast.USub):
+        value = _const_key(index.operand)
+        if isinstance(value, int):
+            return -value
+    value = _const_key(index)
+    if not isinstance(value, int):
+        raise _NotVectorizable()
+    return value
+
+
+class _Builder:
+    def __init__(self, player_var: Optional[str] = None):
+        # 推导式中的循环变量 (此时取值为二维数组)
+        self.player_var = player_var
+
+    def build(self, node: ast.AST) -> Vectorized:
+        handler = getattr(self, f"_build_{type(node).__name__}", None)
+        if handler is None:
+            raise _NotVectorizable()
+        return handler(node)
+
+    # --- 叶子节点 ---
+    def _build_Constant(self, node):
+        if not isinstance(node.value, (int, float, str, bool, type(None))):
+            raise _NotVectorizable()
+        value = node.value
+        return lambda batch: (value, None)
+
+    def _build_Attribute(self, node):
+        field = node.attr
+        if _is_game_state(node.value):
+            if field not in GAME_FIELDS:
+                raise _NotVectorizable()
+            if self.player_var is not None:
+                return lambda batch: (batch.game[field][:, None], None)
+            return lambda batch: (batch.game[field], None)
+        if field not in PLAYER_FIELDS:
+            raise _NotVectorizable()
+        if isinstance(node.value, ast.Name) and node.value.id == self.player_var:
+            return lambda batch: (batch.players[field], None)
+        locate = self._locate_player(node.value)
+
+        def gather(batch):
+            index, exists = locate(batch)
+            values = batch.players[field][np.arange(len(batch)), index]
+            return values, ~exists
+
+        return gather
+
+    def _locate_player(self, node: ast.AST):
+        """单个选手的表达式 -> 函数 (batch) -> (每个状态中该选手的列号, 是否存在)"""
+        if self.player_var is not None:
+            raise _NotVectorizable()  # 推导式内部不支持按条件查找选手
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and _is_game_state(node.func.value)
+                and node.func.attr in GATHER_METHODS and len(node.args) == 1 and not node.keywords):
+            key_field = GATHER_METHODS[node.func.attr]
+            key = _const_key(node.args[0])
+
+            def locate(batch):
+                # 与 GameState 的索引一致：取第一个匹配的选手
+                mask = (batch.players[key_field] == key) & batch.valid
+                return mask.argmax(axis=1), mask.any(axis=1)
+
+            return locate
+        if (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Attribute)
+                and _is_game_state(node.value.value) and node.value.attr == "players"):
+            position = _subscript_index(node)
+
+            def locate_position(batch):
+                index = np.full(len(batch), position, dtype=np.int64)
+                if position < 0:
+                    index = index + batch.count
+                exists = (index >= 0) & (index < batch.count)
+                return np.where(exists, index, 0), exists
+
+            return locate_position
+        raise _NotVectorizable()
+
+    # --- 运算 ---
+    def _build_Compare(self, node):
+        if len(node.ops) == 1 and isinstance(node.ops[0], (ast.Is, ast.IsNot)):
+            return self._build_is_none(node)
+        operands = [self.build(node.left)] + [self.build(c) for c in node.comparators]
+        ops = []
+        for op in node.ops:
+            if type(op) not in _COMPARE_OPS:
+                raise _NotVectorizable()
+            ops.append(_COMPARE_OPS[type(op)])
+
+        def compare(batch):
+            values = [operand(batch) for operand in operands]
+            result = None
+            for op, (left, _), (right, _) in zip(ops, values, values[1:]):
+                step = op(left, right)
+                result = step if result is None else (result & step)
+            return result, _merge_errors(*(error for _, error in values))
+
+        return compare
+
+    def _build_is_none(self, node):
+        comparator = node.comparators[0]
+        if not (isinstance(comparator, ast.Constant) and comparator.value is None):
+            raise _NotVectorizable()
+        locate = self._locate_player(node.left)
+        negate = isinstance(node.ops[0], ast.IsNot)
+
+        def is_none(batch):
+            _, exists = locate(batch)
+            return (exists if negate else ~exists), None
+
+        return is_none
+
+    def _build_BoolOp(self, node):
+        values = [self.build(v) for v in node.values]
+        is_and = isinstance(node.op, ast.And)
+
+        def bool_op(batch):
+            result, error = values[0](batch)
+            for value in values[1:]:
+                right, right_error = value(batch)
+                truthy = np.asarray(_truthy(result))
+                # and: 左侧为真时取右侧；or: 左侧为假时取右侧。右侧的错误只在取右侧的状态上生效
+                take_right = truthy if is_and else ~truthy
+                result = np.where(take_right, right, result)
+                if right_error is not None:
+                    error = _merge_errors(error, take_right & right_error)
+            return result, error
+
+        return bool_op
+
+    def _build_UnaryOp(self, node):
+        operand = self.build(node.operand)
+        if isinstance(node.op, ast.Not):
+            def negate(batch):
+                value, error = operand(batch)
+                return ~np.asarray(_truthy(value)), error
+            return negate
+        if isinstance(node.op, ast.USub):
+            def minus(batch):
+                value, error = operand(batch)
+                return -value, error
+            return minus
+        if isinstance(node.op, ast.UAdd):
+            return operand
+        raise _NotVectorizable()
+
+    def _build_BinOp(self, node):
+        op = _BINARY_OPS.get(type(node.op))
+        if op is None:
+            raise _NotVectorizable()
+        left, right = self.build(node.left), self.build(node.right)
+
+        def binary(batch):
+            (a, a_error), (b, b_error) = left(batch), right(batch)
+            return op(a, b), _merge_errors(a_error, b_error)
+
+        return binary
+
+    def _build_IfExp(self, node):
+        test, body, orelse = self.build(node.test), self.build(node.body), self.build(node.orelse)
+
+        def if_exp(batch):
+            (condition, error) = test(batch)
+            (a, a_error), (b, b_error) = body(batch), orelse(batch)
+            truthy = np.asarray(_truthy(condition))
+            branch_error = _merge_errors(
+                truthy & a_error if a_error is not None else None,
+                ~truthy & b_error if b_error is not None else None,
+            )
+            return np.where(truthy, a, b), _merge_errors(error, branch_error)
+
+        return if_exp
+
+    def _build_Call(self, node):
+        func = node.func
+        if node.keywords:
+            raise _NotVectorizable()
+        if isinstance(func, ast.Name) and func.id == "len" and len(node.args) == 1:
+            return self._build_len(node.args[0])
+        if (isinstance(func, ast.Attribute) and _is_game_state(func.value) and func.attr == "get_team_total"
+                and len(node.args) == 1 and self.player_var is None):
+            team = _const_key(node.args[0])
+
+            def team_total(batch):
+                members = (batch.players["team_id"] == team) & batch.valid
+                return np.where(members, batch.players["total_score"], 0).sum(axis=1), None
+
+            return team_total
+        raise _NotVectorizable()
+
+    def _build_len(self, node):
+        if self.player_var is not None:
+            raise _NotVectorizable()
+        if isinstance(node, ast.Attribute) and _is_game_state(node.value) and node.attr == "players":
+            return lambda batch: (batch.count, None)
+        if isinstance(node, ast.ListComp) and len(node.generators) == 1:
+            generator = node.generators[0]
+            if not (isinstance(generator.target, ast.Name) and isinstance(generator.iter, ast.Attribute)
+                    and _is_game_state(generator.iter.value) and generator.iter.attr == "players"
+                    and not generator.is_async):
+                raise _NotVectorizable()
+            inner = _Builder(generator.target.id)
+            filters = [inner.build(condition) for condition in generator.ifs]
+
+            def count(batch):
+                mask = batch.valid
+                for condition in filters:
+                    value, _ = condition(batch)
+                    mask = mask & _truthy(value)
+                return mask.sum(axis=1), None
+
+            return count
+        raise _NotVectorizable()
+
+
+def vectorize(tree: ast.AST) -> Optional[Callable[[StateBatch], "np.ndarray"]]:
+    """
+    把条件编译为批量求值函数 (batch) -> 布尔数组；不在可向量化子集内时返回 None。
+    tree 为 asteval 解析得到的模块，应先通过原生子集校验 (保证没有副作用)。
+    """
+    if not NUMPY_AVAILABLE:
+        return None
+    body = tree.body[0].value if isinstance(tree, ast.Module) else tree
+    try:
+        evaluate = _Builder().build(body)
+    except _NotVectorizable:
+        return None
+
+    def run(batch: StateBatch):
+        value, error = evaluate(batch)
+        result = np.broadcast_to(_truthy(value), (len(batch),))
+        if error is not None:
+            result = result & ~error
+        return result
+
+    return run
@@ -0,0 +1,238 @@
+# 文件名: core/scoring_engine.py
+
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from core.rule_engine import GameState, PlayerState
+
+# 比赛积分与排名：
+# 每轮比赛结束后按积分表给各选手的名次计分，并增量维护排名。
+# 排名保存在按 (-总分, 最近一轮名次, 选手ID) 排序的列表中，每条成绩只把该选手的条目移出再二分插入，
+# 不需要对所有选手重新排序；总分相同时，最近一轮名次靠前者排名靠前 (与规则模拟的计分方式一致)。
+# 每轮成绩先写入 match_history 再更新内存，程序崩溃后可以用 ScoringEngine.rebuild 从历史记录重建。
+# 加入或修改选手时同样先写入一条只含名单的记录 ({"players": ...}，没有轮次)，第一轮之前加入的选手也能恢复。
+# 同一轮再次提交成绩视为更正：撤销该轮原来的得分后重新计分。
+
+# 个人赛按名次计分 (第1名到第8名)，名次超出表长时不得分
+DEFAULT_POINTS = (10, 8, 6, 5, 4, 3, 2, 1)
+
+# 未完赛或最近一轮没有参赛的选手，同分时排在有名次的选手之后
+_NO_POSITION = 1 << 30
+
+
+@dataclass(frozen=True)
+class PointsTable:
+    """积分表：第 N 名得 points[N-1] 分，名次超出表长时不得分"""
+    points: Tuple[int, ...] = DEFAULT_POINTS
+    retired: int = 0  # 未完赛的得分
+
+    def points_for(self, position: Optional[int]) -> int:
+        if position is None:
+            return self.retired
+        if 1 <= position <= len(self.points):
+            return self.points[position - 1]
+        return 0
+
+
+class Standing:
+    """单个选手的累计积分"""
+
+    __slots__ = ("player_id", "name", "team_id", "total_score", "last_position")
+
+    def __init__(self, player_id: str, name: str, team_id: Optional[str] = None):
+        self.player_id = player_id
+        self.name = name
+        self.team_id = team_id
+        self.total_score = 0
+        self.last_position: Optional[int] = None  # 最近一轮的名次
+
+    def sort_key(self) -> tuple:
+        position = self.last_position if self.last_position is not None else _NO_POSITION
+        return -self.total_score, position, self.player_id
+
+
+class ScoringEngine:
+    """
+    一场比赛的积分与排名。
+    :param db: 提供 save_match_round / get_match_history 的 DBManager，为 None 时不持久化
+    """
+
+    def __init__(self, match_name: str, points: Optional[PointsTable] = None, db=None,
+                 ruleset_id: Optional[int] = None):
+        self.match_name = match_name
+        self.points = points or PointsTable()
+        self.db = db
+        self.ruleset_id = ruleset_id
+        self.round_number = 0
+        self._players: Dict[str, Standing] = {}
+        self._order: List[tuple] = []  # 全部选手的排序键，始终有序
+        self._team_totals: Dict[str, int] = {}
+        # 轮次 -> (各选手名次, 各选手得分)，更正某一轮的成绩时用于撤销原来的得分
+        self._rounds: Dict[int, Tuple[Dict[str, Optional[int]], Dict[str, int]]] = {}
+
+    # --- 选手 ---
+    def add_player(self, player_id: str, name: str, team_id: Optional[str] = None):
+        """加入选手 (已存在时更新名称和队伍)"""
+        standing = self._players.get(player_id)
+        if standing is not None and standing.name == name and standing.team_id == team_id:
+            return
+        if self.db is not None:
+            roster = self._roster()
+            roster[player_id] = [name, team_id]
+            self.db.save_match_round(self.match_name, self.ruleset_id, {"players": roster})
+        if standing is None:
+            standing = self._players[player_id] = Standing(player_id, name, team_id)
+            insort(self._order, standing.sort_key())
+            if team_id is not None:
+                self._team_totals.setdefault(team_id, 0)
+            return
+        standing.name = name
+        if standing.team_id != team_id:
+            if standing.team_id is not None:
+                self._team_totals[standing.team_id] -= standing.total_score
+            if team_id is not None:
+                self._team_totals[team_id] = self._team_totals.get(team_id, 0) + standing.total_score
+            standing.team_id = team_id
+
+    def _roster(self) -> Dict[str, list]:
+        """写入历史记录的选手名单：{选手ID: [名称, 队伍]}"""
+        return {s.player_id: [s.name, s.team_id] for s in self._players.values()}
+
+    def _move(self, standing: Standing, score_delta: int, position: Optional[int]):
+        """更新一名选手的总分和最近名次：移出原来的排序键，再二分插入新的排序键"""
+        if score_delta == 0 and position == standing.last_position:
+            return
+        del self._order[bisect_left(self._order, standing.sort_key())]
+        standing.total_score += score_delta
+        standing.last_position = position
+        insort(self._order, standing.sort_key())
+        if standing.team_id is not None and score_delta:
+            self._team_totals[standing.team_id] += score_delta
+
+    # --- 成绩 ---
+    def record_round(self, round_number: int, results: Dict[str, Optional[int]], map_id: Optional[str] = None,
+                     times: Optional[Dict[str, float]] = None) -> Dict[str, int]:
+        """
+        提交一轮成绩并返回各选手本轮的得分；该轮已提交过时视为更正。
+        :param results: {选手ID: 名次}，名次从 1 开始，未完赛为 None；本轮没有参赛的选手不需要出现
+        :param map_id: 本轮的地图，以及 times 各选手的完赛用时 (秒)，只用于地图和选手统计
+        """
+        unknown = [player_id for player_id in results if player_id not in self._players]
+        if unknown:
+            raise ValueError(f"未知的选手: {', '.join(map(str, unknown))}")
+        results = dict(results)
+        awarded = {player_id: self.points.points_for(position) for player_id, position in results.items()}
+        if self.db is not None:
+            record = {
+                "round": round_number,
+                "results": results,
+                "awarded": awarded,
+                "players": self._roster(),
+            }
+            if map_id is not None:
+                record["map_id"] = map_id
+            if times:
+                record["times"] = dict(times)
+            self.db.save_match_round(self.match_name, self.ruleset_id, record)
+        self._apply_round(round_number, results, awarded)
+        return awarded
+
+    def _apply_round(self, round_number: int, results: Dict[str, Optional[int]], awarded: Dict[str, int]):
+        previous = self._rounds.get(round_number, ({}, {}))[1]
+        # 只有最近一轮的名次参与同分比较；更正更早的轮次时名次不变
+        latest = round_number >= self.round_number
+        for player_id, standing in self._players.items():
+            delta = awarded.get(player_id, 0) - previous.get(player_id, 0)
+            position = results.get(player_id) if latest else standing.last_position
+            self._move(standing, delta, position)
+        self._rounds[round_number] = (results, awarded)
+        self.round_number = max(self.round_number, round_number)
+
+    @classmethod
+    def rebuild(cls, match_name: str, db, points: Optional[PointsTable] = None,
+                ruleset_id: Optional[int] = None) -> "ScoringEngine":
+        """
+        从 match_history 中的逐轮记录和名单记录重建积分与排名 (程序崩溃后恢复比赛)。
+        直接累加各轮记录的得分，最后只排序一次；同一轮有多条记录时以最后一条 (更正) 为准。
+        """
+        engine = cls(match_name, points, db, ruleset_id)
+        rounds: Dict[int, dict] = {}
+        for row in db.get_match_history(match_name):
+            result = row["result"]
+            if not isinstance(result, dict):
+                continue
+            if "round" in result and "awarded" in result:
+                rounds[result["round"]] = result
+            elif not isinstance(result.get("players"), dict):
+                continue  # 既不是成绩也不是名单，不是积分引擎写入的记录
+            for player_id, (name, team_id) in result.get("players", {}).items():
+                standing = engine._players.get(player_id)
+                if standing is None:
+                    engine._players[player_id] = Standing(player_id, name, team_id)
+                else:
+                    standing.name, standing.team_id = name, team_id
+            if ruleset_id is None and row["ruleset_id"] is not None:
+                engine.ruleset_id = row["ruleset_id"]
+
+        for round_number in sorted(rounds):
+            result = rounds[round_number]
+            for player_id, score in result["awarded"].items():
+                engine._players[player_id].total_score += score
+            engine._rounds[round_number] = (result["results"], result["awarded"])
+        if rounds:
+            engine.round_number = max(rounds)
+            last_results = rounds[engine.round_number]["results"]
+            for player_id, standing in engine._players.items():
+                standing.last_position = last_results.get(player_id)
+        for standing in engine._players.values():
+            if standing.team_id is not None:
+                engine._team_totals[standing.team_id] = (engine._team_totals.get(standing.team_id, 0)
+                                                         + standing.total_score)
+        engine._order = sorted(standing.sort_key() for standing in engine._players.values())
+        return engine
+
+    # --- 排名查询 ---
+    def rank_of(self, player_id: str) -> Optional[int]:
+        standing = self._players.get(player_id)
+        if standing is None:
+            return None
+        return bisect_left(self._order, standing.sort_key()) + 1
+
+    def standings(self) -> List[dict]:
+        """按排名列出全部选手：[{"rank", "player_id", "name", "team_id", "total_score"}]"""
+        rows = []
+        for rank, key in enumerate(self._order, 1):
+            standing = self._players[key[2]]
+            rows.append({"rank": rank, "player_id": standing.player_id, "name": standing.name,
+                         "team_id": standing.team_id, "total_score": standing.total_score})
+        return rows
+
+    def team_totals(self) -> Dict[str, int]:
+        return dict(self._team_totals)
+
+    # --- 输出 ---
+    def player_states(self, connected: Optional[Dict[str, bool]] = None) -> List[PlayerState]:
+        """按排名生成规则引擎使用的选手状态；connected 为 {选手ID: 是否在线}，未给出的选手视为在线"""
+        connected = connected or {}
+        return [PlayerState(row["player_id"], row["name"], row["rank"], row["total_score"],
+                            connected.get(row["player_id"], True), row["team_id"])
+                for row in self.standings()]
+
+    def apply_to(self, game_state: GameState) -> GameState:
+        """把当前排名和总分写入比赛状态中已有的选手 (按选手ID对应)"""
+        for player in game_state.players:
+            standing = self._players.get(player.id)
+            if standing is None:
+                continue
+            rank = self.rank_of(player.id)
+            if player.rank != rank:
+                player.rank = rank
+            if player.total_score != standing.total_score:
+                player.total_score = standing.total_score
+        return game_state
+
+    def scores_payload(self) -> Dict[str, dict]:
+        """记分板推送的比分：{选手名称: {"rank", "total_score", "team"}}"""
+        return {row["name"]: {"rank": row["rank"], "total_score": row["total_score"], "team": row["team_id"]}
+                for row in self.standings()}
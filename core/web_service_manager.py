@@ -1,55 +1,302 @@
 # 文件名: core/web_service_manager.py
 
-import uvicorn
-from PyQt6.QtCore import QThread, pyqtSignal
-import queue
+import asyncio
+import multiprocessing
+import threading
 
-# 导入web服务器的app实例和指令队列
-from web.server import app, command_queue
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+
+from core.db_manager import DBManager
+# 导入web服务器的app实例、指令队列和连接排空函数
+from web.broker import CommandBroker
+from web.server import app, apply_settings, command_queue, drain_connections
+from web.worker import NotifyingServer, build_config, run_worker
+
+
+class WebServiceSignals(QObject):
+    """Web服务的状态信号 (从服务线程发出，Qt会自动排队到接收者所在线程)"""
+    server_ready = pyqtSignal(str)      # 参数: 服务地址
+    server_stopped = pyqtSignal()
+    server_error = pyqtSignal(str)      # 参数: 错误信息
 
 
 class WebServerThread(QThread):
     """运行Uvicorn服务器的后台线程"""
 
+    def __init__(self, settings: dict, signals: WebServiceSignals):
+        super().__init__()
+        self.settings = settings
+        self.signals = signals
+        self.server = None
+        self.loop = None
+        self.ready_event = threading.Event()
+        self.error = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.settings['host']}:{self.settings['port']}"
+
+    @property
+    def ready(self) -> bool:
+        return self.loop is not None
+
+    def run(self):
+        # Uvicorn在非主线程中运行时不会安装信号处理器，停止只能通过 should_exit
+        apply_settings(self.settings)
+        self.server = NotifyingServer(build_config(app, self.settings), self._on_started)
+        try:
+            self.server.run()
+        except SystemExit:
+            # 端口绑定失败时 uvicorn 会调用 sys.exit(1)
+            self.error = f"Web服务无法绑定 {self.settings['host']}:{self.settings['port']}，端口可能已被占用。"
+        except Exception as e:
+            self.error = f"Web服务运行失败: {e}"
+        finally:
+            self.loop = None
+            if not self.ready_event.is_set() and self.error is None:
+                self.error = f"Web服务未能启动，端口 {self.settings['port']} 可能已被占用。"
+            self.ready_event.set()
+            if self.error:
+                self.signals.server_error.emit(self.error)
+            self.signals.server_stopped.emit()
+
+    def _on_started(self, loop):
+        self.loop = loop
+        self.signals.server_ready.emit(self.url)
+        self.ready_event.set()
+
+    def request_stop(self, drain_timeout: float):
+        """
+        请求服务优雅停止 (可在任意线程调用，不阻塞)：
+        先把积压的指令发完、为所有WebSocket连接排空发送队列并发送关闭帧，再让uvicorn退出。
+        """
+        server, loop = self.server, self.loop
+        if server is None:
+            return
+        if loop is None or loop.is_closed():
+            server.should_exit = True
+            return
+
+        async def shutdown():
+            try:
+                await drain_connections(drain_timeout)
+            finally:
+                server.should_exit = True
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop)
+        except RuntimeError:
+            server.should_exit = True
+
+
+class MultiWorkerThread(QThread):
+    """
+    多进程部署时的监管线程：在桌面进程中绑定监听端口并启动指令代理，
+    再以 spawn 方式启动若干Web工作进程共享该端口，全部就绪后发出 server_ready。
+    """
+
+    def __init__(self, settings: dict, signals: WebServiceSignals):
+        super().__init__()
+        self.settings = settings
+        self.signals = signals
+        self.workers = []
+        self.ready_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.error = None
+        self._ready_pids = set()
+        # 代理在主线程创建，启动期间调用 send_command 也能立即投递
+        self.broker = CommandBroker(on_worker_ready=self._on_worker_ready)
+        # 代理只把指令发给已连接的工作进程：服务停止期间暂存在桥接器中的指令和启动期间投递的指令
+        # 先缓存起来，全部工作进程就绪后再按顺序转发
+        self._forward_lock = threading.Lock()
+        self._startup_buffer = command_queue.take_pending()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.settings['host']}:{self.settings['port']}"
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_event.is_set() and self.error is None and not self.stop_event.is_set()
+
+    def _on_worker_ready(self, pid):
+        self._ready_pids.add(pid)
+        if len(self._ready_pids) == len(self.workers) and not self.ready_event.is_set():
+            self._flush_startup_buffer()
+            self.signals.server_ready.emit(self.url)
+            self.ready_event.set()
+
+    def _flush_startup_buffer(self):
+        with self._forward_lock:
+            buffered, self._startup_buffer = self._startup_buffer, None
+            if buffered:
+                print(f"信息: 补发 {len(buffered)} 条在服务未运行期间投递的指令。")
+                for item in buffered:
+                    self.broker.put(item)
+
+    def put(self, item):
+        """投递一条指令 (topic, command)：就绪前缓存，就绪后经代理扇出，停止后暂存到桥接器待下次启动补发"""
+        with self._forward_lock:
+            if self._startup_buffer is not None:
+                self._startup_buffer.append(item)
+                return
+        if self.stop_event.is_set():
+            command_queue.put(item)
+        else:
+            self.broker.put(item)
+
     def run(self):
-        # Uvicorn需要以这种方式在非主线程中运行
-        config = uvicorn.Config(app, host="0.0.0.0", port=8000, log_level="info")
-        server = uvicorn.Server(config)
-        server.run()
+        sock = None
+        try:
+            try:
+                sock = build_config(app, self.settings).bind_socket()
+            except SystemExit:
+                self.error = f"Web服务无法绑定 {self.settings['host']}:{self.settings['port']}，端口可能已被占用。"
+                return
+            ctx = multiprocessing.get_context("spawn")
+            db_path = DBManager().db_path
+            for _ in range(self.settings["workers"]):
+                process = ctx.Process(
+                    target=run_worker,
+                    args=(self.settings, [sock], self.broker.address, self.broker.authkey, db_path),
+                    daemon=True,
+                )
+                process.start()
+                self.workers.append(process)
+
+            while not self.stop_event.wait(0.2):
+                if not any(p.is_alive() for p in self.workers):
+                    self.error = "Web服务的所有工作进程均已退出。"
+                    break
+                if not self.ready_event.is_set() and any(p.exitcode not in (None, 0) for p in self.workers):
+                    self.error = "Web工作进程启动失败。"
+                    break
+
+            timeout = self.settings["drain_timeout"] + self.settings["graceful_timeout"] + 5
+            for process in self.workers:
+                process.join(timeout)
+                if process.is_alive():
+                    print(f"警告: Web工作进程 {process.pid} 未能按时退出，强制结束。")
+                    process.terminate()
+                    process.join()
+        except Exception as e:
+            self.error = f"Web服务运行失败: {e}"
+        finally:
+            with self._forward_lock:
+                # 未能就绪时，缓存的指令交回桥接器，下次启动再补发
+                buffered, self._startup_buffer = self._startup_buffer, None
+            for item in buffered or ():
+                command_queue.put(item)
+            self.broker.close()
+            if sock is not None:
+                sock.close()
+            self.ready_event.set()
+            if self.error:
+                self.signals.server_error.emit(self.error)
+            self.signals.server_stopped.emit()
+
+    def request_stop(self, drain_timeout: float):
+        """通知所有工作进程排空连接后退出 (不阻塞)"""
+        self.broker.request_shutdown(drain_timeout)
+        self.stop_event.set()
 
 
 class WebServiceManager:
     _instance = None
 
+    # 默认配置，可通过 configure() 修改，下次启动时生效
+    DEFAULT_SETTINGS = {
+        "host": "0.0.0.0",
+        "port": 8000,
+        "loop": "auto",              # 'auto' | 'asyncio' | 'uvloop'
+        "log_level": "info",
+        "per_message_deflate": True,
+        "drain_timeout": 0.5,        # 停止时等待客户端发送队列排空的最长时间 (秒)
+        "graceful_timeout": 2,       # uvicorn 等待未完成HTTP请求的最长时间 (秒)
+        "heartbeat_interval": 15.0,  # 客户端沉默多久后发送 ping (秒)，0 表示关闭心跳
+        "heartbeat_timeout": 10.0,   # ping 之后等待回应、以及单帧写入的最长时间 (秒)，超时即移除连接
+        "workers": 1,                # Web工作进程数；大于1时在独立进程中运行，可利用多个CPU核心
+    }
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(WebServiceManager, cls).__new__(cls)
             cls._instance.thread = None
             cls._instance.command_queue = command_queue
+            cls._instance.settings = dict(cls.DEFAULT_SETTINGS)
+            cls._instance.signals = WebServiceSignals()
         return cls._instance
 
+    def configure(self, **settings):
+        """修改服务配置 (可用的配置项见 DEFAULT_SETTINGS)"""
+        unknown = set(settings) - set(self.DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"未知的Web服务配置项: {', '.join(sorted(unknown))}")
+        self.settings.update(settings)
+
+    @property
+    def per_message_deflate(self):
+        return self.settings["per_message_deflate"]
+
+    @per_message_deflate.setter
+    def per_message_deflate(self, value):
+        self.settings["per_message_deflate"] = value
+
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.isRunning()
+
+    def is_ready(self) -> bool:
+        return self.is_running() and self.thread.ready
+
+    def wait_until_ready(self, timeout: float = 10.0) -> bool:
+        """阻塞等待服务完成端口绑定；启动失败或超时返回 False (供脚本使用，界面请连接 signals.server_ready)"""
+        if self.thread is None:
+            return False
+        self.thread.ready_event.wait(timeout)
+        return self.thread.ready
+
     def start_server(self):
-        """启动Web服务"""
-        if self.thread is None or not self.thread.isRunning():
-            self.thread = WebServerThread()
-            self.thread.start()
-            print("Web服务已在后台启动，地址 http://0.0.0.0:8000")
-            return True
-        print("Web服务已在运行中。")
-        return False
-
-    def stop_server(self):
-        """停止Web服务 (注意: uvicorn的程序化停止比较复杂，这里简化为终止线程)"""
-        if self.thread and self.thread.isRunning():
-            self.thread.terminate()  # 简单粗暴的停止方式
-            self.thread.wait()
+        """启动Web服务 (非阻塞，就绪后发出 signals.server_ready)"""
+        if self.is_running():
+            print("Web服务已在运行中。")
+            return False
+        if self.settings["workers"] > 1:
+            self.thread = MultiWorkerThread(dict(self.settings), self.signals)
+        else:
+            self.thread = WebServerThread(dict(self.settings), self.signals)
+        self.thread.start()
+        print(f"Web服务正在后台启动，地址 {self.thread.url}")
+        return True
+
+    def stop_server(self, wait: bool = True):
+        """
+        优雅地停止Web服务：排空并关闭所有WebSocket连接后退出uvicorn。
+        wait=False 时立即返回，停止完成后发出 signals.server_stopped。
+        """
+        thread = self.thread
+        if thread is None or not thread.isRunning():
+            return
+        thread.request_stop(self.settings["drain_timeout"])
+        if wait:
+            thread.wait()
             self.thread = None
             print("Web服务已停止。")
 
-    def send_command(self, command: dict):
+    def restart_server(self):
+        """停止后立即以当前配置重新启动 (阻塞到旧服务完全退出为止)"""
+        self.stop_server(wait=True)
+        return self.start_server()
+
+    def send_command(self, command: dict, topic=None):
         """
         向Web服务发送指令的统一接口。
         :param command: 一个包含指令类型和数据的字典
+        :param topic: 目标频道，如 'match:A1'、'team:red'、'role:caster' 或 'user:<用户名>'；
+                      也可以是频道列表 (受众取并集)。为 None 时广播给所有连接。
         """
-        self.command_queue.put(command)
-        print(f"已发送指令到Web服务: {command}")
\ No newline at end of file
+        if isinstance(self.thread, MultiWorkerThread):
+            # 多进程部署时经代理扇出给全部工作进程
+            self.thread.put((topic, command))
+        else:
+            self.command_queue.put((topic, command))
+        print(f"已发送指令到Web服务 (频道: {topic or 'all'}): {command}")
@@ -0,0 +1,90 @@
+# 文件名: run_rule_simulation.py
+# 规则集的赛前模拟：随机生成大量比赛，统计各规则 (如加赛图) 的触发频率、比赛轮数和冠军分布
+#
+# 用法示例:
+#   python run_rule_simulation.py --matches 20000
+#   python run_rule_simulation.py --ruleset my_ruleset.json --players 8 --teams 2 --rounds 8 --seed 1
+#   python run_rule_simulation.py --ruleset my_ruleset.json --json > report.json
+
+import argparse
+import json
+import sys
+
+from core.rule_simulator import DEFAULT_POINTS, SimulationConfig, format_report, simulate
+
+# 未指定规则集时使用的示例规则集
+SAMPLE_RULESET = {
+    "id": "sample",
+    "version": 1,
+    "ruleset_name": "示例规则集",
+    "map_selection_rules": [
+        {
+            "comment": "如果第一名掉线，则由第二名选图",
+            "condition": "game_state.get_player_by_rank(1).is_connected == False",
+            "action": {"type": "direct_choice", "who_selects": "game_state.get_player_by_rank(2)"},
+        },
+        {
+            "comment": "最后阶段前两名同分时使用加赛图",
+            "condition": "game_state.round_number >= 6 and "
+                         "game_state.get_player_by_rank(1).total_score == game_state.get_player_by_rank(2).total_score",
+            "action": {"type": "tiebreak_map"},
+        },
+        {
+            "comment": "常规情况：由第一名选图",
+            "condition": "game_state.trigger == 'after_round'",
+            "action": {"type": "direct_choice", "who_selects": "game_state.get_player_by_rank(1)"},
+        },
+    ],
+}
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"必须为正整数: {value}")
+    return number
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="规则集蒙特卡洛模拟")
+    parser.add_argument("--ruleset", default=None, help="规则集JSON文件 (与数据库中 ruleset_json 的格式相同)，默认使用示例规则集")
+    parser.add_argument("--matches", type=positive_int, default=10000, help="模拟的比赛场数")
+    parser.add_argument("--players", type=int, default=8)
+    parser.add_argument("--teams", type=int, default=0, help="队伍数，0 为个人赛")
+    parser.add_argument("--rounds", type=int, default=7, help="常规轮数")
+    parser.add_argument("--target-score", type=int, default=None, help="领先者达到该分数时提前结束")
+    parser.add_argument("--overtime", type=int, default=3, help="第一名并列时最多加赛的轮数")
+    parser.add_argument("--points", default=",".join(map(str, DEFAULT_POINTS)), help="各名次的得分，逗号分隔")
+    parser.add_argument("--skill-spread", type=float, default=1.0, help="选手实力差距 (0 为实力相同)")
+    parser.add_argument("--retire-rate", type=float, default=0.05, help="每轮未完赛的概率")
+    parser.add_argument("--disconnect-rate", type=float, default=0.02, help="选图时处于掉线状态的概率")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认使用全部CPU")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子 (相同种子结果可复现)")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出统计结果")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.ruleset:
+        with open(args.ruleset, "r", encoding="utf-8") as f:
+            ruleset = json.load(f)
+    else:
+        ruleset = SAMPLE_RULESET
+    config = SimulationConfig(
+        players=args.players, teams=args.teams,
+        points=tuple(int(p) for p in args.points.split(",") if p.strip()),
+        max_rounds=args.rounds, target_score=args.target_score, overtime_rounds=args.overtime,
+        skill_spread=args.skill_spread, retire_rate=args.retire_rate, disconnect_rate=args.disconnect_rate,
+    )
+    summary = simulate(ruleset, config, matches=args.matches, workers=args.workers, seed=args.seed)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(f"规则集: {ruleset.get('ruleset_name', '未命名')}")
+        print(format_report(summary))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,7 +2,7 @@
 
 import sys
 import time
-from PyQt6.QtWidgets import QApplication, QWidget, QPushButton, QVBoxLayout
+from PyQt6.QtWidgets import QApplication, QWidget, QPushButton, QVBoxLayout, QLabel
 from core.web_service_manager import WebServiceManager
 from core.auth_manager import AuthManager
 
@@ -23,18 +23,29 @@ class WebDemoApp(QWidget):
         # --- 优化结束 ---
 
         layout = QVBoxLayout(self)
+        self.status_label = QLabel("Web服务未启动")
         self.start_btn = QPushButton("启动Web服务")
         self.stop_btn = QPushButton("停止Web服务")
+        self.restart_btn = QPushButton("重启Web服务")
         self.test_broadcast_btn = QPushButton("发送测试广播")
 
+        layout.addWidget(self.status_label)
         layout.addWidget(self.start_btn)
         layout.addWidget(self.stop_btn)
+        layout.addWidget(self.restart_btn)
         layout.addWidget(self.test_broadcast_btn)
 
-        self.start_btn.clicked.connect(self.web_manager.start_server)
-        self.stop_btn.clicked.connect(self.web_manager.stop_server)
+        # clicked 信号会携带 checked 参数，用 lambda 避免其被当作方法参数传入
+        self.start_btn.clicked.connect(lambda: self.web_manager.start_server())
+        self.stop_btn.clicked.connect(lambda: self.web_manager.stop_server())
+        self.restart_btn.clicked.connect(lambda: self.web_manager.restart_server())
         self.test_broadcast_btn.clicked.connect(self.send_test_message)
 
+        signals = self.web_manager.signals
+        signals.server_ready.connect(lambda url: self.status_label.setText(f"Web服务运行中: {url}"))
+        signals.server_stopped.connect(lambda: self.status_label.setText("Web服务已停止"))
+        signals.server_error.connect(lambda message: self.status_label.setText(f"错误: {message}"))
+
     def send_test_message(self):
         test_command = {
             "type": "broadcast",
@@ -0,0 +1,264 @@
+# 文件名: run_web_loadtest.py
+# Web服务压力测试：模拟 N 名选手登录并连接WebSocket，测量广播送达延迟、吞吐量和服务器内存
+#
+# 用法示例:
+#   python run_web_loadtest.py --clients 50,100,200,500 --broadcasts 50
+#   python run_web_loadtest.py --clients 300 --format json-bin --max-p99-ms 50   (赛前回归，超标时返回非零退出码)
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# 压测数据库放在系统临时目录，不写入项目的 data 目录 (账号会在多次运行之间复用)
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), 'competition_web_loadtest.db')
+ACCOUNT_PREFIX = "loadtest_"
+ACCOUNT_PASSWORD = "LoadTest12345"
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def current_rss_mb():
+    """当前进程 (即Web服务所在进程) 的常驻内存，单位MB"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 / 1024
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+# --- 模拟客户端 (运行在独立进程中，避免与服务端争抢GIL) ---
+
+async def _client_session(url, ready_counter, start_event, end_marker, results, deadline):
+    import websockets
+
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=30) as ws:
+            ready_counter.append(1)
+            await start_event.wait()
+            while time.time() < deadline:
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), timeout=max(0.1, deadline - time.time()))
+                except asyncio.TimeoutError:
+                    break
+                received_at = time.time()
+                if isinstance(raw, bytes):
+                    # 压测客户端只解析 json-bin 帧 (首字节为类型标记)
+                    raw = raw[1:]
+                message = json.loads(raw)
+                if message.get("type") == "ping":
+                    await ws.send(json.dumps({"action": "pong"}))
+                elif message.get("type") == "load_probe":
+                    results.append((received_at - message["sent_at"]) * 1000)
+                elif message.get("type") == end_marker:
+                    break
+    except Exception as e:
+        results.append(e)
+
+
+def _client_worker(urls, ready_queue, go_event, result_queue, timeout):
+    """子进程入口：建立分配到的全部连接，等待开始信号，收集探针消息的送达延迟"""
+
+    async def main():
+        ready, results = [], []
+        start_event = asyncio.Event()
+        deadline = time.time() + timeout
+        tasks = [asyncio.create_task(_client_session(url, ready, start_event, "load_probe_end", results, deadline))
+                 for url in urls]
+        while len(ready) < len(urls) and time.time() < deadline and not all(t.done() for t in tasks):
+            await asyncio.sleep(0.05)
+        ready_queue.put(len(ready))
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, go_event.wait)
+        start_event.set()
+        await asyncio.gather(*tasks)
+        errors = [r for r in results if isinstance(r, Exception)]
+        latencies = [r for r in results if not isinstance(r, Exception)]
+        result_queue.put((latencies, len(errors), repr(errors[0]) if errors else ""))
+
+    asyncio.run(main())
+
+
+# --- 主流程 ---
+
+def ensure_accounts(auth_manager, count):
+    created = 0
+    for i in range(count):
+        username = f"{ACCOUNT_PREFIX}{i:04d}"
+        if not auth_manager.db.get_account_by_username(username):
+            auth_manager.create_account(username, ACCOUNT_PASSWORD)
+            created += 1
+    return created
+
+
+def login_all(base_url, count, concurrency=8):
+    def login(i):
+        data = urllib.parse.urlencode({"username": f"{ACCOUNT_PREFIX}{i:04d}", "password": ACCOUNT_PASSWORD}).encode()
+        start = time.perf_counter()
+        with urllib.request.urlopen(f"{base_url}/login", data=data, timeout=60) as resp:
+            result = json.loads(resp.read())
+        elapsed = (time.perf_counter() - start) * 1000
+        if result.get("status") != "success":
+            raise RuntimeError(f"账号 {i} 登录失败: {result}")
+        return result["token"], elapsed
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(login, range(count)))
+    return [token for token, _ in results], [elapsed for _, elapsed in results]
+
+
+def run_step(args, web_manager, tokens, n):
+    ctx = multiprocessing.get_context("spawn")
+    query = urllib.parse.urlencode({"format": args.format, **({"topics": args.topic} if args.topic else {})})
+    urls = [f"ws://{args.host}:{args.port}/ws/{token}?{query}" for token in tokens[:n]]
+    worker_count = max(1, min(args.processes, n))
+    chunks = [urls[i::worker_count] for i in range(worker_count)]
+
+    ready_queue, result_queue, go_event = ctx.Queue(), ctx.Queue(), ctx.Event()
+    timeout = args.broadcasts * args.interval + 60
+    workers = [ctx.Process(target=_client_worker, args=(chunk, ready_queue, go_event, result_queue, timeout))
+               for chunk in chunks]
+    for w in workers:
+        w.start()
+    connected = sum(ready_queue.get(timeout=timeout) for _ in workers)
+    time.sleep(0.5)  # 等待服务端完成订阅登记
+    rss_idle = current_rss_mb()
+
+    go_event.set()
+    time.sleep(0.2)
+    topic = args.topic or None
+    first_send = time.time()
+    for seq in range(args.broadcasts):
+        web_manager.send_command({"type": "load_probe", "seq": seq, "sent_at": time.time(),
+                                  "payload": "x" * args.payload}, topic)
+        time.sleep(args.interval)
+    rss_peak = current_rss_mb()
+    web_manager.send_command({"type": "load_probe_end"}, topic)
+
+    latencies, errors, first_error = [], 0, ""
+    for _ in workers:
+        worker_latencies, worker_errors, worker_first_error = result_queue.get(timeout=timeout)
+        latencies.extend(worker_latencies)
+        errors += worker_errors
+        first_error = first_error or worker_first_error
+    elapsed = time.time() - first_send
+    for w in workers:
+        w.join()
+
+    expected = connected * args.broadcasts
+    return {
+        "clients": n,
+        "connected": connected,
+        "delivered": len(latencies),
+        "expected": expected,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies) if latencies else float("nan"),
+        "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "rss_idle": rss_idle,
+        "rss_peak": rss_peak,
+        "errors": errors,
+        "first_error": first_error,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Web服务WebSocket压力测试")
+    parser.add_argument("--clients", default="50,100,200", help="逐级测试的客户端数量，逗号分隔")
+    parser.add_argument("--broadcasts", type=int, default=50, help="每一级发送的广播数量")
+    parser.add_argument("--interval", type=float, default=0.05, help="广播间隔 (秒)")
+    parser.add_argument("--payload", type=int, default=256, help="每条广播附带的填充字节数")
+    parser.add_argument("--format", default="json", choices=["json", "json-bin"], help="客户端协商的帧格式")
+    parser.add_argument("--topic", default="", help="发布到的频道 (客户端同时订阅)，默认全体广播")
+    parser.add_argument("--processes", type=int, default=max(1, min(4, (os.cpu_count() or 2) - 1)),
+                        help="承载模拟客户端的进程数")
+    parser.add_argument("--workers", type=int, default=1, help="Web工作进程数 (大于1时内存一栏只统计桌面进程)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="压测使用的独立数据库 (账号会被复用)")
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="p99延迟上限，超出时以非零状态退出")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    steps = sorted({int(n) for n in args.clients.split(",") if n.strip()})
+
+    # 必须在导入Web服务之前初始化压测数据库，否则单例会指向正式数据库
+    from core.db_manager import DBManager
+    DBManager(args.db)
+    from core.auth_manager import AuthManager
+    from core.web_service_manager import WebServiceManager
+
+    auth_manager = AuthManager()
+    print_header("准备压测账号")
+    start = time.perf_counter()
+    created = ensure_accounts(auth_manager, max(steps))
+    print(f"- 新建 {created} 个账号，耗时 {time.perf_counter() - start:.1f} s")
+
+    web_manager = WebServiceManager()
+    web_manager.configure(host=args.host, port=args.port, log_level="warning", workers=args.workers)
+    web_manager.start_server()
+    failed = False
+    try:
+        if not web_manager.wait_until_ready(30):
+            print("❌ Web服务未能在规定时间内启动。")
+            return 1
+        base_url = f"http://{args.host}:{args.port}"
+
+        print_header(f"登录 {max(steps)} 个账号 (/login)")
+        tokens, login_ms = login_all(base_url, max(steps))
+        print(f"- 登录耗时 p50 {percentile(login_ms, 50):.1f} ms，p99 {percentile(login_ms, 99):.1f} ms")
+
+        print_header("广播送达延迟")
+        print(f"{'客户端':>6} {'已连接':>6} {'送达率':>8} {'p50(ms)':>9} {'p99(ms)':>9} {'最大(ms)':>9} "
+              f"{'吞吐(条/s)':>11} {'内存(MB)':>16}")
+        for n in steps:
+            result = run_step(args, web_manager, tokens, n)
+            ratio = result["delivered"] / result["expected"] if result["expected"] else 0.0
+            print(f"{result['clients']:>6} {result['connected']:>6} {ratio:>8.1%} {result['p50']:>9.2f} "
+                  f"{result['p99']:>9.2f} {result['max']:>9.2f} {result['throughput']:>11.0f} "
+                  f"{result['rss_idle']:>7.1f} -> {result['rss_peak']:<7.1f}")
+            if result["errors"]:
+                print(f"  > {result['errors']} 个连接出错，例如: {result['first_error']}")
+            if args.max_p99_ms is not None and not result["p99"] <= args.max_p99_ms:
+                print(f"  > ❌ p99 超出上限 {args.max_p99_ms} ms")
+                failed = True
+            if ratio < 1.0:
+                failed = True
+            time.sleep(1.0)  # 让服务端清理上一轮的连接
+    finally:
+        web_manager.stop_server()
+        DBManager().close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
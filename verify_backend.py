@@ -122,6 +122,16 @@ def run_verification():
         auth_manager.invalidate_session_token(token)
         token_invalidated = auth_manager.verify_session_token(token) is None
         print_result("使会话令牌失效后再次验证", token_invalidated)
+
+        # 模拟一个超过有效期的令牌：查询时视为无效，下次登录时从数据库中删除
+        db = DBManager()
+        db.conn.execute("INSERT INTO sessions (token, username, created_at) VALUES (?, ?, datetime('now', ?))",
+                        ("expired_token", "player_alpha", f"-{DBManager.SESSION_TTL + 60} seconds"))
+        db.conn.commit()
+        print_result("过期的会话令牌验证失败", auth_manager.verify_session_token("expired_token") is None)
+        fresh = auth_manager.generate_session_token("player_alpha")
+        remaining = [row["token"] for row in db.conn.execute("SELECT token FROM sessions")]
+        print_result("登录时清理过期的会话令牌", remaining == [fresh], f"剩余令牌数: {len(remaining)}")
     else:
         print("因为密码验证失败，跳过令牌流程测试。")
 
@@ -0,0 +1,181 @@
+# 文件名: verify_map_draw.py
+# 验证地图抽取引擎：树状数组的正确性、按权重抽取的分布、不放回与间隔排除、主题不连续、正反向视为同一赛道、
+# 固定种子可复现、由数据库中的地图池创建 (按难度和历史被选次数设置权重)，以及大地图池上的抽取耗时
+
+import os
+import random
+import time
+from collections import Counter
+
+from core.db_manager import DBManager
+from core.map_draw import (MapDrawEngine, MapEntry, _FenwickTree, combine_weights, weight_by_difficulty,
+                           weight_by_pick_history)
+
+TEST_DB_PATH = 'data/verification_map_draw.db'
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def cleanup():
+    if DBManager._instance is not None:
+        DBManager._instance.close()
+        DBManager._instance = None
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(TEST_DB_PATH + suffix):
+            os.remove(TEST_DB_PATH + suffix)
+
+
+def build_pool(themes=6, per_theme=5, reverse=True):
+    entries = []
+    for t in range(themes):
+        for m in range(per_theme):
+            map_id = f"theme{t}_R{m:02d}"
+            entries.append(MapEntry(map_id, difficulty=m % 3 + 1))
+            if reverse and m % 2 == 0:
+                entries.append(MapEntry(map_id + "_rvs", difficulty=m % 3 + 1))
+    return entries
+
+
+def run_verification():
+    rng = random.Random(50)
+
+    print_header("树状数组")
+    values = [rng.randint(0, 9) for _ in range(37)]
+    tree = _FenwickTree(values)
+    errors = 0
+    for _ in range(500):
+        i = rng.randrange(len(values))
+        values[i] = rng.randint(0, 9)
+        tree.set(i, values[i])
+        end = rng.randint(0, len(values))
+        errors += tree.prefix(end) != sum(values[:end])
+        if sum(values):
+            target = rng.randrange(sum(values))
+            expected = next(j for j in range(len(values)) if sum(values[:j + 1]) > target)
+            errors += tree.find(target) != expected
+    print_result("随机修改后的前缀和与查找与逐项计算一致", errors == 0, f"不一致 {errors} 次")
+
+    print_header("按权重抽取的分布")
+    entries = [MapEntry(f"t{i}_R01") for i in range(4)]
+    engine = MapDrawEngine(entries, weight=lambda e: int(e.theme[1:]) + 1, seed=1, repeat_gap=0,
+                           avoid_same_theme=False)
+    draws = 40000
+    counts = Counter(engine.draw_many(draws))
+    shares = [counts[f"t{i}_R01"] / draws for i in range(4)]
+    expected = [0.1, 0.2, 0.3, 0.4]
+    print_result("各地图被抽中的比例与权重成正比", all(abs(s - e) < 0.01 for s, e in zip(shares, expected)),
+                 " / ".join(f"{s:.3f}" for s in shares))
+    zero = MapDrawEngine([MapEntry("a_R01"), MapEntry("b_R01")], weight=lambda e: 0 if e.theme == "a" else 1,
+                         seed=1, repeat_gap=0)
+    print_result("权重为 0 的地图不会被抽到", set(zero.draw_many(200)) == {"b_R01"})
+
+    print_header("不放回与排除规则")
+    pool = build_pool()
+    engine = MapDrawEngine(pool, seed=2, link_reverse=False, avoid_same_theme=False)
+    drawn = engine.draw_many(len(pool))
+    print_result("不放回：抽完整个地图池恰好每张一次", sorted(drawn) == sorted(e.display_id for e in pool))
+    try:
+        engine.draw()
+        print_result("抽完后再抽取时报错", False)
+    except LookupError as e:
+        print_result("抽完后再抽取时报错", True, str(e))
+    engine.reset()
+    print_result("reset 后可以重新抽取", len(engine.draw_many(len(pool))) == len(pool))
+
+    gap = 8
+    engine = MapDrawEngine(pool, seed=3, repeat_gap=gap)
+    drawn = engine.draw_many(5000)
+    tracks = [d.replace("_rvs", "") for d in drawn]
+    repeats = sum(1 for i, track in enumerate(tracks) if track in tracks[max(0, i - gap):i])
+    same_theme = sum(1 for a, b in zip(drawn, drawn[1:]) if a.split("_")[0] == b.split("_")[0])
+    print_result(f"同一赛道 (含正反向) 在 {gap} 次抽取内不重复", repeats == 0, f"重复 {repeats} 次")
+    print_result("相邻两次不是同一主题", same_theme == 0, f"相邻同主题 {same_theme} 次")
+    print_result("间隔过后地图会恢复", len(set(drawn)) == len(pool), f"{len(set(drawn))}/{len(pool)} 张被抽到过")
+    single_theme = MapDrawEngine([MapEntry("a_R01"), MapEntry("a_R02")], seed=4)
+    print_result("只剩一个主题时放宽主题限制", sorted(single_theme.draw_many(2)) == ["a_R01", "a_R02"])
+
+    engine = MapDrawEngine(pool, seed=5, repeat_gap=0)
+    engine.ban("theme0_R00")
+    engine.ban("theme0_R00_rvs")
+    banned = "theme0_R00" in [d.replace("_rvs", "") for d in engine.draw_many(2000)]
+    engine.unban("theme0_R00")
+    print_result("禁用的地图不会被抽到，解除后恢复",
+                 not banned and "theme0_R00" in engine.draw_many(2000))
+
+    print_header("固定种子可复现")
+    first = MapDrawEngine(pool, weight=weight_by_difficulty({1: 1, 2: 2, 3: 4}), seed=42, repeat_gap=4).draw_many(50)
+    second = MapDrawEngine(pool, weight=weight_by_difficulty({1: 1, 2: 2, 3: 4}), seed=42, repeat_gap=4).draw_many(50)
+    other = MapDrawEngine(pool, weight=weight_by_difficulty({1: 1, 2: 2, 3: 4}), seed=43, repeat_gap=4).draw_many(50)
+    print_result("相同种子得到相同的抽取顺序", first == second)
+    print_result("不同种子得到不同的抽取顺序", first != other)
+
+    print_header("由数据库中的地图池创建")
+    db = DBManager(TEST_DB_PATH)
+    db.save_maps_batch([{"id": f"forest_I{i:02d}", "difficulty": i % 3 + 1, "translations": {"cn": f"森林{i}"}}
+                        for i in range(1, 5)] +
+                       [{"id": f"village_R{i:02d}", "difficulty": 1, "translations": {"cn": f"城镇{i}"}}
+                        for i in range(1, 5)])
+    pool_ids = [f"forest_I{i:02d}" for i in range(1, 5)] + ["forest_I01_rvs"] + [f"village_R{i:02d}" for i in range(1, 5)]
+    db.save_map_pool("决赛", pool_ids)
+    # village_R01 在历史比赛中被选了很多次
+    for round_number in range(1, 31):
+        db.save_match_round("历史比赛", None, {"round": round_number, "results": {"p1": 1}, "awarded": {"p1": 10},
+                                               "map_id": "village_R01"})
+    engine = MapDrawEngine.from_pool(db, "决赛", weight=combine_weights(weight_by_difficulty({3: 3}),
+                                                                      weight_by_pick_history()),
+                                     seed=6, repeat_gap=0, avoid_same_theme=False)
+    by_id = {entry.display_id: entry for entry in engine.entries}
+    print_result("主题、难度和被选次数取自数据库",
+                 by_id["forest_I02"].theme == "forest" and by_id["forest_I02"].difficulty == 3
+                 and by_id["village_R01"].picks == 30 and by_id["forest_I01_rvs"].difficulty == 2)
+    counts = Counter(engine.draw_many(20000))
+    print_result("常被选的地图更少被抽到，高难度地图更常被抽到",
+                 counts["village_R01"] < counts["village_R02"] / 10 and counts["forest_I02"] > counts["village_R02"] * 2,
+                 f"village_R01 {counts['village_R01']}, village_R02 {counts['village_R02']}, forest_I02 {counts['forest_I02']}")
+    try:
+        MapDrawEngine.from_pool(db, "不存在的地图池")
+        print_result("不存在的地图池报错", False)
+    except ValueError:
+        print_result("不存在的地图池报错", True)
+
+    print_header("大地图池上的抽取耗时 (5000 张地图, 间隔 50 次, 主题不连续)")
+    big = [MapEntry(f"theme{i % 40}_R{i:04d}", difficulty=i % 5 + 1) for i in range(5000)]
+    weight = weight_by_difficulty({1: 1, 2: 2, 3: 3, 4: 4, 5: 5})
+    draws = 5000
+    engine = MapDrawEngine(big, weight=weight, seed=7, repeat_gap=50)
+    start = time.perf_counter()
+    engine.draw_many(draws)
+    tree_time = (time.perf_counter() - start) / draws * 1e6
+
+    # 对照：每次抽取都重新筛选候选地图、重建权重列表
+    naive_rng = random.Random(7)
+    history = []
+    start = time.perf_counter()
+    for _ in range(draws):
+        recent = set(history[-50:])
+        last_theme = history[-1].split("_")[0] if history else None
+        candidates = [e for e in big if e.display_id not in recent and e.theme != last_theme]
+        choice = naive_rng.choices(candidates, weights=[weight(e) for e in candidates])[0]
+        history.append(choice.display_id)
+    naive_time = (time.perf_counter() - start) / draws * 1e6
+    print(f"- 树状数组: {tree_time:.1f} us/次, 每次重建候选列表: {naive_time:.1f} us/次")
+    print_result("树状数组抽取更快", tree_time * 10 < naive_time, f"快 {naive_time / tree_time:.0f} 倍")
+
+
+if __name__ == '__main__':
+    cleanup()
+    try:
+        run_verification()
+    finally:
+        cleanup()
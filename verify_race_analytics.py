@@ -0,0 +1,233 @@
+# 文件名: verify_race_analytics.py
+# 验证逐轮成绩的规范化表和地图/选手统计汇总：写入成绩时增量更新、更正成绩后扣回、从 match_history 重新生成，
+# 多个线程同时写入时统计不偏离，以及数万轮比赛时统计查询的耗时
+
+import json
+import os
+import random
+import threading
+import time
+
+from core.db_manager import DBManager
+from core.scoring_engine import PointsTable, ScoringEngine
+
+TEST_DB_PATH = 'data/verification_analytics.db'
+BULK_RACES = 20000
+MAPS = [f"village_R{i:02d}" for i in range(1, 31)]
+PLAYERS = [f"p{i:02d}" for i in range(1, 41)]
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def cleanup():
+    if DBManager._instance is not None:
+        DBManager._instance.close()
+        DBManager._instance = None
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(TEST_DB_PATH + suffix):
+            os.remove(TEST_DB_PATH + suffix)
+
+
+def random_race(rng, players, points):
+    order = list(players)
+    rng.shuffle(order)
+    results = {player_id: (None if rng.random() < 0.08 else position) for position, player_id in enumerate(order, 1)}
+    base = rng.uniform(80, 140)
+    times = {player_id: round(base + position * rng.uniform(0.1, 2.0), 3)
+             for player_id, position in results.items() if position is not None}
+    return results, times, {player_id: points.points_for(position) for player_id, position in results.items()}
+
+
+def reference_stats(races):
+    """对照实现：races 为 {(比赛, 轮次): (地图, 名次, 用时, 得分)}，直接遍历全部成绩计算"""
+    maps, players = {}, {}
+    total = 0
+    for map_id, results, times, awarded in races.values():
+        total += 1
+        m = maps.setdefault(map_id, {"races": 0, "entries": 0, "finishes": 0, "positions": 0, "times": []})
+        m["races"] += 1
+        for player_id, position in results.items():
+            p = players.setdefault(player_id, {"races": 0, "wins": 0, "finishes": 0, "positions": 0, "points": 0})
+            p["races"] += 1
+            p["points"] += awarded[player_id]
+            m["entries"] += 1
+            if position is not None:
+                p["finishes"] += 1
+                p["positions"] += position
+                p["wins"] += position == 1
+                m["finishes"] += 1
+                m["positions"] += position
+            if player_id in times:
+                m["times"].append(times[player_id])
+    return total, maps, players
+
+
+def close(a, b):
+    return (a is None and b is None) or (a is not None and b is not None and abs(a - b) < 1e-6)
+
+
+def compare(db, races):
+    """比较汇总表的查询结果与对照实现，返回不一致的条目数"""
+    total, maps, players = reference_stats(races)
+    mismatches = 0
+    map_stats = {row["map_id"]: row for row in db.get_map_stats()}
+    mismatches += set(map_stats) != set(maps)
+    for map_id, m in maps.items():
+        row = map_stats.get(map_id)
+        if row is None:
+            continue
+        mismatches += not (row["races"] == m["races"] and close(row["pick_rate"], m["races"] / total)
+                           and close(row["average_position"], m["positions"] / m["finishes"] if m["finishes"] else None)
+                           and close(row["finish_rate"], m["finishes"] / m["entries"])
+                           and close(row["average_time"], sum(m["times"]) / len(m["times"]) if m["times"] else None)
+                           and close(row["best_time"], min(m["times"]) if m["times"] else None))
+    player_stats = {row["player_id"]: row for row in db.get_player_stats()}
+    mismatches += set(player_stats) != set(players)
+    for player_id, p in players.items():
+        row = player_stats.get(player_id)
+        if row is None:
+            continue
+        mismatches += not (row["races"] == p["races"] and row["wins"] == p["wins"] and row["points"] == p["points"]
+                           and close(row["win_rate"], p["wins"] / p["races"])
+                           and close(row["average_position"], p["positions"] / p["finishes"] if p["finishes"] else None))
+    return mismatches
+
+
+def run_verification():
+    db = DBManager(TEST_DB_PATH)
+    rng = random.Random(49)
+    points = PointsTable()
+
+    print_header("写入成绩时增量更新统计")
+    races = {}
+    engine = ScoringEngine("小组赛A", points, db=db)
+    group = PLAYERS[:8]
+    for player_id in group:
+        engine.add_player(player_id, f"选手{player_id}")
+    for round_number in range(1, 41):
+        map_id = rng.choice(MAPS[:6])
+        results, times, awarded = random_race(rng, group, points)
+        engine.record_round(round_number, results, map_id=map_id, times=times)
+        races[("小组赛A", round_number)] = (map_id, results, times, awarded)
+    mismatches = compare(db, races)
+    print_result("地图和选手统计与逐条计算一致", mismatches == 0, f"不一致 {mismatches} 项")
+    count = db.conn.execute("SELECT COUNT(*) FROM race_results").fetchone()[0]
+    print_result("规范化成绩表每名选手每轮一行", count == 40 * len(group), f"{count} 行")
+
+    print_header("更正成绩")
+    fastest_map = min(db.get_map_stats(), key=lambda row: row["best_time"])
+    # 更正最佳用时所在的那一轮：最佳用时需要重新查询
+    best_round = next(key[1] for key, (map_id, _, times, _) in races.items()
+                      if map_id == fastest_map["map_id"] and times and min(times.values()) == fastest_map["best_time"])
+    results, times, awarded = random_race(rng, group, points)
+    times = {player_id: t + 50 for player_id, t in times.items()}
+    new_map = MAPS[7]
+    engine.record_round(best_round, results, map_id=new_map, times=times)
+    races[("小组赛A", best_round)] = (new_map, results, times, awarded)
+    mismatches = compare(db, races)
+    print_result("更正后统计 (含最佳用时和地图变更) 与逐条计算一致", mismatches == 0, f"不一致 {mismatches} 项")
+    per_map = db.get_player_map_stats(group[0])
+    expected_races = sum(1 for map_id, results, _, _ in races.values() if group[0] in results)
+    print_result("选手在各地图上的统计", sum(row["races"] for row in per_map) == expected_races,
+                 f"{per_map[0]}")
+
+    print_header("多个线程同时写入")
+    # Web服务的线程池会在同一个连接上同时写入地图池、账号等；一轮成绩的多张表必须一起提交
+    errors = []
+    lock = threading.Lock()
+
+    def record_match(t):
+        try:
+            local_rng = random.Random(t)
+            match = ScoringEngine(f"并发赛{t}", points, db=db)
+            for player_id in group:
+                match.add_player(player_id, f"选手{player_id}")
+            for round_number in range(1, 26):
+                map_id = local_rng.choice(MAPS)
+                results, times, awarded = random_race(local_rng, group, points)
+                match.record_round(round_number, results, map_id=map_id, times=times)
+                with lock:
+                    races[(f"并发赛{t}", round_number)] = (map_id, results, times, awarded)
+        except Exception as e:
+            errors.append(repr(e))
+
+    def other_writes(t):
+        try:
+            for i in range(25):
+                db.save_map_pool(f"并发地图池{t}", MAPS[:i + 1])
+                db.create_account(f"analytics_{t}_{i}", "hash", "salt")
+        except Exception as e:
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=target, args=(t,)) for t in range(4) for target in (record_match, other_writes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print_result("并发写入没有出错", not errors, errors[0] if errors else "")
+    mismatches = compare(db, races)
+    print_result("并发写入后统计与逐条计算一致", mismatches == 0 and not db.conn.in_transaction,
+                 f"不一致 {mismatches} 项")
+
+    print_header(f"从 match_history 重新生成 ({BULK_RACES} 轮)")
+    # 模拟导入旧数据：直接写入 match_history，再统一生成规范化表和统计汇总
+    rows = []
+    for i in range(BULK_RACES):
+        match_name = f"公开赛{i // 10}"
+        round_number = i % 10 + 1
+        map_id = rng.choice(MAPS)
+        entrants = rng.sample(PLAYERS, 8)
+        results, times, awarded = random_race(rng, entrants, points)
+        races[(match_name, round_number)] = (map_id, results, times, awarded)
+        rows.append((match_name, json.dumps({"round": round_number, "results": results, "awarded": awarded,
+                                             "map_id": map_id, "times": times})))
+    db.conn.executemany("INSERT INTO match_history (match_name, result_json) VALUES (?, ?)", rows)
+    db.conn.commit()
+    start = time.perf_counter()
+    count = db.rebuild_race_analytics()
+    elapsed = time.perf_counter() - start
+    print_result("重新生成全部轮次 (更正过的轮次只算一次)", count == len(races), f"{count} 轮, 耗时 {elapsed:.2f} s")
+    mismatches = compare(db, races)
+    print_result("重新生成后的统计与逐条计算一致", mismatches == 0, f"不一致 {mismatches} 项")
+    results, times, awarded = random_race(rng, group, points)
+    engine.record_round(41, results, map_id=MAPS[0], times=times)
+    races[("小组赛A", 41)] = (MAPS[0], results, times, awarded)
+    print_result("重新生成后继续增量更新 (触发器已恢复)", compare(db, races) == 0)
+
+    print_header("统计查询的耗时")
+    timings = {}
+    for name, query in (("全部地图", db.get_map_stats), ("全部选手", db.get_player_stats),
+                        ("单个选手的各地图", lambda: db.get_player_map_stats(PLAYERS[0]))):
+        start = time.perf_counter()
+        for _ in range(20):
+            query()
+        timings[name] = (time.perf_counter() - start) / 20 * 1000
+        print(f"- {name}: {timings[name]:.2f} ms")
+    print_result("每个查询都在毫秒级完成", max(timings.values()) < 10)
+    start = time.perf_counter()
+    reference_stats(races)
+    scan = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for row in db.conn.execute("SELECT result_json FROM match_history"):
+        json.loads(row["result_json"])
+    parse = (time.perf_counter() - start) * 1000
+    print(f"- 对照：逐行解析 result_json {parse:.0f} ms，再在 Python 中汇总 {scan:.0f} ms")
+
+
+if __name__ == '__main__':
+    cleanup()
+    try:
+        run_verification()
+    finally:
+        cleanup()
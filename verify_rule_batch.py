@@ -0,0 +1,140 @@
+# 文件名: verify_rule_batch.py
+# 验证规则的批量 (向量化) 求值：对随机生成的比赛状态，evaluate_batch 的结果与逐个求值一致 (含找不到选手、类型不同、无法向量化等情况)，并报告批量求值的加速比
+
+import contextlib
+import io
+import random
+import time
+
+from core.rule_engine import GameState, PlayerState, RuleEngine
+from core.rule_vectorizer import StateBatch
+
+STATES = 3000
+
+CONDITIONS = [
+    # (条件, 是否应当可以向量化)
+    ("game_state.get_player_by_rank(1).is_connected == False", True),
+    ("game_state.round_number >= 6 and game_state.get_player_by_rank(1).total_score == game_state.get_player_by_rank(2).total_score", True),
+    ("game_state.get_player_by_rank(7).total_score > 40 or game_state.mode == 'team'", True),
+    ("not game_state.get_player_by_id('p6').is_connected", True),
+    ("game_state.get_player_by_name('选手3') is None", True),
+    ("game_state.players[-1].rank == len(game_state.players) and game_state.players[0].total_score > 30", True),
+    ("10 < game_state.get_player_by_rank(1).total_score - game_state.get_player_by_rank(2).total_score < 16", True),
+    ("game_state.get_team_total('red') - game_state.get_team_total('blue') > 25", True),
+    ("len([p for p in game_state.players if not p.is_connected or p.total_score < game_state.round_number * 2]) >= 3", True),
+    ("(game_state.round_number if game_state.trigger == 'after_round' else -game_state.round_number) == 9", True),
+    ("game_state.mode == 1", True),
+    # 字符串与整数比较大小会抛出 TypeError：向量化求值出错时整条规则改为逐个求值
+    ("game_state.mode < 3 or game_state.round_number == 12", True),
+    ("max([p.total_score for p in game_state.players]) > 55", False),
+    ("game_state.get_winning_team() == 'blue' and game_state.round_number > 8", False),
+    ("any([p.name.startswith('选手8') and p.rank == 2 for p in game_state.players])", False),
+    ("game_state.trigger == 'after_round'", True),
+]
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def build_ruleset():
+    rules = [{"comment": f"规则 {i}", "condition": condition, "action": {"type": "rule", "index": i}}
+             for i, (condition, _) in enumerate(CONDITIONS)]
+    rules.insert(3, {"comment": "没有条件的规则", "action": {"type": "skip"}})
+    return {"id": 45, "version": 1, "ruleset_name": "批量求值规则集", "map_selection_rules": rules}
+
+
+def random_state(rng):
+    count = rng.choice([0, 1, 2, 4, 6, 8, 8, 8])
+    scores = sorted((rng.randint(0, 70) for _ in range(count)), reverse=True)
+    players = []
+    for i, score in enumerate(scores):
+        # 偶尔出现重复的排名，检查 "取第一个匹配项" 的语义
+        rank = i + 1 if rng.random() > 0.05 else max(1, i)
+        players.append(PlayerState(f"p{i + 1}", f"选手{i + 1}", rank, score,
+                                   rng.random() > 0.2, rng.choice(["red", "blue", None])))
+    rng.shuffle(players)
+    return GameState(rng.randint(1, 12), rng.choice(['individual', 'team']), players,
+                     rng.choice(['after_round', 'before_round']))
+
+
+def run_verification():
+    engine = RuleEngine()
+    ruleset = build_ruleset()
+    rules = ruleset["map_selection_rules"]
+
+    print_header("向量化子集")
+    wrong = [condition for condition, expected in CONDITIONS
+             if (engine._vectorized(engine.compile_condition(condition)) is not None) != expected]
+    print_result("条件被正确地划分为可向量化/逐个求值", not wrong, "; ".join(wrong))
+
+    print_header(f"{STATES} 个随机比赛状态")
+    rng = random.Random(45)
+    states = [random_state(rng) for _ in range(STATES)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        expected = []
+        for state in states:
+            rule = engine.match_rule(ruleset, state)
+            expected.append(rules.index(rule) if rule is not None else -1)
+        sequential_s = time.perf_counter() - start
+        start = time.perf_counter()
+        batched = engine.evaluate_batch(ruleset, states).tolist()
+        batch_s = time.perf_counter() - start
+        batch = StateBatch.from_states(states)
+        start = time.perf_counter()
+        prebuilt = engine.evaluate_batch(ruleset, batch).tolist()
+        prebuilt_s = time.perf_counter() - start
+    mismatches = sum(a != b for a, b in zip(expected, batched))
+    print_result("每个状态匹配到的规则与逐个求值一致", mismatches == 0, f"{STATES - mismatches}/{STATES}")
+    print_result("由 StateBatch 直接求值结果相同", prebuilt == batched)
+    hits = {i: expected.count(i) for i in sorted(set(expected))}
+    print(f"- 各规则匹配的状态数: {hits}")
+    print_result("多数规则都有状态命中 (覆盖各种情况)", len(hits) >= 10)
+
+    print_header("由数组构造的批次")
+    row = next(i for i, s in enumerate(states) if len(s.players) == 8)
+    arrays = StateBatch(batch.game, batch.players, batch.count)
+    print_result("按需生成的 GameState 与原状态相等", arrays.game_state(row) == states[row])
+    with contextlib.redirect_stdout(io.StringIO()):
+        from_arrays = engine.evaluate_batch(ruleset, arrays).tolist()
+    print_result("逐个求值的条件使用生成的 GameState，结果一致", from_arrays == batched)
+
+    print_header("空批次")
+    empty = StateBatch.from_states([])
+    print_result("空批次的选手列为 (0, 0) 的二维数组",
+                 len(empty) == 0 and all(column.shape == (0, 0) for column in empty.players.values()))
+    print_result("对空列表和空批次求值返回空结果",
+                 engine.evaluate_batch(ruleset, []).shape == (0,) and engine.evaluate_batch(ruleset, empty).shape == (0,))
+
+    print_header("耗时")
+    print(f"- 逐个求值: {sequential_s * 1000:.1f} ms")
+    print(f"- 批量求值 (含构造 StateBatch): {batch_s * 1000:.1f} ms")
+    print(f"- 批量求值 (已有 StateBatch): {prebuilt_s * 1000:.1f} ms")
+
+    vector_only = {"id": 4501, "version": 1, "map_selection_rules": [
+        rule for rule in rules if rule.get("condition") and
+        engine._vectorized(engine.compile_condition(rule["condition"])) is not None]}
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for state in states:
+            engine.match_rule(vector_only, state)
+        sequential_s = time.perf_counter() - start
+        start = time.perf_counter()
+        engine.evaluate_batch(vector_only, batch)
+        prebuilt_s = time.perf_counter() - start
+    print_result("全部条件可向量化时批量求值更快", prebuilt_s < sequential_s,
+                 f"逐个 {sequential_s * 1000:.1f} ms，批量 {prebuilt_s * 1000:.1f} ms，加速 {sequential_s / prebuilt_s:.0f} 倍")
+
+
+if __name__ == '__main__':
+    run_verification()
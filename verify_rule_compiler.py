@@ -0,0 +1,129 @@
+# 文件名: verify_rule_compiler.py
+# 验证规则条件的原生编译：结果与 asteval 一致、子集之外的表达式回退到 asteval、危险表达式不会被原生执行，并报告每秒可模拟的决策次数
+
+import contextlib
+import io
+import time
+
+from core.rule_engine import GAME_STATE_METHODS, GameState, PlayerState, RuleEngine
+
+RULE_COUNT = 50
+SIMULATIONS = 2000
+
+EXPRESSIONS = [
+    "game_state.trigger == 'after_round'",
+    "game_state.get_player_by_rank(1).is_connected == False",
+    "game_state.round_number >= 3 and game_state.mode == 'individual'",
+    "not game_state.get_player_by_rank(2).is_connected or game_state.round_number % 2 == 0",
+    "game_state.get_player_by_rank(1).total_score - game_state.get_player_by_rank(2).total_score > 15",
+    "len([p for p in game_state.players if p.is_connected]) >= 3",
+    "any([p.total_score > 95 for p in game_state.players])",
+    "max([p.total_score for p in game_state.players]) if game_state.players else 0",
+    "game_state.players[0].name in ('老虎', '辰辰')",
+    "game_state.get_player_by_rank(9).is_connected",  # 排名不存在，两种方式都应按失败处理
+    "game_state.get_player_by_rank(1).total_score * 2 > game_state.round_number * -len(game_state.players)",
+]
+
+FALLBACK_EXPRESSIONS = [
+    "str(game_state.round_number) == '3'",          # str 不在白名单中，由 asteval 执行
+    "game_state.__class__ is not None",             # 下划线属性
+    "(lambda x: x)(1) == 1",                        # lambda
+    "game_state.players.append(None) is None",      # 非白名单方法
+    # 操作数不能确定是数值的乘法/取模：结果大小取决于运行时的数值，原生执行无法中途打断
+    "len(game_state.get_player_by_rank(1).name * 1000000000) > 0",
+    "len([p.name * 1000000000 for p in game_state.players]) > 0",
+    "len('%0999999999d' % game_state.round_number) > 0",
+    # 通过 key= 或作为值传递的方法可以在原生执行中调用任意方法
+    "max(game_state.players, key=game_state.players.remove) is None",
+    "sorted([game_state], key='{0.__init__.__globals__}'.format)[0] is game_state",
+    "len(sorted([300000000], key='a'.zfill)) > 0",
+    "len([game_state.get_player_by_rank, len]) == 2",
+]
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def game_states():
+    for round_number, first_connected in ((1, True), (3, False), (4, True)):
+        players = [PlayerState(id=f"p{i}", name=name, rank=i, total_score=110 - i * 10)
+                   for i, name in enumerate(("老虎", "辰辰", "小草", "阿杰"), start=1)]
+        players[0].is_connected = first_connected
+        yield GameState(round_number=round_number, mode='individual', players=players)
+
+
+def evaluate(engine, condition, game_state, native):
+    engine.native_enabled = native
+    with contextlib.redirect_stdout(io.StringIO()):
+        return engine._evaluate_expression(condition, game_state)
+
+
+def build_ruleset():
+    rules = [{
+        "comment": f"规则 {i}",
+        "condition": f"game_state.round_number == {100 + i} and game_state.get_player_by_rank(1).total_score > {i}",
+        "action": {"type": "direct_choice", "rule": i},
+    } for i in range(RULE_COUNT - 1)]
+    rules.append({
+        "comment": "常规情况：由第一名选图",
+        "condition": "game_state.trigger == 'after_round' and len([p for p in game_state.players if p.is_connected]) > 1",
+        "action": {"type": "direct_choice", "who_selects": "game_state.get_player_by_rank(1)"},
+    })
+    return {"id": 1, "version": 1, "ruleset_name": "模拟规则集", "map_selection_rules": rules}
+
+
+def simulations_per_second(engine, ruleset, native):
+    engine.set_native_enabled(native)
+    states = list(game_states())
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(SIMULATIONS):
+            engine.get_next_action(ruleset, states[i % len(states)])
+    return SIMULATIONS / (time.perf_counter() - start)
+
+
+def run_verification():
+    engine = RuleEngine()
+    print_header("原生编译子集")
+    print(f"- 白名单方法: {sorted(GAME_STATE_METHODS)}")
+    compiled = [engine.compile_condition(expression) for expression in EXPRESSIONS]
+    print_result("常用规则全部原生编译", all(c.native is not None for c in compiled),
+                 f"{sum(c.native is not None for c in compiled)} / {len(compiled)}")
+    mismatches = [c.source for c in compiled for state in game_states()
+                  if evaluate(engine, c, state, True) != evaluate(engine, c, state, False)]
+    print_result("原生执行与 asteval 结果一致", not mismatches, f"不一致: {mismatches}" if mismatches else "")
+
+    print_header("回退到 asteval")
+    fallbacks = [engine.compile_condition(expression) for expression in FALLBACK_EXPRESSIONS]
+    print_result("子集之外的表达式不做原生编译", all(c.native is None for c in fallbacks))
+    state = next(game_states())
+    print_result("回退的表达式仍可由 asteval 执行", evaluate(engine, fallbacks[0], state, True) is False
+                 and evaluate(engine, engine.compile_condition("str(game_state.round_number) == '1'"), state, True))
+    start = time.perf_counter()
+    repeated = evaluate(engine, fallbacks[4], state, True)
+    elapsed = time.perf_counter() - start
+    print_result("字段的序列重复由 asteval 按预算中止", repeated is False and elapsed < 1.0,
+                 f"耗时 {elapsed * 1000:.0f} ms")
+    print_result("通过 key= 访问 __globals__ 的表达式由 asteval 拒绝", evaluate(engine, fallbacks[8], state, True) is False)
+
+    print_header(f"{RULE_COUNT} 条规则的模拟吞吐量")
+    ruleset = build_ruleset()
+    interpreted = simulations_per_second(engine, ruleset, False)
+    native = simulations_per_second(engine, ruleset, True)
+    print(f"- asteval 解释执行: {interpreted:,.0f} 次决策/秒")
+    print(f"- 原生编译:         {native:,.0f} 次决策/秒")
+    print_result("原生编译每秒可完成数千次决策", native >= 1000, f"加速 {native / interpreted:.1f} 倍")
+
+
+if __name__ == '__main__':
+    run_verification()
@@ -0,0 +1,103 @@
+# 文件名: verify_rule_concurrency.py
+# 验证规则引擎可在多个线程中同时求值：每个线程使用各自的比赛状态，结果必须与单线程求值一致 (原生执行与 asteval 解释执行都要检查)
+
+import contextlib
+import io
+import sys
+import threading
+
+from core.rule_engine import GameState, PlayerState, RuleEngine
+
+THREADS = 16
+ITERATIONS = 300
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def build_ruleset():
+    # 每个线程的比赛状态轮次不同，只有与本线程轮次相同的那条规则会命中
+    rules = [{
+        "comment": f"第 {i} 轮",
+        "condition": f"game_state.round_number == {i} and len([p for p in game_state.players if p.total_score > {i}]) >= 0",
+        "action": {"type": "direct_choice", "round": i},
+    } for i in range(THREADS)]
+    return {"id": 42, "version": 1, "ruleset_name": "并发测试规则集", "map_selection_rules": rules}
+
+
+def build_state(round_number):
+    players = [PlayerState(f"p{i}", f"选手{i}", i, 100 - i) for i in range(1, 9)]
+    return GameState(round_number=round_number, mode='individual', players=players)
+
+
+def run_threads(engine, ruleset):
+    """全部线程同时开始，各自反复求值，返回 (出错的次数, 异常列表)"""
+    barrier = threading.Barrier(THREADS)
+    mismatches = [0] * THREADS
+    errors = []
+
+    def worker(index):
+        state = build_state(index)
+        expected = {"type": "direct_choice", "round": index}
+        try:
+            barrier.wait()
+            for _ in range(ITERATIONS):
+                if engine.get_next_action(ruleset, state) != expected:
+                    mismatches[index] += 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(mismatches), errors
+
+
+def run_verification():
+    engine = RuleEngine()
+    ruleset = build_ruleset()
+    # 缩短线程切换间隔，尽可能让多个线程的求值交错执行
+    old_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            serial_ok = all(engine.get_next_action(ruleset, build_state(i)) == {"type": "direct_choice", "round": i}
+                            for i in range(THREADS))
+        print_header("单线程基准")
+        print_result("单线程求值结果正确", serial_ok)
+
+        for native in (True, False):
+            engine.set_native_enabled(native)
+            label = "原生执行" if native else "asteval 解释执行"
+            print_header(f"{THREADS} 个线程同时求值 ({label})")
+            with contextlib.redirect_stdout(io.StringIO()):
+                mismatches, errors = run_threads(engine, ruleset)
+            total = THREADS * ITERATIONS
+            print_result("没有抛出异常", not errors, "; ".join(str(e) for e in errors[:3]))
+            print_result("每个线程的决策都只取决于自己的比赛状态", mismatches == 0, f"{total - mismatches}/{total} 次正确")
+    finally:
+        sys.setswitchinterval(old_interval)
+        engine.set_native_enabled(True)
+
+    print_header("执行环境池")
+    print_result("空闲执行环境数不超过上限", len(engine._contexts) <= engine.MAX_POOLED_CONTEXTS,
+                 f"{len(engine._contexts)} 个空闲")
+    print_result("归还的执行环境不再引用比赛状态",
+                 all('game_state' not in c.native_globals and 'game_state' not in c.interp.symtable
+                     for c in engine._contexts))
+
+
+if __name__ == '__main__':
+    run_verification()
@@ -0,0 +1,122 @@
+# 文件名: verify_rule_engine_cache.py
+# 验证规则引擎的表达式编译缓存：决策结果与逐次解析一致、非法表达式在编译时被拒绝，并报告 50 条规则下的单次调用加速比
+
+import contextlib
+import io
+import time
+
+from asteval import Interpreter
+
+from core.rule_engine import GameState, PlayerState, RuleCompileError, RuleEngine
+from core.rule_vectorizer import NUMPY_AVAILABLE
+
+RULE_COUNT = 50
+CALLS = 200
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def build_ruleset():
+    # 前 49 条规则都不会命中，只有最后一条命中，每次调用都要对全部 50 个条件求值
+    rules = [{
+        "comment": f"规则 {i}",
+        "condition": f"game_state.round_number == {100 + i} and game_state.get_player_by_rank(1).total_score > {i}",
+        "action": {"type": "direct_choice", "rule": i},
+    } for i in range(RULE_COUNT - 1)]
+    rules.append({
+        "comment": "常规情况：由第一名选图",
+        "condition": "game_state.trigger == 'after_round' and len([p for p in game_state.players if p.is_connected]) > 1",
+        "action": {"type": "direct_choice", "who_selects": "game_state.get_player_by_rank(1)"},
+    })
+    return {"id": 1, "version": 1, "ruleset_name": "性能测试规则集", "map_selection_rules": rules}
+
+
+def uncached_next_action(interp, ruleset, game_state):
+    """旧实现：每次调用都把条件文本交给解释器重新解析"""
+    for rule in ruleset["map_selection_rules"]:
+        interp.symtable['game_state'] = game_state
+        if interp.eval(rule["condition"]):
+            return rule.get("action")
+    return {"type": "default"}
+
+
+def time_calls(func):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(CALLS):
+            result = func()
+    return (time.perf_counter() - start) / CALLS * 1000, result
+
+
+def run_verification():
+    engine = RuleEngine()
+    players = [PlayerState(id=f"p{i}", name=f"选手{i}", rank=i, total_score=100 - i) for i in range(1, 9)]
+    game_state = GameState(round_number=3, mode='individual', players=players)
+    ruleset = build_ruleset()
+
+    print_header("编译与校验")
+    for bad in ("game_state.round_number ==", "x = 1", "import os"):
+        try:
+            engine.compile_expression(bad)
+            rejected = False
+        except RuleCompileError:
+            rejected = True
+        print_result(f"拒绝非法表达式 {bad!r}", rejected)
+    broken = {"id": 2, "map_selection_rules": [
+        {"condition": "game_state.round ==", "action": {"type": "broken"}},
+        {"condition": "True", "action": {"type": "fallback"}},
+    ]}
+    with contextlib.redirect_stdout(io.StringIO()):
+        action = engine.get_next_action(broken, game_state)
+    print_result("编译失败的规则被跳过", action == {"type": "fallback"})
+
+    print_header("条件相同、动作不同的规则集")
+    # 没有 id 的两个规则集条件完全相同：编译缓存只能共用条件，不能把一个规则集的动作返回给另一个
+    conditions = ["game_state.round_number > 100", "game_state.get_player_by_rank(1).total_score > 0"]
+    first = {"map_selection_rules": [{"condition": c, "action": {"type": "direct_choice", "choice": f"A{i}"}}
+                                     for i, c in enumerate(conditions)]}
+    second = {"map_selection_rules": [{"condition": c, "action": {"type": "direct_choice", "choice": f"B{i}"}}
+                                      for i, c in enumerate(conditions)]}
+    with contextlib.redirect_stdout(io.StringIO()):
+        actions = [engine.get_next_action(first, game_state), engine.get_next_action(second, game_state)]
+    print_result("各自返回自己的动作", [a["choice"] for a in actions] == ["A1", "B1"], f"{actions}")
+    print_result("match_rule 返回调用方规则集中的规则对象",
+                 engine.match_rule(second, game_state) is second["map_selection_rules"][1])
+    if NUMPY_AVAILABLE:
+        try:
+            rows = [list(engine.evaluate_batch(r, [game_state, game_state])) for r in (first, second)]
+            print_result("批量求值返回各自规则集中的序号", rows == [[1, 1], [1, 1]], f"{rows}")
+        except ValueError as e:
+            print_result("批量求值返回各自规则集中的序号", False, str(e))
+        reordered = {"map_selection_rules": [dict(first["map_selection_rules"][1]), {"condition": "False", "action": {}},
+                                             dict(first["map_selection_rules"][1])]}
+        print_result("规则重复时返回第一条的序号", list(engine.evaluate_batch(reordered, [game_state])) == [0])
+
+    print_header(f"{RULE_COUNT} 条规则的单次调用耗时")
+    interp = Interpreter()
+    old_ms, old_action = time_calls(lambda: uncached_next_action(interp, ruleset, game_state))
+    new_ms, new_action = time_calls(lambda: engine.get_next_action(ruleset, game_state))
+    print_result("决策结果与逐次解析一致", old_action == new_action)
+    print(f"- 逐次解析: {old_ms:.3f} ms/次")
+    print(f"- 编译缓存: {new_ms:.3f} ms/次")
+    print_result("编译缓存更快", new_ms < old_ms, f"加速 {old_ms / new_ms:.1f} 倍")
+
+    ruleset["map_selection_rules"][-1]["condition"] = "game_state.trigger == 'never'"
+    with contextlib.redirect_stdout(io.StringIO()):
+        action = engine.get_next_action(ruleset, game_state)
+    print_result("条件被修改后重新编译", action.get("type") == "default")
+
+
+if __name__ == '__main__':
+    run_verification()
@@ -0,0 +1,171 @@
+# 文件名: verify_rule_incremental.py
+# 验证规则的增量求值：条件读取的输入分析、随机修改比赛状态后决策与完整求值一致、命中/未命中计数，以及只有部分字段变化时的耗时
+
+import contextlib
+import io
+import random
+import time
+
+from core.rule_dependencies import analyze_inputs
+from core.rule_engine import GAME_STATE_INPUT_FIELDS, GAME_STATE_METHOD_INPUTS, GameState, PlayerState, RuleEngine
+
+STEPS = 400
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def build_ruleset():
+    rules = [
+        {"comment": "决赛轮由队伍总分领先的队伍选图",
+         "condition": "game_state.round_number >= 8 and game_state.get_winning_team() == 'red'",
+         "action": {"type": "team_choice", "team": "red"}},
+        {"comment": "有选手掉线时暂停",
+         "condition": "len([p for p in game_state.players if not p.is_connected]) > 1",
+         "action": {"type": "pause"}},
+        {"comment": "第一名大幅领先时由最后一名选图",
+         "condition": "game_state.get_player_by_rank(1).total_score - game_state.get_player_by_rank(2).total_score > 30",
+         "action": {"type": "direct_choice", "who_selects": "last"}},
+        {"comment": "蓝队落后太多时由蓝队选图",
+         "condition": "game_state.get_team_total('red') - game_state.get_team_total('blue') > 40",
+         "action": {"type": "team_choice", "team": "blue"}},
+        {"comment": "直接比较选手对象 (依赖全部选手字段)",
+         "condition": "game_state.get_player_by_rank(1) == game_state.get_player_by_id('p3')",
+         "action": {"type": "direct_choice", "who_selects": "p3"}},
+        {"comment": "不在原生子集内的条件 (每次都重新求值)",
+         "condition": "any([p.name.startswith('选手8') and p.rank == 1 for p in game_state.players])",
+         "action": {"type": "direct_choice", "who_selects": "p8"}},
+    ]
+    # 大量只与模式/触发时机有关的规则：比分变化时都可以复用结果
+    rules += [{"comment": f"模式规则 {i}",
+               "condition": f"game_state.mode == 'mode{i}' and game_state.trigger == 'before_round'",
+               "action": {"type": "mode", "rule": i}} for i in range(30)]
+    rules.append({"comment": "常规情况：由第一名选图",
+                  "condition": "game_state.trigger == 'after_round' and len([p for p in game_state.players if p.is_connected]) > 1",
+                  "action": {"type": "direct_choice", "who_selects": "first"}})
+    return {"id": 43, "version": 1, "ruleset_name": "增量求值规则集", "map_selection_rules": rules}
+
+
+def build_state():
+    players = [PlayerState(f"p{i}", f"选手{i}", i, 100 - i * 5, team_id="red" if i % 2 else "blue")
+               for i in range(1, 9)]
+    return GameState(round_number=1, mode='team', players=players)
+
+
+def rerank(state):
+    for rank, p in enumerate(sorted(state.players, key=lambda p: -p.total_score), 1):
+        p.rank = rank
+
+
+def mutate(state, rng):
+    choice = rng.random()
+    if choice < 0.5:
+        rng.choice(state.players).total_score += rng.randint(1, 25)
+        rerank(state)
+    elif choice < 0.65:
+        p = rng.choice(state.players)
+        p.is_connected = not p.is_connected
+    elif choice < 0.75:
+        state.round_number += 1
+    elif choice < 0.85:
+        state.trigger = rng.choice(['after_round', 'before_round'])
+    elif choice < 0.9:
+        # 重新构造一个等价的比赛状态 (每轮都新建 GameState 的调用方式)
+        state = GameState(state.round_number, state.mode,
+                          [PlayerState(p.id, p.name, p.rank, p.total_score, p.is_connected, p.team_id)
+                           for p in state.players], state.trigger)
+    # 其余情况：状态不变
+    return state
+
+
+def decide(engine, ruleset, state):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return engine.get_next_action(ruleset, state)
+
+
+def run_verification():
+    engine = RuleEngine()
+    ruleset = build_ruleset()
+
+    print_header("输入分析")
+    inputs = {rule["comment"]: engine.compile_condition(rule["condition"]).inputs
+              for rule in ruleset["map_selection_rules"][:6]}
+    print_result("轮次与队伍规则只依赖轮次、队伍和总分",
+                 set(inputs["决赛轮由队伍总分领先的队伍选图"]) == {("game", "round_number"), ("player", "team_id"),
+                                                             ("player", "total_score"), ("players", "count")})
+    print_result("掉线规则只依赖连接状态和人数",
+                 set(inputs["有选手掉线时暂停"]) == {("player", "is_connected"), ("players", "count")})
+    print_result("直接比较选手对象时依赖全部选手字段",
+                 {("player", f) for f in PlayerState._FIELDS} <= set(inputs["直接比较选手对象 (依赖全部选手字段)"]))
+    print_result("子集外的条件不做分析", inputs["不在原生子集内的条件 (每次都重新求值)"] is None)
+    mutating = "max(game_state.players, key=game_state.players.remove) is None"
+    compiled = engine.compile_condition(mutating)
+    print_result("修改比赛状态的条件不做原生编译，也不复用结果", compiled.native is None and compiled.inputs is None)
+    parsed = engine.compile_expression(mutating)
+    print_result("依赖分析把非查询方法和关键字参数的调用视为无法确定",
+                 analyze_inputs(parsed, GAME_STATE_INPUT_FIELDS, PlayerState._FIELDS, GAME_STATE_METHOD_INPUTS) is None
+                 and analyze_inputs(engine.compile_expression("len(sorted(game_state.players, reverse=True)) > 2"),
+                                    GAME_STATE_INPUT_FIELDS, PlayerState._FIELDS, GAME_STATE_METHOD_INPUTS) is None)
+    engine.reset_evaluation_stats()
+    state = build_state()
+    for _ in range(3):
+        decide(engine, {"map_selection_rules": [{"condition": mutating, "action": {"type": "never"}}]}, state)
+    print_result("有副作用的条件每次都重新求值", engine.get_evaluation_stats() == {"hits": 0, "misses": 3},
+                 f"{engine.get_evaluation_stats()}")
+
+    print_header(f"随机修改比赛状态 {STEPS} 次")
+    rng = random.Random(43)
+    state = build_state()
+    mismatches = 0
+    engine.set_incremental_enabled(True)
+    engine.reset_evaluation_stats()
+    for _ in range(STEPS):
+        state = mutate(state, rng)
+        incremental = decide(engine, ruleset, state)
+        engine.incremental_enabled = False
+        full = decide(engine, ruleset, state)
+        engine.incremental_enabled = True
+        mismatches += incremental != full
+    stats = engine.get_evaluation_stats()
+    print_result("每一步的决策都与完整求值一致", mismatches == 0, f"{STEPS - mismatches}/{STEPS}")
+    print_result("命中/未命中计数", stats["hits"] > 0 and stats["misses"] > 0, f"{stats}")
+
+    # 子集外的条件每次都要由 asteval 解释执行，两种方式耗时相同，计时时去掉
+    timed_ruleset = dict(ruleset, id=4301, map_selection_rules=[
+        rule for rule in ruleset["map_selection_rules"] if "startswith" not in rule["condition"]])
+    for native in (True, False):
+        engine.set_native_enabled(native)
+        calls = 300 if native else 30
+        print_header(f"只有一名选手的比分变化时的耗时 ({'原生执行' if native else 'asteval 解释执行'})")
+        timings = {}
+        for incremental in (False, True):
+            engine.set_incremental_enabled(incremental)
+            # 取三次中最快的一次，减少机器负载波动的影响
+            for _ in range(3):
+                state = build_state()
+                engine.reset_evaluation_stats()
+                start = time.perf_counter()
+                for i in range(calls):
+                    state.players[i % 8].total_score += 1
+                    decide(engine, timed_ruleset, state)
+                elapsed = (time.perf_counter() - start) / calls * 1000
+                timings[incremental] = min(timings.get(incremental, elapsed), elapsed)
+            stats = engine.get_evaluation_stats()
+            print(f"- {'增量求值' if incremental else '完整求值'}: {timings[incremental]:.3f} ms/次, "
+                  f"命中 {stats['hits']}, 未命中 {stats['misses']}")
+        print_result("增量求值更快", timings[True] < timings[False], f"加速 {timings[False] / timings[True]:.1f} 倍")
+    engine.set_native_enabled(True)
+    engine.set_incremental_enabled(True)
+
+if __name__ == '__main__':
+    run_verification()
@@ -0,0 +1,185 @@
+# 文件名: verify_rule_profiling.py
+# 验证规则求值的逐条件统计 (默认关闭；开启后逐次记录调用次数、累计/最大耗时、错误次数，可选抽样记录) 与报告、开启统计的额外开销，以及执行预算：病态的条件超出步数或时间预算时及时中止
+
+import contextlib
+import io
+import random
+import statistics
+import time
+
+from core.rule_engine import GameState, PlayerState, RuleEngine
+
+DECISIONS = 200
+# 开启统计后每次决策允许的额外开销
+MAX_PROFILING_OVERHEAD = 0.10
+OVERHEAD_ROUNDS = 60
+OVERHEAD_DECISIONS = 25
+
+# 五层嵌套的推导式：8 名选手时要执行 8^5 次循环，由 asteval 解释执行需要数秒
+PATHOLOGICAL = ("len([1 for a in game_state.players for b in game_state.players for c in game_state.players "
+                "for d in game_state.players for e in game_state.players]) < 0")
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def build_ruleset(rules_id, *extra_rules):
+    rules = list(extra_rules) + [
+        {"comment": "分数除以零 (每次执行都出错)",
+         "condition": "game_state.get_player_by_rank(1).total_score / 0 > 1",
+         "action": {"type": "broken"}},
+        {"comment": "第一名大幅领先时由最后一名选图",
+         "condition": "game_state.get_player_by_rank(1).total_score - game_state.get_player_by_rank(2).total_score > 1000",
+         "action": {"type": "direct_choice", "who_selects": "last"}},
+        {"comment": "不在原生子集内的条件",
+         "condition": "any([p.name.startswith('选手9') for p in game_state.players])",
+         "action": {"type": "direct_choice", "who_selects": "p9"}},
+        {"comment": "常规情况：由第一名选图",
+         "condition": "game_state.trigger == 'after_round'",
+         "action": {"type": "direct_choice", "who_selects": "first"}},
+    ]
+    return {"id": rules_id, "version": 1, "ruleset_name": "统计与预算规则集", "map_selection_rules": rules}
+
+
+def build_state():
+    players = [PlayerState(f"p{i}", f"选手{i}", i, 100 - i * 5) for i in range(1, 9)]
+    return GameState(round_number=1, mode='solo', players=players)
+
+
+def decide(engine, ruleset, state):
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        action = engine.get_next_action(ruleset, state)
+    return action, output.getvalue()
+
+
+def run_verification():
+    engine = RuleEngine()
+    engine.set_budget()
+    engine.set_incremental_enabled(False)
+    state = build_state()
+
+    print_header("逐条件统计")
+    ruleset = build_ruleset(4601)
+    engine.reset_rule_stats()
+    decide(engine, ruleset, state)
+    print_result("默认不开启统计", not engine.profiling_enabled and engine.get_rule_stats() == {})
+    engine.set_profiling_enabled(True)
+    for _ in range(DECISIONS):
+        decide(engine, ruleset, state)
+    stats = engine.get_rule_stats()
+    by_comment = {rule["comment"]: stats.get(rule["condition"]) for rule in ruleset["map_selection_rules"]}
+    print_result("每条被求值的条件都有调用次数",
+                 all(s is not None and s["calls"] == DECISIONS for s in by_comment.values()),
+                 f"{[s['calls'] for s in by_comment.values()]}")
+    broken = by_comment["分数除以零 (每次执行都出错)"]
+    print_result("出错的条件记录错误次数", broken["errors"] == DECISIONS, f"{broken}")
+    print_result("正常的条件没有错误", by_comment["常规情况：由第一名选图"]["errors"] == 0)
+    slowest = max(stats, key=lambda source: stats[source]["total_time"])
+    print_result("子集外的条件累计耗时最多", slowest == ruleset["map_selection_rules"][2]["condition"],
+                 f"{slowest}")
+    print_result("统计值自洽", all(s["max_time"] <= s["total_time"] and
+                                   abs(s["mean_time"] * s["calls"] - s["total_time"]) < 1e-9 for s in stats.values()))
+    report = engine.format_rule_report(ruleset)
+    print(report)
+    lines = report.splitlines()
+    print_result("报告按累计耗时排序并使用规则说明", len(lines) == 5 and "不在原生子集内的条件" in lines[1])
+    engine.reset_rule_stats()
+    print_result("重置后统计清空", engine.get_rule_stats() == {} and "暂无求值记录" in engine.format_rule_report())
+
+    print_header("抽样统计")
+    engine.set_profiling_enabled(True, sample_every=engine.PROFILE_SAMPLE_EVERY)
+    sampled_decisions = DECISIONS * 20
+    random.seed(46)
+    expected_random = random.random()
+    random.seed(46)
+    for _ in range(sampled_decisions):
+        decide(engine, ruleset, state)
+    print_result("抽样不使用也不改变全局随机数序列", random.random() == expected_random)
+    stats = engine.get_rule_stats()
+    by_comment = {rule["comment"]: stats.get(rule["condition"]) for rule in ruleset["map_selection_rules"]}
+    normal = by_comment["常规情况：由第一名选图"]
+    print_result(f"每 {engine.profile_sample_every} 次正常求值抽样记录一次，调用次数为估计值",
+                 abs(normal["calls"] - sampled_decisions) < sampled_decisions * 0.3,
+                 f"估计 {normal['calls']} 次，实际 {sampled_decisions} 次")
+    broken = by_comment["分数除以零 (每次执行都出错)"]
+    print_result("出错的求值总是记录", broken["calls"] == broken["errors"] == sampled_decisions, f"{broken}")
+    try:
+        engine.set_profiling_enabled(True, sample_every=0)
+        print_result("抽样间隔必须为正整数", False)
+    except ValueError:
+        print_result("抽样间隔必须为正整数", True)
+    engine.set_profiling_enabled(True)
+    print_result("再次开启统计时恢复逐次记录", engine.profile_sample_every == 1)
+    engine.reset_rule_stats()
+
+    print_header("病态条件的执行预算")
+    engine_rules = build_ruleset(4602, {"comment": "五层嵌套推导式", "condition": PATHOLOGICAL,
+                                        "action": {"type": "never"}})
+    compiled = engine.compile_condition(PATHOLOGICAL)
+    print_result("嵌套过深的推导式不做原生编译", compiled.native is None)
+    print_result("两层嵌套的推导式仍然原生编译", engine.compile_condition(
+        "len([1 for a in game_state.players for b in game_state.players if a.rank < b.rank]) > 0").native is not None)
+    print_result("序列重复不做原生编译",
+                 engine.compile_condition("len('x' * game_state.round_number) > 0").native is None)
+
+    start = time.perf_counter()
+    action, output = decide(engine, engine_rules, state)
+    elapsed = time.perf_counter() - start
+    print_result("超出时间预算后及时中止", elapsed < 1.0, f"整轮决策耗时 {elapsed * 1000:.0f} ms")
+    print_result("中止的条件按不满足处理，继续匹配后续规则", action.get("who_selects") == "first", f"{action}")
+    print_result("输出超出预算的错误信息", "超出预算" in output, output.strip().splitlines()[0])
+    pathological = engine.get_rule_stats()[PATHOLOGICAL]
+    print_result("统计中记录超出预算次数", pathological["budget_exceeded"] == 1 and pathological["errors"] == 0,
+                 f"{pathological}")
+
+    engine.set_budget(max_steps=2000, max_time=None)
+    start = time.perf_counter()
+    action, output = decide(engine, engine_rules, state)
+    elapsed = time.perf_counter() - start
+    print_result("超出步数预算后及时中止", "执行步数超出预算" in output and elapsed < 1.0,
+                 f"整轮决策耗时 {elapsed * 1000:.0f} ms")
+    engine.set_budget(max_steps=None, max_time=None)
+    result, _ = decide(engine, build_ruleset(4603, {"comment": "三层嵌套推导式", "action": {"type": "never"},
+                                                    "condition": PATHOLOGICAL.replace(
+                                                        " for d in game_state.players for e in game_state.players", "")}),
+                       state)
+    print_result("不限制预算时照常执行", result.get("who_selects") == "first")
+
+    print_header("统计的开销 (逐次记录)")
+    engine.set_budget()
+    # 开启与关闭交替测量多轮 (每轮交换先后顺序)，取每轮耗时比值的中位数，机器负载的波动对两者的影响相互抵消
+    native_ruleset = {"id": 4604, "version": 1, "ruleset_name": "原生条件规则集", "map_selection_rules": [
+        rule for rule in ruleset["map_selection_rules"]
+        if engine.compile_condition(rule["condition"]).native is not None]}
+    for name, rules in (("完整规则集", ruleset), ("只含原生条件", native_ruleset)):
+        ratios, best = [], {False: None, True: None}
+        for round_index in range(OVERHEAD_ROUNDS):
+            timings = {}
+            for enabled in ((False, True) if round_index % 2 == 0 else (True, False)):
+                engine.set_profiling_enabled(enabled)
+                start = time.perf_counter()
+                for _ in range(OVERHEAD_DECISIONS):
+                    decide(engine, rules, state)
+                timings[enabled] = (time.perf_counter() - start) / OVERHEAD_DECISIONS * 1e6
+                best[enabled] = timings[enabled] if best[enabled] is None else min(best[enabled], timings[enabled])
+            ratios.append(timings[True] / timings[False])
+        overhead = statistics.median(ratios) - 1
+        print(f"- {name}: 关闭统计 {best[False]:.1f} us/次, 开启统计 {best[True]:.1f} us/次 (各轮最快)")
+        print_result(f"{name}开启统计的额外开销不超过 {MAX_PROFILING_OVERHEAD:.0%}",
+                     overhead < MAX_PROFILING_OVERHEAD, f"各轮耗时比的中位数 {overhead * 100:+.1f}%")
+    engine.set_profiling_enabled(False)
+    engine.set_incremental_enabled(True)
+
+
+if __name__ == '__main__':
+    run_verification()
@@ -0,0 +1,91 @@
+# 文件名: verify_rule_simulator.py
+# 验证规则集的蒙特卡洛模拟：统计结果自洽、相同种子在单进程与进程池下结果一致、加赛与个人/团队模式的行为，并报告每秒模拟的轮数
+
+import contextlib
+import io
+
+from core.rule_simulator import SimulationConfig, format_report, simulate
+from run_rule_simulation import SAMPLE_RULESET, parse_args
+
+MATCHES = 2000
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def run_verification():
+    print_header(f"个人赛 {MATCHES} 场 (单进程)")
+    config = SimulationConfig(players=8, max_rounds=7)
+    serial = simulate(SAMPLE_RULESET, config, matches=MATCHES, workers=1, seed=44)
+    print(format_report(serial))
+    decisions = sum(rule["decisions"] for rule in serial["rules"])
+    print_result("每一轮都恰好做出一次决策", decisions == serial["rounds"], f"{decisions} / {serial['rounds']}")
+    print_result("比赛轮数不少于常规轮数、不超过加赛上限",
+                 serial["match_length"]["min"] >= 7 and serial["match_length"]["max"] <= 10)
+    print_result("冠军分布与未决出比例之和为 1",
+                 abs(sum(serial["winner_seed_distribution"]) + serial["unresolved_rate"] - 1) < 1e-9)
+    print_result("实力最强的选手最常夺冠",
+                 serial["winner_seed_distribution"][0] == max(serial["winner_seed_distribution"]))
+    tiebreak = serial["rules"][1]
+    print_result("加赛图规则只在部分比赛中出现", 0 < tiebreak["match_rate"] < 1, f"{tiebreak['match_rate']:.1%}")
+
+    print_header("进程池")
+    pooled = simulate(SAMPLE_RULESET, config, matches=MATCHES, workers=2, seed=44)
+    same = (pooled["rounds"] == serial["rounds"]
+            and [r["decisions"] for r in pooled["rules"]] == [r["decisions"] for r in serial["rules"]]
+            and pooled["winner_seed_distribution"] == serial["winner_seed_distribution"])
+    print_result("相同种子在 2 个进程下结果与单进程一致", same)
+    print(f"- 单进程: {serial['rounds_per_second']:,.0f} 轮/秒; {pooled['workers']} 个进程: {pooled['rounds_per_second']:,.0f} 轮/秒")
+
+    print_header("加赛与提前结束")
+    # 所有名次得分相同、没有人未完赛：第一名必然并列，每场都打满加赛轮次
+    tied = simulate(SAMPLE_RULESET, SimulationConfig(points=(1,) * 8, retire_rate=0.0, max_rounds=5, overtime_rounds=2),
+                    matches=200, workers=1, seed=1)
+    print_result("始终并列时打满加赛且无法决出冠军",
+                 tied["match_length"]["min"] == 7 and tied["unresolved_rate"] == 1.0)
+    early = simulate(SAMPLE_RULESET, SimulationConfig(target_score=25, max_rounds=20), matches=200, workers=1, seed=1)
+    print_result("达到目标分数时提前结束", early["match_length"]["max"] < 20, f"平均 {early['match_length']['mean']:.2f} 轮")
+
+    print_header("无法向量化的条件")
+    fallback_ruleset = {"id": "fallback", "version": 1, "map_selection_rules": [
+        {"comment": "最高分超过 60 时由最后一名选图",
+         "condition": "max([p.total_score for p in game_state.players]) > 60",
+         "action": {"type": "direct_choice", "who_selects": "last"}},
+    ] + SAMPLE_RULESET["map_selection_rules"]}
+    fallback = simulate(fallback_ruleset, config, matches=300, workers=1, seed=5)
+    print_result("逐个求值的条件与批量求值的条件可以混用",
+                 sum(rule["decisions"] for rule in fallback["rules"]) == fallback["rounds"]
+                 and 0 < fallback["rules"][0]["decision_share"] < 1,
+                 f"{fallback['rules'][0]['decision_share']:.1%} 的决策由第一条规则做出")
+
+    print_header("参数校验")
+    try:
+        simulate(SAMPLE_RULESET, config, matches=0, workers=1)
+        print_result("模拟 0 场比赛时报错", False)
+    except ValueError as e:
+        print_result("模拟 0 场比赛时报错", True, str(e))
+    try:
+        with contextlib.redirect_stderr(io.StringIO()):
+            parse_args(["--matches", "0"])
+        print_result("命令行 --matches 0 被拒绝", False)
+    except SystemExit:
+        print_result("命令行 --matches 0 被拒绝", True)
+
+    print_header("团队赛")
+    team = simulate(SAMPLE_RULESET, SimulationConfig(players=8, teams=2), matches=500, workers=1, seed=2)
+    print_result("冠军分布按队伍统计", len(team["winner_seed_distribution"]) == 2,
+                 f"实力较强的队伍夺冠 {team['winner_seed_distribution'][0]:.1%}")
+
+
+if __name__ == '__main__':
+    run_verification()
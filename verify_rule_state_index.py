@@ -0,0 +1,128 @@
+# 文件名: verify_rule_state_index.py
+# 验证带 __slots__ 和索引的 GameState/PlayerState：查询结果与线性查找一致、字段修改或列表原地修改后索引自动失效、队伍汇总，以及查找耗时
+
+import contextlib
+import copy
+import io
+import pickle
+import sys
+import time
+
+from core.rule_engine import GameState, PlayerState, RuleEngine
+
+PLAYER_COUNT = 64
+LOOKUPS = 100_000
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def linear_by_rank(game_state, rank):
+    """原先 get_player_by_rank 的线性查找"""
+    for p in game_state.players:
+        if p.rank == rank:
+            return p
+    return None
+
+
+def build_state():
+    players = [PlayerState(id=f"p{i}", name=f"选手{i}", rank=i, total_score=200 - i,
+                           team_id="red" if i % 2 else "blue") for i in range(1, PLAYER_COUNT + 1)]
+    return GameState(round_number=1, mode='team', players=players)
+
+
+def run_verification():
+    print_header("兼容性")
+    state = build_state()
+    player = state.players[0]
+    print_result("实例没有 __dict__", not hasattr(player, "__dict__") and not hasattr(state, "__dict__"))
+    print_result("构造参数与默认值不变", player.is_connected is True
+                 and PlayerState("x", "y", 1, 0).team_id is None and state.trigger == 'after_round')
+    print_result("repr 与相等比较", repr(PlayerState("x", "y", 1, 0)).startswith("PlayerState(id='x'")
+                 and PlayerState("x", "y", 1, 0) == PlayerState("x", "y", 1, 0))
+
+    print_header("索引查询")
+    print_result("按排名查找与线性查找一致",
+                 all(state.get_player_by_rank(r) is linear_by_rank(state, r) for r in range(0, PLAYER_COUNT + 2)))
+    print_result("按ID与名称查找", state.get_player_by_id("p5") is state.players[4]
+                 and state.get_player_by_name("选手7") is state.players[6] and state.get_player_by_id("nobody") is None)
+    duplicate = GameState(1, 'individual', [PlayerState("a", "A", 1, 10), PlayerState("b", "B", 1, 5)])
+    print_result("排名重复时返回第一个匹配项", duplicate.get_player_by_rank(1).id == "a")
+    red_total = sum(p.total_score for p in state.players if p.team_id == "red")
+    print_result("队伍总分与胜出队伍", state.get_team_total("red") == red_total
+                 and state.get_winning_team() == max(state.get_team_totals(), key=state.get_team_totals().get),
+                 f"{state.get_team_totals()}")
+
+    print_header("索引失效")
+    state.players[0].rank, state.players[1].rank = 2, 1
+    print_result("修改排名后查询结果随之更新", state.get_player_by_rank(1).id == "p2")
+    state.players[0].total_score += 1000
+    print_result("修改总分后队伍汇总随之更新", state.get_winning_team() == "red")
+    state.players = state.players[:10]
+    print_result("重新赋值 players 后重建索引", state.get_player_by_rank(20) is None)
+    edited = build_state()
+    edited.get_player_by_rank(1)
+    edited.players.append(PlayerState("late", "迟到的选手", 99, 0))
+    print_result("原地追加后自动失效", edited.get_player_by_id("late") is not None)
+    edited.players.remove(edited.get_player_by_id("late"))
+    edited.players[0] = PlayerState("swap", "替补选手", 1, 0)
+    print_result("原地删除和按下标替换后自动失效", edited.get_player_by_id("late") is None
+                 and edited.get_player_by_rank(1).id == "swap")
+    edited.players[1:] = []
+    edited.players.sort(key=lambda p: p.id)
+    print_result("切片赋值和排序后自动失效", edited.get_player_by_rank(2) is None and len(edited.players) == 1)
+    roster = [PlayerState("a", "选手A", 1, 10), PlayerState("b", "选手B", 2, 5)]
+    copied = GameState(1, 'individual', roster)
+    roster.append(PlayerState("c", "选手C", 3, 0))
+    roster.pop(0)
+    print_result("players 赋值时复制列表，调用方原列表的增删不影响比赛状态",
+                 [p.id for p in copied.players] == ["a", "b"] and copied.get_player_by_id("c") is None
+                 and copied.players[1] is roster[0])
+
+    # 同一组选手对象同时出现在两个比赛状态中：修改选手后两个状态的索引都要失效
+    shared = [PlayerState("a", "A", 1, 10), PlayerState("b", "B", 2, 5)]
+    first, second = GameState(1, 'individual', shared), GameState(1, 'individual', shared)
+    first.get_player_by_rank(1), second.get_player_by_rank(1)
+    shared[0].rank, shared[1].rank = 2, 1
+    print_result("选手出现在多个状态中时所有状态的索引都失效",
+                 first.get_player_by_rank(1).id == "b" and second.get_player_by_rank(1).id == "b")
+    restored = pickle.loads(pickle.dumps(first))
+    duplicate = copy.deepcopy(first)
+    print_result("序列化与深复制", restored == first and duplicate == first
+                 and type(restored.players[0]).__name__ == "PlayerState" and restored.get_player_by_rank(1).id == "b")
+
+    print_header("规则中使用新的查询方法")
+    engine = RuleEngine()
+    condition = engine.compile_condition("game_state.get_team_total('red') > game_state.get_team_total('blue')")
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = engine._evaluate_expression(condition, state)
+    print_result("队伍总分规则可原生编译并执行", condition.native is not None and result is True)
+
+    print_header(f"{PLAYER_COUNT} 名选手的查找耗时")
+    state = build_state()
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        linear_by_rank(state, PLAYER_COUNT - i % 8)
+    linear_ns = (time.perf_counter() - start) / LOOKUPS * 1e9
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        state.get_player_by_rank(PLAYER_COUNT - i % 8)
+    indexed_ns = (time.perf_counter() - start) / LOOKUPS * 1e9
+    print(f"- 线性查找: {linear_ns:.0f} ns/次")
+    print(f"- 索引查找: {indexed_ns:.0f} ns/次")
+    print_result("索引查找更快", indexed_ns < linear_ns, f"加速 {linear_ns / indexed_ns:.1f} 倍")
+    print(f"- 每个 PlayerState 占用 {sys.getsizeof(state.players[0])} 字节 (无 __dict__)")
+
+
+if __name__ == '__main__':
+    run_verification()
@@ -0,0 +1,213 @@
+# 文件名: verify_ruleset_store.py
+# 验证规则集的持久化：保存时校验并编译、版本号、读取历史版本、已编译规则集的 LRU 缓存、旧版数据库的迁移，
+# 以及开始比赛时取出已编译规则集的耗时
+
+import contextlib
+import io
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from core.db_manager import DBManager
+from core.rule_engine import CompiledRuleset, GameState, PlayerState, RuleCompileError, RuleEngine
+
+TEST_DB_PATH = 'data/verification_rulesets.db'
+LEGACY_DB_PATH = 'data/verification_rulesets_legacy.db'
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def open_db(path):
+    """DBManager 是单例：关闭当前实例后在另一个数据库文件上重新创建"""
+    if DBManager._instance is not None:
+        DBManager._instance.close()
+        DBManager._instance = None
+    return DBManager(path)
+
+
+def cleanup():
+    if DBManager._instance is not None:
+        DBManager._instance.close()
+        DBManager._instance = None
+    for path in (TEST_DB_PATH, LEGACY_DB_PATH):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def build_ruleset(threshold=30, extra_rules=0):
+    rules = [
+        {"comment": "第一名大幅领先时由最后一名选图",
+         "condition": f"game_state.get_player_by_rank(1).total_score - game_state.get_player_by_rank(2).total_score > {threshold}",
+         "action": {"type": "direct_choice", "who_selects": "last"}},
+    ]
+    rules += [{"comment": f"模式规则 {i}",
+               "condition": f"game_state.mode == 'mode{i}' and len([p for p in game_state.players if p.rank <= {i}]) > 0",
+               "action": {"type": "mode", "rule": i}} for i in range(extra_rules)]
+    rules.append({"comment": "常规情况：由第一名选图", "condition": "game_state.trigger == 'after_round'",
+                  "action": {"type": "direct_choice", "who_selects": "first"}})
+    return {"ruleset_name": "持久化规则集", "map_selection_rules": rules}
+
+
+def build_state():
+    players = [PlayerState(f"p{i}", f"选手{i}", i, 100 - i * 20) for i in range(1, 5)]
+    return GameState(round_number=1, mode='solo', players=players)
+
+
+def decide(ruleset, state):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return RuleEngine().get_next_action(ruleset, state)
+
+
+def run_verification():
+    db = open_db(TEST_DB_PATH)
+    state = build_state()
+
+    print_header("保存与版本号")
+    ruleset_id, version = db.save_ruleset("决赛规则", "Verifier", build_ruleset(30))
+    print_result("新规则集从第1版开始", version == 1, f"ID {ruleset_id}")
+    print_result("内容不变时不增加版本号", db.save_ruleset("决赛规则", "Verifier", build_ruleset(30)) == (ruleset_id, 1))
+    print_result("修改后保存为第2版", db.save_ruleset("决赛规则", "Verifier", build_ruleset(10)) == (ruleset_id, 2))
+    versions = [v["version"] for v in db.get_ruleset_versions(ruleset_id)]
+    print_result("列出全部历史版本", versions == [2, 1], f"{versions}")
+    listed = [(row["name"], row["version"]) for row in db.get_all_rulesets()]
+    print_result("规则集列表带当前版本号", listed == [("决赛规则", 2)], f"{listed}")
+
+    print_header("保存时校验")
+    bad_rulesets = {
+        "条件语法错误": {"map_selection_rules": [{"condition": "game_state.round_number >", "action": "x"}]},
+        "不是单个表达式": {"map_selection_rules": [{"condition": "import os", "action": "x"}]},
+        "缺少动作": {"map_selection_rules": [{"condition": "game_state.round_number == 1"}]},
+        "缺少规则列表": {"ruleset_name": "空"},
+    }
+    for description, bad in bad_rulesets.items():
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                db.save_ruleset("决赛规则", "Verifier", bad)
+            print_result(f"拒绝保存: {description}", False)
+        except RuleCompileError as e:
+            print_result(f"拒绝保存: {description}", True, str(e))
+    print_result("校验失败时数据库不变", [v["version"] for v in db.get_ruleset_versions(ruleset_id)] == [2, 1])
+
+    print_header("读取已编译的规则集")
+    current = db.load_ruleset(ruleset_id)
+    print_result("读取当前版本", isinstance(current, CompiledRuleset) and current.version == 2
+                 and current == build_ruleset(10))
+    print_result("再次读取命中缓存 (同一个对象)", db.load_ruleset(ruleset_id) is current)
+    old = db.load_ruleset(ruleset_id, 1)
+    print_result("读取历史版本", old is not None and old == build_ruleset(30))
+    print_result("不存在的规则集或版本返回 None", db.load_ruleset(ruleset_id, 9) is None and db.load_ruleset(999) is None)
+    record = db.get_ruleset_by_name("决赛规则")
+    print_result("按名称读取", record["ruleset"] is current and record["author"] == "Verifier" and record["version"] == 2)
+    print_result("两个版本的决策不同", decide(current, state)["who_selects"] == "last"
+                 and decide(old, state)["who_selects"] == "first")
+    print_result("与直接使用规则集字典的决策一致", decide(current, state) == decide(build_ruleset(10), state))
+    print_result("传给其他进程时序列化为普通字典",
+                 type(pickle.loads(pickle.dumps(current))) is dict and pickle.loads(pickle.dumps(current)) == current)
+
+    print_header("已编译规则集的 LRU 缓存")
+    db.MAX_COMPILED_RULESETS = 3
+    ids = [db.save_ruleset(f"规则集{i}", None, build_ruleset(i))[0] for i in range(3)]
+    db.load_ruleset(ids[0])  # 最近使用过，不应被淘汰
+    db.save_ruleset("规则集3", None, build_ruleset(3))
+    cached = [key[0] for key in db._compiled_rulesets]
+    print_result("淘汰最久未使用的规则集", ids[1] not in cached and ids[0] in cached and len(cached) == 3, f"{cached}")
+    print_result("被淘汰后仍可从数据库读取并重新编译", db.load_ruleset(ids[1]) == build_ruleset(1))
+    db.MAX_COMPILED_RULESETS = DBManager.MAX_COMPILED_RULESETS
+    print_result("删除规则集及历史版本", db.delete_ruleset("规则集2") and db.load_ruleset(ids[2]) is None
+                 and db.get_ruleset_versions(ids[2]) == [])
+
+    print_header("多线程共用连接写入")
+    # 调用方直接在连接上写入而尚未提交时，连接已处于隐式事务中，保存规则集不应因 BEGIN 报错
+    db.conn.execute("INSERT INTO map_pools (name, selected_maps) VALUES ('未提交的地图池', '[]')")
+    try:
+        saved = db.save_ruleset("隐式事务中保存", None, build_ruleset(7))
+        print_result("已有未提交的事务时仍可保存", saved[1] == 1 and not db.conn.in_transaction)
+    except sqlite3.OperationalError as e:
+        print_result("已有未提交的事务时仍可保存", False, str(e))
+    errors = []
+    threads_count, saves = 4, 15
+
+    def save_versions(t):
+        try:
+            for i in range(saves):
+                db.save_ruleset("并发规则集", f"线程{t}", build_ruleset(1000 * t + i))
+        except Exception as e:
+            errors.append(repr(e))
+
+    def save_pools(t):
+        try:
+            for i in range(saves):
+                db.save_map_pool(f"并发地图池{t}-{i}", [f"village_R{i:02d}"])
+                db.create_account(f"concurrent_{t}_{i}", "hash", "salt")
+        except Exception as e:
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=target, args=(t,)) for t in range(threads_count)
+               for target in (save_versions, save_pools)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    concurrent_id = db.get_ruleset_by_name("并发规则集")["id"]
+    versions = [v["version"] for v in db.get_ruleset_versions(concurrent_id)]
+    pools = sum(1 for row in db.get_all_map_pools() if row["name"].startswith("并发地图池"))
+    print_result("多个线程同时保存规则集、地图池和账号时没有出错", not errors, errors[0] if errors else "")
+    print_result("版本号连续且没有重复", versions == list(range(threads_count * saves, 0, -1)),
+                 f"共 {len(versions)} 个版本")
+    print_result("其他线程的写入全部提交", pools == threads_count * saves and not db.conn.in_transaction)
+
+    print_header("开始比赛时取出规则集的耗时")
+    big_id, big_version = db.save_ruleset("大型规则集", None, build_ruleset(30, extra_rules=40))
+    calls = 200
+    start = time.perf_counter()
+    for _ in range(calls):
+        db.load_ruleset(big_id, big_version)
+    lookup = (time.perf_counter() - start) / calls * 1e6
+    ruleset_json = json.dumps(build_ruleset(30, extra_rules=40))
+    engine = RuleEngine()
+    start = time.perf_counter()
+    for _ in range(calls):
+        # 不使用持久化时：每次拿到的都是新解析的规则集字典，需要重新校验和编译
+        engine._expression_cache.clear()
+        engine._native_cache.clear()
+        engine._condition_cache.clear()
+        engine.precompile_ruleset(json.loads(ruleset_json))
+    compile_time = (time.perf_counter() - start) / calls * 1e6
+    print(f"- 缓存命中: {lookup:.1f} us/次, 重新解析并编译: {compile_time:.1f} us/次")
+    print_result("取出已编译规则集只是一次缓存查找", lookup * 20 < compile_time, f"快 {compile_time / lookup:.0f} 倍")
+
+    print_header("旧版数据库迁移")
+    conn = sqlite3.connect(LEGACY_DB_PATH)
+    conn.execute("CREATE TABLE rulesets ( id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL, "
+                 "author TEXT, ruleset_json TEXT NOT NULL )")
+    conn.execute("INSERT INTO rulesets (name, author, ruleset_json) VALUES (?, ?, ?)",
+                 ("旧规则集", "Legacy", json.dumps(build_ruleset(30))))
+    conn.commit()
+    conn.close()
+    legacy = open_db(LEGACY_DB_PATH)
+    record = legacy.get_ruleset_by_name("旧规则集")
+    print_result("旧规则集记为第1版", record is not None and record["version"] == 1 and record["ruleset"] == build_ruleset(30))
+    print_result("之后的修改保存为第2版", legacy.save_ruleset("旧规则集", "Legacy", build_ruleset(5))[1] == 2)
+
+
+if __name__ == '__main__':
+    cleanup()
+    try:
+        run_verification()
+    finally:
+        cleanup()
@@ -0,0 +1,192 @@
+# 文件名: verify_scoring_engine.py
+# 验证积分引擎：按积分表计分、增量维护的排名与完整排序一致、成绩更正、写入 match_history 后从历史记录重建，
+# 以及输出到规则引擎的选手状态和记分板的比分
+
+import contextlib
+import io
+import os
+import random
+import time
+
+from core.db_manager import DBManager
+from core.rule_engine import GameState, PlayerState, RuleEngine
+from core.scoring_engine import PointsTable, ScoringEngine
+
+TEST_DB_PATH = 'data/verification_scoring.db'
+ROUNDS = 60
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def cleanup():
+    if DBManager._instance is not None:
+        DBManager._instance.close()
+        DBManager._instance = None
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(TEST_DB_PATH + suffix):
+            os.remove(TEST_DB_PATH + suffix)
+
+
+def random_results(rng, player_ids, retire_rate=0.1):
+    order = list(player_ids)
+    rng.shuffle(order)
+    return {player_id: (None if rng.random() < retire_rate else position)
+            for position, player_id in enumerate(order, 1)}
+
+
+class Reference:
+    """对照实现：保存每轮成绩，每次都重新计算总分并对所有选手完整排序"""
+
+    def __init__(self, points, players):
+        self.points = points
+        self.players = players  # {选手ID: 队伍}
+        self.rounds = {}
+
+    def standings(self):
+        totals = {player_id: 0 for player_id in self.players}
+        for results in self.rounds.values():
+            for player_id, position in results.items():
+                totals[player_id] += self.points.points_for(position)
+        last = self.rounds[max(self.rounds)] if self.rounds else {}
+
+        def key(player_id):
+            position = last.get(player_id)
+            return -totals[player_id], position if position is not None else 1 << 30, player_id
+        return [(player_id, totals[player_id]) for player_id in sorted(self.players, key=key)]
+
+
+def as_pairs(engine):
+    return [(row["player_id"], row["total_score"]) for row in engine.standings()]
+
+
+def build_engine(match_name, players, db=None, points=None):
+    engine = ScoringEngine(match_name, points, db=db, ruleset_id=7)
+    for player_id, team_id in players.items():
+        engine.add_player(player_id, f"选手{player_id}", team_id)
+    return engine
+
+
+def run_verification():
+    db = DBManager(TEST_DB_PATH)
+    rng = random.Random(48)
+
+    print_header("积分表")
+    table = PointsTable((10, 8, 6), retired=-1)
+    print_result("按名次计分", [table.points_for(p) for p in (1, 2, 3, 4)] == [10, 8, 6, 0])
+    print_result("未完赛的得分", table.points_for(None) == -1)
+
+    print_header(f"增量排名与完整排序一致 ({ROUNDS} 轮)")
+    players = {f"p{i:02d}": f"team{i % 3}" for i in range(12)}
+    points = PointsTable()
+    engine = build_engine("验证赛", players, db=db, points=points)
+    reference = Reference(points, players)
+    mismatches = 0
+    for round_number in range(1, ROUNDS + 1):
+        # 偶尔有选手缺席一轮
+        results = random_results(rng, [p for p in players if rng.random() > 0.05])
+        awarded = engine.record_round(round_number, results)
+        reference.rounds[round_number] = results
+        expected = reference.standings()
+        mismatches += as_pairs(engine) != expected
+        mismatches += any(engine.rank_of(player_id) != rank for rank, (player_id, _) in enumerate(expected, 1))
+        if awarded != {player_id: points.points_for(position) for player_id, position in results.items()}:
+            mismatches += 1
+    print_result("每一轮的排名、名次查询和得分都与对照实现一致", mismatches == 0, f"不一致 {mismatches} 次")
+    teams = {}
+    for player_id, total in reference.standings():
+        teams[players[player_id]] = teams.get(players[player_id], 0) + total
+    print_result("队伍总分", engine.team_totals() == teams, f"{engine.team_totals()}")
+
+    print_header("成绩更正")
+    for round_number in (ROUNDS, 5):  # 更正最近一轮和更早的一轮
+        results = random_results(rng, players)
+        engine.record_round(round_number, results)
+        reference.rounds[round_number] = results
+        print_result(f"更正第 {round_number} 轮后排名一致", as_pairs(engine) == reference.standings())
+
+    print_header("从 match_history 重建")
+    start = time.perf_counter()
+    rebuilt = ScoringEngine.rebuild("验证赛", db)
+    elapsed = (time.perf_counter() - start) * 1000
+    print_result("重建后的排名与崩溃前一致", rebuilt.standings() == engine.standings(), f"耗时 {elapsed:.1f} ms")
+    print_result("重建后的轮次、队伍总分和规则集ID一致",
+                 rebuilt.round_number == engine.round_number and rebuilt.team_totals() == engine.team_totals()
+                 and rebuilt.ruleset_id == 7)
+    results = random_results(rng, players)
+    engine.record_round(ROUNDS + 1, results)
+    rebuilt.db = None  # 只在内存中继续，避免重复写入
+    rebuilt.record_round(ROUNDS + 1, results)
+    print_result("重建后可以继续计分", rebuilt.standings() == engine.standings())
+    print_result("其他比赛的记录不受影响", ScoringEngine.rebuild("另一场比赛", db).standings() == [])
+    roster_only = build_engine("尚未开赛", {"r1": "red", "r2": "blue", "r3": None}, db=db)
+    roster_only.add_player("r3", "改名的选手", "red")
+    restored = ScoringEngine.rebuild("尚未开赛", db)
+    print_result("第一轮之前加入的选手 (及其改名、换队) 在重建后仍然存在",
+                 restored.standings() == roster_only.standings() and restored.team_totals() == {"red": 0, "blue": 0}
+                 and restored.round_number == 0, f"{[row['name'] for row in restored.standings()]}")
+    history_rows = len(db.get_match_history("尚未开赛"))
+    roster_only.add_player("r1", "选手r1", "red")
+    print_result("名称和队伍没有变化时不重复写入名单", len(db.get_match_history("尚未开赛")) == history_rows)
+    restored.db = None
+    restored.record_round(1, {"r1": 1, "r2": 2, "r3": 3})
+    print_result("名单记录不计入轮次，之后可以正常计分", restored.rank_of("r1") == 1 and restored.round_number == 1)
+
+    print_header("输出到规则引擎和记分板")
+    state = GameState(round_number=engine.round_number, mode='team',
+                      players=[PlayerState(player_id, f"选手{player_id}", 0, 0, team_id=team)
+                               for player_id, team in players.items()])
+    state.get_player_by_rank(1)  # 先建立索引，确认写入排名后索引会失效
+    engine.apply_to(state)
+    leader = engine.standings()[0]
+    print_result("写入已有的选手状态", state.get_player_by_rank(1).id == leader["player_id"]
+                 and state.get_player_by_rank(1).total_score == leader["total_score"])
+    states = engine.player_states(connected={leader["player_id"]: False})
+    print_result("按排名生成选手状态", [p.rank for p in states] == list(range(1, len(players) + 1))
+                 and not states[0].is_connected and all(p.is_connected for p in states[1:]))
+    ruleset = {"map_selection_rules": [
+        {"comment": "领先队伍", "condition": "game_state.get_winning_team() is not None",
+         "action": {"type": "team_choice"}}]}
+    with contextlib.redirect_stdout(io.StringIO()):
+        action = RuleEngine().get_next_action(ruleset, GameState(engine.round_number, 'team', states))
+    print_result("规则引擎可以直接使用", action == {"type": "team_choice"})
+    payload = engine.scores_payload()
+    print_result("记分板比分格式", payload[leader["name"]] == {"rank": 1, "total_score": leader["total_score"],
+                                                         "team": leader["team_id"]})
+
+    print_header("每条成绩后都需要最新排名时的耗时 (256 名选手)")
+    many = {f"q{i:03d}": None for i in range(256)}
+    fast = build_engine("大型比赛", many)
+    totals = {player_id: 0 for player_id in many}
+    rounds = [random_results(rng, many) for _ in range(10)]
+    start = time.perf_counter()
+    for round_number, results in enumerate(rounds, 1):
+        fast.record_round(round_number, results)
+    incremental = time.perf_counter() - start
+    start = time.perf_counter()
+    for results in rounds:
+        for player_id, position in results.items():
+            totals[player_id] += points.points_for(position)
+            # 对照：每条成绩后对所有选手重新排序
+            sorted(totals, key=lambda p: (-totals[p], results.get(p) or 1 << 30, p))
+    resort = time.perf_counter() - start
+    print(f"- 增量维护: {incremental * 1000:.1f} ms, 每条成绩后重新排序: {resort * 1000:.1f} ms")
+    print_result("增量维护更快", incremental < resort, f"快 {resort / incremental:.0f} 倍")
+
+
+if __name__ == '__main__':
+    cleanup()
+    try:
+        run_verification()
+    finally:
+        cleanup()
@@ -0,0 +1,104 @@
+# 文件名: verify_web_assets.py
+# 验证页面与静态文件缓存：强 ETag / 304、带指纹地址的长期缓存头、预压缩 gzip 版本
+
+import gzip
+import os
+import re
+import time
+import urllib.error
+import urllib.request
+
+# 必须在导入Web服务之前初始化测试数据库，否则单例会指向正式数据库
+from core.db_manager import DBManager
+
+TEST_DB_PATH = 'data/web_assets_test.db'
+HOST, PORT = "127.0.0.1", 8000
+REQUESTS = 500
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def fetch(path, headers=None):
+    """返回 (状态码, 响应头, 响应体)；urllib 不会自动解压，便于检查原始编码"""
+    request = urllib.request.Request(f"http://{HOST}:{PORT}{path}", headers=headers or {})
+    try:
+        with urllib.request.urlopen(request) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def run_checks():
+    print_header("页面")
+    status, headers, body = fetch("/dashboard")
+    etag = headers.get("ETag")
+    print_result("页面带强 ETag", status == 200 and etag and not etag.startswith("W/"), etag)
+    match = re.search(r'src="(/static/js/main\.js\?v=[0-9a-f]+)"', body.decode("utf-8"))
+    print_result("模板引用带指纹的脚本地址", match is not None, match.group(1) if match else "")
+    status, _, body = fetch("/dashboard", {"If-None-Match": etag})
+    print_result("If-None-Match 命中时返回 304", status == 304 and not body)
+
+    print_header("静态文件")
+    script_url = match.group(1)
+    status, headers, plain = fetch(script_url)
+    print_result("带指纹的地址可长期缓存", "immutable" in headers.get("Cache-Control", ""),
+                 headers.get("Cache-Control"))
+    status, headers, _ = fetch("/static/js/main.js")
+    print_result("不带指纹的地址需要重新验证", headers.get("Cache-Control") == "no-cache")
+    status, headers, compressed = fetch(script_url, {"Accept-Encoding": "gzip"})
+    print_result("客户端接受 gzip 时返回预压缩版本",
+                 headers.get("Content-Encoding") == "gzip" and gzip.decompress(compressed) == plain,
+                 f"{len(plain)} -> {len(compressed)} 字节")
+    print_result("gzip 版本使用不同的 ETag 并声明 Vary",
+                 headers.get("ETag") != fetch(script_url)[1].get("ETag")
+                 and headers.get("Vary") == "Accept-Encoding")
+    status, _, _ = fetch(script_url, {"If-None-Match": headers.get("ETag"), "Accept-Encoding": "gzip"})
+    print_result("gzip 版本的 ETag 同样可以重新验证", status == 304)
+    status, _, _ = fetch("/static/js/missing.js")
+    print_result("不存在的文件返回 404", status == 404)
+    status, _, _ = fetch("/static/../server.py")
+    print_result("不能访问静态目录之外的文件", status == 404)
+
+    print_header(f"连续请求 {REQUESTS} 次仪表盘页面")
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        fetch("/dashboard", {"Accept-Encoding": "gzip"})
+    elapsed = (time.perf_counter() - start) / REQUESTS * 1000
+    print(f"- 平均每次 {elapsed:.2f} ms (含客户端开销)")
+
+
+def run_verification():
+    DBManager(TEST_DB_PATH)
+    from core.web_service_manager import WebServiceManager
+
+    web_manager = WebServiceManager()
+    web_manager.configure(host=HOST, port=PORT, log_level="warning")
+    web_manager.start_server()
+    try:
+        if not web_manager.wait_until_ready():
+            print_result("服务就绪", False)
+            return
+        run_checks()
+    finally:
+        web_manager.stop_server()
+
+
+if __name__ == '__main__':
+    try:
+        run_verification()
+    finally:
+        DBManager().close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB_PATH + suffix):
+                os.remove(TEST_DB_PATH + suffix)
@@ -0,0 +1,126 @@
+# 文件名: verify_web_catalog.py
+# 验证地图库只读API：筛选与分页、条件请求 (304)、数据变化后 ETag 更新，以及缓存命中时不访问数据库
+
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+
+# 必须在导入Web服务之前初始化测试数据库，否则单例会指向正式数据库
+from core.db_manager import DBManager
+
+TEST_DB_PATH = 'data/web_catalog_test.db'
+HOST, PORT = "127.0.0.1", 8000
+REQUESTS = 200
+
+SAMPLE_MAPS = [
+    {"id": f"{theme}_R{i:02d}", "translations": {"cn": f"{theme} 赛道 {i}", "en": f"{theme} track {i}"},
+     "difficulty": i % 5 + 1, "game_type": "竞速" if i % 3 else "道具", "has_reverse_mode": i % 2 == 0,
+     "tags": ["sample"]}
+    for theme in ("village", "forest", "desert") for i in range(1, 31)
+]
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def fetch(path, headers=None):
+    request = urllib.request.Request(f"http://{HOST}:{PORT}{path}", headers=headers or {})
+    try:
+        with urllib.request.urlopen(request) as resp:
+            body = resp.read()
+            return resp.status, resp.headers, json.loads(body) if body else None
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, None
+
+
+def run_checks(db, catalog):
+    print_header("筛选与分页")
+    status, headers, data = fetch("/api/maps?page_size=20")
+    print_result("第一页返回 20 条，总数 90", status == 200 and len(data["items"]) == 20 and data["total"] == 90)
+    _, _, last = fetch("/api/maps?page_size=20&page=5")
+    print_result("最后一页只剩 10 条", len(last["items"]) == 10)
+    _, _, filtered = fetch("/api/maps?theme=forest&difficulty=3")
+    print_result("按主题和难度筛选", filtered["total"] == 6
+                 and all(m["theme"] == "forest" and m["difficulty"] == 3 for m in filtered["items"]),
+                 f"共 {filtered['total']} 条")
+    _, _, by_type = fetch("/api/maps?type=%E9%81%93%E5%85%B7")
+    print_result("按类型筛选", by_type["total"] == 30)
+    status, _, _ = fetch("/api/maps?page_size=1000")
+    print_result("超出上限的 page_size 被拒绝", status == 422)
+    _, _, themes = fetch("/api/themes")
+    print_result("主题列表", [t["theme"] for t in themes["themes"]] == ["desert", "forest", "village"])
+
+    print_header("地图池")
+    status, _, pool = fetch("/api/pools/%E5%86%B3%E8%B5%9B")
+    print_result("地图池展开为地图详情", status == 200 and [m["id"] for m in pool["maps"]] ==
+                 ["village_R02_rvs", "forest_R01", "removed_R99"]
+                 and pool["maps"][0]["reverse"] and pool["maps"][2]["map"] is None)
+    status, _, _ = fetch("/api/pools/missing")
+    print_result("不存在的地图池返回 404", status == 404)
+
+    print_header("条件请求")
+    status, headers, _ = fetch("/api/maps?page_size=20")
+    etag = headers.get("ETag")
+    status, _, _ = fetch("/api/maps?page_size=20", {"If-None-Match": etag})
+    print_result("ETag 未变时返回 304", status == 304, etag)
+
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        fetch("/api/maps?page_size=20", {"If-None-Match": etag})
+    elapsed = (time.perf_counter() - start) / REQUESTS * 1000
+    db.conn.set_trace_callback(None)
+    # 版本号每 check_interval 秒最多查询一次
+    expected = int(REQUESTS * elapsed / 1000 / catalog.check_interval) + 1
+    print_result(f"{REQUESTS} 次轮询几乎不访问数据库", len(statements) <= expected,
+                 f"执行了 {len(statements)} 条SQL，平均每次请求 {elapsed:.2f} ms")
+
+    db.update_map_details("village_R01", "name_cn", "改名后的赛道")
+    time.sleep(catalog.check_interval + 0.1)
+    status, headers, data = fetch("/api/maps?page_size=20&theme=village")
+    print_result("主题筛选的结果反映改动", any(m["names"]["cn"] == "改名后的赛道" for m in data["items"]))
+    status, headers, data = fetch("/api/maps?page_size=20", {"If-None-Match": etag})
+    print_result("地图改动后旧 ETag 失效", status == 200 and headers.get("ETag") != etag, headers.get("ETag"))
+
+
+def run_verification():
+    db = DBManager(TEST_DB_PATH)
+    db.clear_maps_table()
+    db.save_maps_batch(SAMPLE_MAPS)
+    db.save_map_pool("决赛", ["village_R02_rvs", "forest_R01", "removed_R99"])
+    from core.web_service_manager import WebServiceManager
+    from web.server import catalog
+
+    web_manager = WebServiceManager()
+    web_manager.configure(host=HOST, port=PORT, log_level="warning")
+    web_manager.start_server()
+    try:
+        if not web_manager.wait_until_ready():
+            print_result("服务就绪", False)
+            return
+        run_checks(db, catalog)
+    finally:
+        web_manager.stop_server()
+
+
+if __name__ == '__main__':
+    try:
+        run_verification()
+    finally:
+        DBManager().close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB_PATH + suffix):
+                os.remove(TEST_DB_PATH + suffix)
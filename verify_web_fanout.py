@@ -0,0 +1,168 @@
+# 文件名: verify_web_fanout.py
+# 验证广播扇出：一个卡住的客户端不应拖慢其他客户端，并报告各连接的发送队列深度
+
+import asyncio
+
+from web.connection_manager import ConnectionManager, SLOW_CLIENT_POLICIES, user_topic
+from web.scoreboard import Scoreboard
+
+FAST_CLIENTS = 50
+MESSAGES = 500
+QUEUE_SIZE = 64
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+class FakeWebSocket:
+    """模拟的WebSocket：stalled=True 时 send_text 永远不会返回"""
+
+    def __init__(self, stalled=False):
+        self.stalled = stalled
+        self.received = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.received.append(data)
+
+    send_bytes = send_text
+
+    async def close(self, code=1000, reason=None):
+        self.close_code = code
+
+
+async def run_policy(policy):
+    manager = ConnectionManager(max_queue_size=QUEUE_SIZE, slow_client_policy=policy)
+    sockets = {f"fast_{i}": FakeWebSocket() for i in range(FAST_CLIENTS)}
+    sockets["stalled"] = FakeWebSocket(stalled=True)
+    for username, ws in sockets.items():
+        await manager.connect(ws, username)
+
+    for i in range(MESSAGES):
+        # 交替发送两种消息类型，便于观察 coalesce 策略
+        kind = "score_update" if i % 2 else "broadcast"
+        await manager.broadcast({"type": kind, "seq": i})
+        if i % 16 == 0:
+            await asyncio.sleep(0)
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+    stats = manager.get_queue_stats()
+    fast_ok = all(len(sockets[f"fast_{i}"].received) == MESSAGES for i in range(FAST_CLIENTS))
+    print_result(f"[{policy}] 正常客户端收到全部 {MESSAGES} 条消息", fast_ok)
+    stalled = stats["per_client"].get("stalled")
+    if stalled is None:
+        print_result(f"[{policy}] 卡住的客户端已被断开", sockets["stalled"].close_code is not None,
+                     f"关闭码: {sockets['stalled'].close_code}")
+    else:
+        print_result(f"[{policy}] 卡住的客户端队列保持有界", stalled["depth"] <= QUEUE_SIZE,
+                     f"深度 {stalled['depth']} / 上限 {QUEUE_SIZE}，已丢弃 {stalled['dropped']} 帧")
+    print(f"  > 队列汇总: 连接数 {stats['clients']}，总深度 {stats['total_depth']}，"
+          f"最大深度 {stats['max_depth']}，总丢弃 {stats['total_dropped']}")
+    for connection in list(manager.active_connections.values()):
+        await connection.close()
+
+
+async def run_topics():
+    manager = ConnectionManager()
+    sockets = {}
+    for group in ("A", "B"):
+        for i in range(20):
+            name = f"{group}_player_{i}"
+            sockets[name] = FakeWebSocket()
+            await manager.connect(sockets[name], name, [f"match:{group}", "role:player"])
+    sockets["caster"] = FakeWebSocket()
+    await manager.connect(sockets["caster"], "caster", ["match:A", "match:B", "role:caster"])
+    sockets["intruder"] = FakeWebSocket()
+    intruder = await manager.connect(sockets["intruder"], "intruder", ["user:A_player_0", "bogus"])
+
+    delivered_a = await manager.publish({"type": "score_update", "round": 1}, "match:A")
+    delivered_casters = await manager.publish({"type": "broadcast", "text": "casters"}, "role:caster")
+    delivered_union = await manager.publish({"type": "broadcast", "text": "union"}, ["match:A", "role:caster"])
+    delivered_user = await manager.publish({"type": "broadcast", "text": "dm"}, user_topic("B_player_3"))
+    delivered_all = await manager.broadcast({"type": "broadcast", "text": "all"})
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+    print_result("match:A 只投递给A组选手与解说", delivered_a == 21, f"投递连接数: {delivered_a}")
+    print_result("B组选手收不到A组比分", all(len(sockets[f"B_player_{i}"].received) == (2 if i == 3 else 1)
+                                          for i in range(20)))
+    print_result("role:caster 只投递给解说", delivered_casters == 1)
+    print_result("多频道发布按并集去重", delivered_union == 21, f"投递连接数: {delivered_union}")
+    print_result("user:<用户名> 频道定向投递", delivered_user == 1)
+    print_result("广播投递给所有连接", delivered_all == len(sockets), f"投递连接数: {delivered_all}")
+    print_result("客户端不能订阅他人的私有频道或非法频道",
+                 intruder.topics == {"all", "user:intruder"}, f"实际订阅: {sorted(intruder.topics)}")
+    topic_sizes = {t: n for t, n in manager.get_queue_stats()["topics"].items() if not t.startswith("user:")}
+    print(f"  > 频道订阅人数: {topic_sizes}")
+    for connection in list(manager.active_connections.values()):
+        await connection.close()
+
+
+def run_scoreboard():
+    board = Scoreboard("match:A", history_size=8)
+    first = board.apply_update(1, {"老虎": 10, "辰辰": 8, "小草": 6})
+    second = board.apply_update(2, {"老虎": 18, "辰辰": 8, "小草": 6})
+    unchanged = board.apply_update(2, {"老虎": 18, "辰辰": 8, "小草": 6})
+    print_result("首次更新生成完整增量", first["seq"] == 1 and len(first["changes"]) == 3)
+    print_result("后续更新只包含变化的选手", second["changes"] == {"老虎": 18}, f"增量: {second['changes']}")
+    print_result("没有变化时不生成消息", unchanged is None)
+
+    replay = board.replay_since(1)
+    print_result("缓冲区内的缺口补发增量", [m["seq"] for m in replay] == [2])
+    print_result("客户端已是最新时无需补发", board.replay_since(2) == [])
+
+    for round_number in range(3, 20):
+        board.apply_update(round_number, {"老虎": 18 + round_number, "辰辰": 8, "小草": 6})
+    old_client = board.replay_since(2)
+    print_result("缺口超出环形缓冲区时改发快照",
+                 len(old_client) == 1 and old_client[0]["type"] == "score_snapshot",
+                 f"快照序号 {old_client[0]['seq']}，比分 {old_client[0]['scores']}")
+    print_result("新客户端直接获得快照", board.replay_since(None)[0]["type"] == "score_snapshot")
+
+    # 服务重启后记分板重新从序号 1 开始，纪元随之改变
+    restarted = Scoreboard("match:A", history_size=8)
+    restarted.apply_update(1, {"老虎": 40})
+    stale = restarted.replay_since(19, board.epoch)
+    print_result("增量和快照都带有纪元", first["epoch"] == board.epoch and stale[0]["epoch"] == restarted.epoch
+                 and restarted.epoch != board.epoch)
+    print_result("客户端保存的是旧纪元的状态时改发快照 (即使其序号更大)",
+                 len(stale) == 1 and stale[0]["type"] == "score_snapshot" and stale[0]["seq"] == 1)
+    print_result("未提供纪元的客户端按原有规则续传", restarted.replay_since(1) == [])
+    relayed = Scoreboard("match:B")
+    relayed.apply_update(1, {"老虎": 10}, seq=7, epoch="broker-1")
+    restarted_delta = relayed.apply_update(1, {"老虎": 10}, seq=1, epoch="broker-2")
+    print_result("代理重启 (纪元改变) 后从新纪元的序号继续",
+                 restarted_delta is not None and restarted_delta["seq"] == 1 and restarted_delta["epoch"] == "broker-2"
+                 and relayed.replay_since(0, "broker-1")[0]["type"] == "score_snapshot")
+
+
+def run_verification():
+    print_header("广播扇出与慢客户端策略")
+    for policy in SLOW_CLIENT_POLICIES:
+        asyncio.run(run_policy(policy))
+
+    print_header("频道订阅 (发布/订阅)")
+    asyncio.run(run_topics())
+
+    print_header("记分板增量与断线续传")
+    run_scoreboard()
+
+
+if __name__ == '__main__':
+    run_verification()
@@ -0,0 +1,102 @@
+# 文件名: verify_web_framing.py
+# 对比各帧格式在 500 个客户端时每次广播的线上字节数与服务器CPU耗时
+
+import asyncio
+import time
+import zlib
+
+from web.connection_manager import ConnectionManager
+from web.framing import FRAME_FORMATS, ORJSON_AVAILABLE, MSGPACK_AVAILABLE, negotiate_format
+
+CLIENTS = 500
+ROUNDS = 20
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+class CountingWebSocket:
+    """只统计发送字节数的模拟连接"""
+
+    def __init__(self, per_message_deflate=False):
+        self.bytes_sent = 0
+        # permessage-deflate 为每个连接维护独立的压缩上下文，无法在连接间共享
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, -15) if per_message_deflate else None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        await self.send_bytes(data.encode("utf-8"))
+
+    async def send_bytes(self, data):
+        if self.compressor is not None:
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.bytes_sent += len(data)
+
+    async def close(self, code=1000):
+        pass
+
+
+def sample_messages(r=0):
+    """r 为轮次，用于让每次广播的内容略有不同 (permessage-deflate 的跨消息上下文对完全重复的消息过于有利)"""
+    standings = {
+        "type": "score_snapshot",
+        "topic": "match:A",
+        "seq": 128 + r,
+        "round": 12 + r,
+        "scores": {f"选手_{i:03d}": {"rank": i + 1, "total_score": 500 - i * 7 + (i * r) % 11, "team": f"team_{i % 8}"}
+                   for i in range(64)},
+    }
+    map_pool = {
+        "type": "map_pool",
+        "name": f"决赛图池 v{r}",
+        "maps": [{"id": f"forest_I{i:02d}", "theme": "forest", "name_cn": f"森林 木桶 {i}",
+                  "name_tw": f"森林 木桶 {i}", "name_kr": f"숲 나무통 {i}", "name_en": f"Forest Barrel {i}",
+                  "difficulty": (i + r) % 5 + 1, "game_type": "I", "has_reverse_mode": bool(i % 2)}
+                 for i in range(60)],
+    }
+    delta = {"type": "score_delta", "topic": "match:A", "seq": 129 + r, "round": 13 + r,
+             "changes": {f"选手_{r % 64:03d}": {"rank": 3, "total_score": 460 + r}}, "removed": []}
+    return {"完整排名 (64人)": standings, "图池推送 (60张)": map_pool, "比分增量": delta}
+
+
+async def measure(messages, fmt, per_message_deflate=False):
+    manager = ConnectionManager(max_queue_size=ROUNDS + 1)
+    sockets = [CountingWebSocket(per_message_deflate) for _ in range(CLIENTS)]
+    for i, ws in enumerate(sockets):
+        await manager.connect(ws, f"client_{i}", frame_format=fmt)
+    await asyncio.sleep(0)
+
+    start = time.process_time()
+    for message in messages:
+        await manager.publish(message)
+        while any(conn.queue for conn in manager.active_connections.values()):
+            await asyncio.sleep(0)
+    cpu_ms = (time.process_time() - start) * 1000 / ROUNDS
+    wire_bytes = sum(ws.bytes_sent for ws in sockets) / ROUNDS
+
+    for connection in list(manager.active_connections.values()):
+        await connection.close()
+    return wire_bytes, cpu_ms
+
+
+def run_verification():
+    print(f"orjson 可用: {ORJSON_AVAILABLE}，msgpack 可用: {MSGPACK_AVAILABLE}")
+    rounds = [sample_messages(r) for r in range(ROUNDS)]
+    for title in rounds[0]:
+        messages = [variants[title] for variants in rounds]
+        print_header(f"{title} -> {CLIENTS} 个客户端")
+        cases = [(fmt, False) for fmt in FRAME_FORMATS] + [("json", True)]
+        for fmt, pmd in cases:
+            actual = negotiate_format(fmt)
+            label = actual + (" + permessage-deflate" if pmd else "")
+            wire_bytes, cpu_ms = asyncio.run(measure(messages, actual, pmd))
+            print(f"- {label:<32} 每次广播 {wire_bytes / 1024:9.1f} KiB，CPU {cpu_ms:7.2f} ms")
+
+
+if __name__ == '__main__':
+    run_verification()
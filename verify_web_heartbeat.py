@@ -0,0 +1,85 @@
+# 文件名: verify_web_heartbeat.py
+# 验证心跳与死连接清理：回应 ping 的客户端保留，沉默 (idle) 与写入卡住 (stalled) 的客户端被移除且计数
+
+import asyncio
+import json
+
+from web import metrics
+from web.connection_manager import ConnectionManager
+
+INTERVAL = 0.2
+TIMEOUT = 0.2
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+class FakeWebSocket:
+    """模拟的WebSocket：mode 为 alive (回应 ping)、silent (从不回应) 或 stalled (写入永远不返回)"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.connection = None
+        self.received = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        if self.mode == "stalled" and self.received:
+            await asyncio.Event().wait()
+        self.received.append(data)
+        if self.mode == "alive" and json.loads(data).get("type") == "ping":
+            self.connection.touch()  # 相当于服务端收到了 {"action": "pong"}
+
+    send_bytes = send_text
+
+    async def close(self, code=1000, reason=None):
+        self.close_code = code
+
+
+async def run_checks():
+    manager = ConnectionManager(heartbeat_interval=INTERVAL, heartbeat_timeout=TIMEOUT)
+    sockets = {mode: FakeWebSocket(mode) for mode in ("alive", "silent", "stalled")}
+    for mode, ws in sockets.items():
+        ws.connection = await manager.connect(ws, mode)
+    heartbeat = asyncio.create_task(manager.run_heartbeat())
+
+    # 让 stalled 客户端卡在写入上
+    await manager.broadcast({"type": "broadcast", "text": "hello"})
+    await manager.broadcast({"type": "broadcast", "text": "hello again"})
+    await asyncio.sleep((INTERVAL + TIMEOUT) * 3)
+    heartbeat.cancel()
+
+    pings = sum(1 for data in sockets["alive"].received if json.loads(data).get("type") == "ping")
+    print_result("回应 ping 的客户端保留在连接列表中", "alive" in manager.active_connections, f"收到 {pings} 次 ping")
+    print_result("沉默的客户端被移除", "silent" not in manager.active_connections,
+                 f"关闭码: {sockets['silent'].close_code}")
+    print_result("写入卡住的客户端被移除", "stalled" not in manager.active_connections,
+                 f"关闭码: {sockets['stalled'].close_code}")
+    audience = {c.username for c in manager.audience(None)}
+    print_result("广播受众只包含存活的客户端", audience == {"alive"}, f"受众: {sorted(audience)}")
+    print_result("按原因统计被移除的连接",
+                 metrics.reaped_total.value(("idle",)) == 1 and metrics.reaped_total.value(("stalled",)) == 1,
+                 f"idle {metrics.reaped_total.value(('idle',))}，stalled {metrics.reaped_total.value(('stalled',))}")
+
+    manager.heartbeat_interval = 0
+    print_result("心跳间隔为 0 时不做检查", manager.check_liveness() == 0)
+    for connection in list(manager.active_connections.values()):
+        await connection.close()
+
+
+if __name__ == '__main__':
+    print_header("心跳与死连接清理")
+    asyncio.run(run_checks())
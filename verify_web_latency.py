@@ -0,0 +1,98 @@
+# 文件名: verify_web_latency.py
+# 测量从 WebServiceManager.send_command 到客户端收到消息的端到端延迟
+
+import asyncio
+import json
+import os
+import statistics
+import time
+import urllib.parse
+import urllib.request
+
+# 必须在导入Web服务之前初始化测试数据库，否则单例会指向正式数据库
+from core.db_manager import DBManager
+
+TEST_DB_PATH = 'data/web_latency_test.db'
+HOST, PORT = "127.0.0.1", 8000
+PROBE_USER, PROBE_PASSWORD = "latency_probe", "probe12345"
+SAMPLES = 200
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def login(username, password):
+    data = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    with urllib.request.urlopen(f"http://{HOST}:{PORT}/login", data=data) as resp:
+        result = json.loads(resp.read())
+    if result.get("status") != "success":
+        raise RuntimeError(f"登录失败: {result}")
+    return result["token"]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def measure(web_manager, token):
+    import websockets
+
+    latencies = []
+    loop = asyncio.get_running_loop()
+    async with websockets.connect(f"ws://{HOST}:{PORT}/ws/{token}") as ws:
+        for seq in range(SAMPLES):
+            command = {"type": "latency_probe", "seq": seq, "sent_at": time.perf_counter()}
+            # 从另一个线程投递，模拟Qt主线程调用 send_command 的场景
+            await loop.run_in_executor(None, web_manager.send_command, command)
+            while True:
+                message = json.loads(await ws.recv())
+                if message.get("type") == "latency_probe" and message.get("seq") == seq:
+                    latencies.append((time.perf_counter() - message["sent_at"]) * 1000)
+                    break
+            # 每次测量之间稍作间隔，避免所有指令落在同一次唤醒中
+            await asyncio.sleep(0.013)
+    return latencies
+
+
+def run_verification():
+    DBManager(TEST_DB_PATH)
+    from core.auth_manager import AuthManager
+    from core.web_service_manager import WebServiceManager
+
+    auth_manager = AuthManager()
+    if not auth_manager.db.get_account_by_username(PROBE_USER):
+        auth_manager.create_account(PROBE_USER, PROBE_PASSWORD)
+
+    web_manager = WebServiceManager()
+    web_manager.configure(host=HOST, port=PORT)
+    web_manager.start_server()
+    try:
+        if not web_manager.wait_until_ready():
+            print("❌ Web服务未能在规定时间内启动。")
+            return
+        token = login(PROBE_USER, PROBE_PASSWORD)
+
+        print_header("端到端广播延迟 (send_command -> 客户端收到)")
+        latencies = asyncio.run(measure(web_manager, token))
+        print(f"- 样本数: {len(latencies)}")
+        print(f"- 平均值: {statistics.mean(latencies):.3f} ms")
+        print(f"- p50:    {percentile(latencies, 50):.3f} ms")
+        print(f"- p90:    {percentile(latencies, 90):.3f} ms")
+        print(f"- p99:    {percentile(latencies, 99):.3f} ms")
+        print(f"- 最大值: {max(latencies):.3f} ms")
+    finally:
+        web_manager.stop_server()
+
+
+if __name__ == '__main__':
+    try:
+        run_verification()
+    finally:
+        DBManager().close()
+        if os.path.exists(TEST_DB_PATH):
+            os.remove(TEST_DB_PATH)
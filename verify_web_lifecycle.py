@@ -0,0 +1,172 @@
+# 文件名: verify_web_lifecycle.py
+# 验证Web服务的优雅停止与快速重启：关闭帧、就绪信号、端口复用、重启期间的记分板不丢失
+
+import asyncio
+import json
+import os
+import time
+import urllib.parse
+import urllib.request
+
+# 必须在导入Web服务之前初始化测试数据库，否则单例会指向正式数据库
+from core.db_manager import DBManager
+
+TEST_DB_PATH = 'data/web_lifecycle_test.db'
+HOST, PORT = "127.0.0.1", 8000
+PROBE_USER, PROBE_PASSWORD = "lifecycle_probe", "probe12345"
+RESTARTS = 5
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def login(username, password):
+    data = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    with urllib.request.urlopen(f"http://{HOST}:{PORT}/login", data=data) as resp:
+        return json.loads(resp.read())["token"]
+
+
+async def connect_and_resume(token, seqs):
+    import websockets
+    ws = await websockets.connect(f"ws://{HOST}:{PORT}/ws/{token}?topics=match:A")
+    await ws.send(json.dumps({"action": "resume", "seqs": seqs}))
+    return ws
+
+
+async def run_client_checks(web_manager, token):
+    import websockets
+
+    web_manager.send_command({"type": "score_update", "round": 1, "scores": {"老虎": 10}}, "match:A")
+    ws = await connect_and_resume(token, {})
+    snapshot = json.loads(await asyncio.wait_for(ws.recv(), 5))
+    print_result("连接后收到记分板快照", snapshot["type"] == "score_snapshot", f"序号 {snapshot['seq']}")
+
+    # 在停止过程中继续发送指令：停止前投递的应在关闭前送达
+    web_manager.send_command({"type": "score_update", "round": 2, "scores": {"老虎": 20}}, "match:A")
+    loop = asyncio.get_running_loop()
+    stop_future = loop.run_in_executor(None, web_manager.stop_server)
+    received = []
+    try:
+        while True:
+            received.append(json.loads(await asyncio.wait_for(ws.recv(), 5)))
+    except websockets.ConnectionClosed as e:
+        close_code = e.rcvd.code if e.rcvd else None
+    await stop_future
+    print_result("停止前投递的增量在关闭前送达", any(m.get("seq") == 2 for m in received))
+    print_result("客户端收到 1012 (服务重启) 关闭帧", close_code == 1012, f"关闭码: {close_code}")
+
+    # 服务停止期间投递的更新会暂存，重启后由续传补齐
+    web_manager.send_command({"type": "score_update", "round": 3, "scores": {"老虎": 30}}, "match:A")
+    await loop.run_in_executor(None, web_manager.start_server)
+    await loop.run_in_executor(None, web_manager.wait_until_ready)
+    await asyncio.sleep(0.1)
+    ws = await connect_and_resume(token, {"match:A": 2})
+    delta = json.loads(await asyncio.wait_for(ws.recv(), 5))
+    print_result("重启后凭序号续传停机期间的更新", delta["type"] == "score_delta" and delta["seq"] == 3,
+                 f"收到: {delta}")
+    await ws.close()
+
+
+def check_bridge_requeue():
+    """停止时仍在桥接器队列中、或已投递但尚未进入队列的指令应移回暂存区，重启后按原顺序补发"""
+    from web.command_bridge import CommandBridge
+    bridge = CommandBridge()
+
+    async def stop_with_backlog():
+        bridge.bind(asyncio.get_running_loop())
+        bridge.put(("match:A", {"n": 0}))
+        bridge.put(("match:A", {"n": 1}))
+        await asyncio.sleep(0)  # 前两条进入队列
+        bridge.put(("match:A", {"n": 2}))  # 已投递，解除绑定时尚未进入队列
+        requeued = bridge.unbind()
+        await asyncio.sleep(0)
+        bridge.put(("match:A", {"n": 3}))  # 停止后投递
+        return requeued
+
+    async def restart():
+        bridge.bind(asyncio.get_running_loop())
+        return await bridge.get_batch()
+
+    requeued = asyncio.run(stop_with_backlog())
+    batch = asyncio.run(restart())
+    order = [command["n"] for _, command in batch]
+    print_result("未处理的指令移回暂存区，重启后按顺序补发", requeued == 2 and order == [0, 1, 2, 3],
+                 f"移回 {requeued} 条，补发顺序 {order}")
+
+
+def run_verification():
+    from PyQt6.QtCore import QCoreApplication
+    qt_app = QCoreApplication.instance() or QCoreApplication([])  # 跨线程信号需要事件循环派发
+
+    DBManager(TEST_DB_PATH)
+    from core.auth_manager import AuthManager
+    from core.web_service_manager import WebServiceManager
+
+    auth_manager = AuthManager()
+    if not auth_manager.db.get_account_by_username(PROBE_USER):
+        auth_manager.create_account(PROBE_USER, PROBE_PASSWORD)
+
+    web_manager = WebServiceManager()
+    web_manager.configure(host=HOST, port=PORT, log_level="warning")
+    ready_urls = []
+    web_manager.signals.server_ready.connect(ready_urls.append)
+
+    print_header("启动与就绪信号")
+    start = time.perf_counter()
+    web_manager.start_server()
+    ready = web_manager.wait_until_ready()
+    print_result("服务就绪", ready, f"耗时 {(time.perf_counter() - start) * 1000:.0f} ms")
+    if not ready:
+        return
+    qt_app.processEvents()
+    print_result("发出 server_ready 信号", ready_urls == [f"http://{HOST}:{PORT}"], f"{ready_urls}")
+
+    print_header("优雅停止与续传")
+    token = login(PROBE_USER, PROBE_PASSWORD)
+    asyncio.run(run_client_checks(web_manager, token))
+    check_bridge_requeue()
+
+    print_header(f"连续重启 {RESTARTS} 次")
+    timings = []
+    for _ in range(RESTARTS):
+        start = time.perf_counter()
+        web_manager.restart_server()
+        ok = web_manager.wait_until_ready()
+        timings.append((time.perf_counter() - start) * 1000)
+        if not ok:
+            break
+    print_result("每次重启均成功绑定端口", len(timings) == RESTARTS and web_manager.is_ready())
+    print_result("重启耗时低于 1 秒", max(timings) < 1000,
+                 f"各次耗时: {', '.join(f'{t:.0f} ms' for t in timings)}")
+
+    print_header("端口被占用时的错误报告")
+    errors = []
+    web_manager.signals.server_error.connect(errors.append)
+    from core.web_service_manager import WebServerThread
+    second = WebServerThread(dict(web_manager.settings), web_manager.signals)
+    second.start()
+    second.wait()
+    qt_app.processEvents()
+    print_result("第二个实例启动失败并发出 server_error 信号", bool(errors), errors[0] if errors else "")
+
+    web_manager.stop_server()
+    print_result("停止后不再运行", not web_manager.is_running())
+
+
+if __name__ == '__main__':
+    try:
+        run_verification()
+    finally:
+        DBManager().close()
+        if os.path.exists(TEST_DB_PATH):
+            os.remove(TEST_DB_PATH)
@@ -0,0 +1,140 @@
+# 文件名: verify_web_metrics.py
+# 验证 /metrics 端点：指标以 Prometheus 文本格式导出，并随登录、连接和广播变化；同时测量埋点开销
+
+import asyncio
+import json
+import os
+import time
+import urllib.parse
+import urllib.request
+
+# 必须在导入Web服务之前初始化测试数据库，否则单例会指向正式数据库
+from core.db_manager import DBManager
+
+TEST_DB_PATH = 'data/web_metrics_test.db'
+HOST, PORT = "127.0.0.1", 8000
+PROBE_USER, PROBE_PASSWORD = "metrics_probe", "probe12345"
+BROADCASTS = 20
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def login(username, password):
+    data = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    with urllib.request.urlopen(f"http://{HOST}:{PORT}/login", data=data) as resp:
+        return json.loads(resp.read())
+
+
+def scrape():
+    """抓取 /metrics 并解析为 {样本名(含标签): 数值}"""
+    with urllib.request.urlopen(f"http://{HOST}:{PORT}/metrics") as resp:
+        content_type = resp.headers.get("Content-Type", "")
+        text = resp.read().decode("utf-8")
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return content_type, samples
+
+
+async def run_client(web_manager, token):
+    import websockets
+
+    async with websockets.connect(f"ws://{HOST}:{PORT}/ws/{token}") as ws:
+        await ws.send(json.dumps({"action": "subscribe", "topics": ["match:A"]}))
+        await asyncio.sleep(0.2)
+        for i in range(BROADCASTS):
+            web_manager.send_command({"type": "broadcast", "seq": i})
+        received = 0
+        while received < BROADCASTS + 1:  # +1: 订阅确认
+            await asyncio.wait_for(ws.recv(), 5)
+            received += 1
+        _, samples = await asyncio.get_running_loop().run_in_executor(None, scrape)
+    return samples
+
+
+def measure_overhead():
+    from web.metrics import Counter, Histogram
+    counter, histogram = Counter("bench_total", ""), Histogram("bench_seconds", "")
+    n = 200_000
+    start = time.perf_counter()
+    for i in range(n):
+        counter.inc()
+        histogram.observe(i * 1e-6)
+    return (time.perf_counter() - start) / n * 1e9
+
+
+def run_verification():
+    DBManager(TEST_DB_PATH)
+    from core.auth_manager import AuthManager
+    from core.web_service_manager import WebServiceManager
+
+    auth_manager = AuthManager()
+    if not auth_manager.db.get_account_by_username(PROBE_USER):
+        auth_manager.create_account(PROBE_USER, PROBE_PASSWORD)
+
+    web_manager = WebServiceManager()
+    web_manager.configure(host=HOST, port=PORT, log_level="warning")
+    web_manager.start_server()
+    try:
+        if not web_manager.wait_until_ready():
+            print_result("服务就绪", False)
+            return
+
+        print_header("指标导出")
+        content_type, before = scrape()
+        print_result("Content-Type 为 Prometheus 文本格式", content_type.startswith("text/plain; version=0.0.4"),
+                     content_type)
+        expected = ["web_connected_clients", "web_command_queue_depth", "web_login_duration_seconds_count",
+                    "web_broadcast_fanout_seconds_count", "web_send_queue_lag_seconds_count",
+                    "web_messages_sent_total", "web_messages_received_total"]
+        missing = [name for name in expected if name not in before]
+        print_result("包含全部关键指标", not missing, f"缺少: {missing}" if missing else "")
+
+        print_header("指标随流量变化")
+        token = login(PROBE_USER, PROBE_PASSWORD)["token"]
+        login(PROBE_USER, "wrong-password")
+        during = asyncio.run(run_client(web_manager, token))
+        time.sleep(0.2)
+        _, after = scrape()
+        print_result("登录成功/失败分别计数",
+                     after.get('web_logins_total{result="success"}') == 1
+                     and after.get('web_logins_total{result="error"}') == 1)
+        print_result("连接期间连接数为 1，断开后为 0",
+                     during["web_connected_clients"] == 1 and after["web_connected_clients"] == 0)
+        sent = after["web_messages_sent_total"] - before["web_messages_sent_total"]
+        print_result("发送帧计数", sent == BROADCASTS + 1, f"增加 {sent:.0f}")
+        print_result("收到消息计数", after["web_messages_received_total"] == 1)
+        fanouts = after["web_broadcast_fanout_seconds_count"] - before["web_broadcast_fanout_seconds_count"]
+        print_result("每次广播记录一次扇出耗时", fanouts == BROADCASTS, f"{fanouts:.0f} 次")
+        lag_count = after["web_send_queue_lag_seconds_count"]
+        lag_avg = after["web_send_queue_lag_seconds_sum"] / lag_count * 1000 if lag_count else float("nan")
+        print_result("记录发送队列延迟", lag_count == sent, f"平均 {lag_avg:.3f} ms")
+
+        print_header("埋点开销")
+        cost = measure_overhead()
+        print_result("一次计数加一次直方图观测低于 2 µs", cost < 2000, f"{cost:.0f} ns")
+    finally:
+        web_manager.stop_server()
+
+
+if __name__ == '__main__':
+    try:
+        run_verification()
+    finally:
+        DBManager().close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB_PATH + suffix):
+                os.remove(TEST_DB_PATH + suffix)
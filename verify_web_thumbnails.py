@@ -0,0 +1,132 @@
+# 文件名: verify_web_thumbnails.py
+# 验证缩略图与雪碧图：60张图的地图池一次图片请求即可加载，索引偏移正确，缩略图改动后重新生成；单张缩略图支持 ETag 与 Range
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from PIL import Image
+
+# 必须在导入Web服务之前初始化测试数据库，否则单例会指向正式数据库
+from core.db_manager import DBManager
+
+TEST_DB_PATH = 'data/web_thumbnails_test.db'
+HOST, PORT = "127.0.0.1", 8000
+POOL_NAME = "决赛"
+MAP_COUNT = 60
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def fetch(path, headers=None):
+    request = urllib.request.Request(f"http://{HOST}:{PORT}{path}", headers=headers or {})
+    try:
+        with urllib.request.urlopen(request) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def color_for(i):
+    return (i * 4 % 256, 255 - i * 4 % 256, i * 7 % 256, 255)
+
+
+def write_thumbnail(thumb_dir, map_id, color):
+    Image.new("RGBA", (64, 40), color).save(os.path.join(thumb_dir, f"{map_id}.png"))
+
+
+def run_checks(thumb_dir, map_ids, pool_ids, check_interval):
+    pool_path = f"/api/atlas/pools/{urllib.parse.quote(POOL_NAME)}"
+
+    print_header(f"{MAP_COUNT} 张图的地图池雪碧图")
+    start = time.perf_counter()
+    status, headers, body = fetch(pool_path)
+    index = json.loads(body)
+    status, image_headers, image_body = fetch(index["image"])
+    elapsed = (time.perf_counter() - start) * 1000
+    atlas = Image.open(io.BytesIO(image_body)).convert("RGBA")
+    print_result("一次索引请求 + 一次图片请求", status == 200 and len(index["sprites"]) == len(pool_ids) - 1,
+                 f"{len(index['sprites'])} 个条目，{atlas.width}x{atlas.height}，首次生成耗时 {elapsed:.0f} ms")
+    offsets_ok = all(atlas.getpixel((x + 1, y + 1)) == color_for(map_ids.index(display_id.replace("_rvs", "")))
+                     for display_id, (x, y, w, h) in index["sprites"].items())
+    print_result("索引中的偏移指向正确的缩略图", offsets_ok)
+    print_result("反向地图与正向地图共用同一块", index["sprites"]["map_000_rvs"] == index["sprites"]["map_000"])
+    print_result("缺少缩略图的地图列在 missing 中", index["missing"] == ["no_thumb"])
+    print_result("带签名的雪碧图地址可长期缓存", "immutable" in image_headers.get("Cache-Control", ""))
+    status, _, _ = fetch(pool_path, {"If-None-Match": headers.get("ETag")})
+    print_result("索引未变化时返回 304", status == 304)
+
+    write_thumbnail(thumb_dir, map_ids[5], (1, 2, 3, 255))
+    time.sleep(check_interval + 0.1)
+    _, _, body = fetch(pool_path)
+    new_index = json.loads(body)
+    _, _, image_body = fetch(new_index["image"])
+    x, y, _, _ = new_index["sprites"][map_ids[5]]
+    atlas = Image.open(io.BytesIO(image_body)).convert("RGBA")
+    print_result("缩略图改动后重新生成雪碧图", new_index["image"] != index["image"]
+                 and atlas.getpixel((x + 1, y + 1)) == (1, 2, 3, 255))
+
+    print_header("单张缩略图")
+    status, headers, body = fetch(f"/thumbnails/{map_ids[0]}.png")
+    print_result("返回缩略图并带 ETag", status == 200 and headers.get("ETag"), headers.get("ETag"))
+    status, _, _ = fetch(f"/thumbnails/{map_ids[0]}.png", {"If-None-Match": headers.get("ETag")})
+    print_result("If-None-Match 命中时返回 304", status == 304)
+    status, range_headers, part = fetch(f"/thumbnails/{map_ids[0]}.png", {"Range": "bytes=0-15"})
+    print_result("支持 Range 请求", status == 206 and part == body[:16], range_headers.get("Content-Range"))
+    status, _, reverse_body = fetch(f"/thumbnails/{map_ids[0]}_rvs.png")
+    print_result("反向地图返回正向地图的缩略图 (与雪碧图一致)", status == 200 and reverse_body == body)
+    status, _, _ = fetch("/thumbnails/..%2Fcompetition.png")
+    print_result("非法的地图ID返回 404", status == 404)
+
+
+def run_verification():
+    thumb_dir = tempfile.mkdtemp(prefix="thumbs_")
+    map_ids = [f"map_{i:03d}" for i in range(MAP_COUNT)]
+    for i, map_id in enumerate(map_ids):
+        write_thumbnail(thumb_dir, map_id, color_for(i))
+    pool_ids = map_ids + ["map_000_rvs", "no_thumb"]
+
+    db = DBManager(TEST_DB_PATH)
+    db.save_map_pool(POOL_NAME, pool_ids)
+    from core.web_service_manager import WebServiceManager
+    from web import server
+
+    server.thumbnails.thumb_dir = thumb_dir
+    web_manager = WebServiceManager()
+    web_manager.configure(host=HOST, port=PORT, log_level="warning")
+    web_manager.start_server()
+    try:
+        if not web_manager.wait_until_ready():
+            print_result("服务就绪", False)
+            return
+        run_checks(thumb_dir, map_ids, pool_ids, server.thumbnails.check_interval)
+    finally:
+        web_manager.stop_server()
+        shutil.rmtree(thumb_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    try:
+        run_verification()
+    finally:
+        DBManager().close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB_PATH + suffix):
+                os.remove(TEST_DB_PATH + suffix)
@@ -0,0 +1,123 @@
+# 文件名: verify_web_workers.py
+# 验证多进程Web部署：多个工作进程共享端口、会话令牌跨进程有效、指令经代理扇出且记分板序号一致
+
+import asyncio
+import json
+import os
+import time
+import urllib.parse
+import urllib.request
+
+# 必须在导入Web服务之前初始化测试数据库，否则单例会指向正式数据库
+from core.db_manager import DBManager
+
+TEST_DB_PATH = 'data/web_workers_test.db'
+HOST, PORT = "127.0.0.1", 8000
+WORKERS = 3
+CLIENTS = 12
+PROBE_PREFIX, PROBE_PASSWORD = "workers_probe_", "probe12345"
+
+
+def print_header(title):
+    print("\n" + "=" * 60)
+    print(f"  {title.upper()}")
+    print("=" * 60)
+
+
+def print_result(description, success, details=""):
+    status = "✅ 成功" if success else "❌ 失败"
+    print(f"- {description}: {status}")
+    if details:
+        print(f"  > {details}")
+
+
+def login(username, password):
+    data = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    with urllib.request.urlopen(f"http://{HOST}:{PORT}/login", data=data) as resp:
+        return json.loads(resp.read())["token"]
+
+
+async def run_client_checks(web_manager, tokens):
+    import websockets
+
+    clients, snapshots = [], []
+    for token in tokens:
+        ws = await websockets.connect(f"ws://{HOST}:{PORT}/ws/{token}?topics=match:A")
+        await ws.send(json.dumps({"action": "resume", "seqs": {}}))
+        snapshots.append(json.loads(await asyncio.wait_for(ws.recv(), 2)))
+        clients.append(ws)
+    print_result("所有令牌均可在任意工作进程建立连接", len(clients) == len(tokens), f"{len(clients)} 个连接")
+    print_result("服务启动前投递的指令在工作进程就绪后送达",
+                 all(m.get("type") == "score_snapshot" and m.get("seq") == 1 for m in snapshots),
+                 f"快照序号: {sorted({m.get('seq') for m in snapshots})}")
+    epochs = {m.get("epoch") for m in snapshots}
+    print_result("各工作进程的记分板纪元一致 (由指令代理分配)", len(epochs) == 1 and None not in epochs,
+                 f"纪元: {sorted(map(str, epochs))}")
+    await asyncio.sleep(0.3)
+
+    for round_number in range(2, 5):
+        web_manager.send_command({"type": "score_update", "round": round_number,
+                                  "scores": {"老虎": round_number * 10}}, "match:A")
+    seqs = []
+    for ws in clients:
+        last = None
+        try:
+            while True:
+                message = json.loads(await asyncio.wait_for(ws.recv(), 2))
+                if message.get("type") in ("score_delta", "score_snapshot"):
+                    last = message
+                    if message["seq"] == 4:
+                        break
+        except asyncio.TimeoutError:
+            pass
+        seqs.append(last["seq"] if last else None)
+        await ws.close()
+    print_result("每个客户端都收到最新增量且序号一致", set(seqs) == {4}, f"各客户端最后序号: {seqs}")
+
+
+def run_verification():
+    DBManager(TEST_DB_PATH)
+    from core.auth_manager import AuthManager
+    from core.web_service_manager import WebServiceManager
+
+    auth_manager = AuthManager()
+    usernames = [f"{PROBE_PREFIX}{i:02d}" for i in range(CLIENTS)]
+    for username in usernames:
+        if not auth_manager.db.get_account_by_username(username):
+            auth_manager.create_account(username, PROBE_PASSWORD)
+
+    web_manager = WebServiceManager()
+    web_manager.configure(host=HOST, port=PORT, log_level="warning", workers=WORKERS)
+
+    print_header(f"启动 {WORKERS} 个工作进程")
+    # 服务未运行时投递的指令暂存在桥接器中，启动后应转发给全部工作进程
+    web_manager.send_command({"type": "score_update", "round": 1, "scores": {"老虎": 10}}, "match:A")
+    start = time.perf_counter()
+    web_manager.start_server()
+    ready = web_manager.wait_until_ready(30)
+    print_result("全部工作进程就绪", ready, f"耗时 {(time.perf_counter() - start) * 1000:.0f} ms")
+    if not ready:
+        web_manager.stop_server()
+        return
+
+    print_header("共享会话与指令扇出")
+    tokens = [login(username, PROBE_PASSWORD) for username in usernames]
+    print_result("登录成功", all(tokens))
+    asyncio.run(run_client_checks(web_manager, tokens))
+
+    print_header("停止")
+    pids = [p.pid for p in web_manager.thread.workers]
+    start = time.perf_counter()
+    web_manager.stop_server()
+    print_result("所有工作进程已退出", not web_manager.is_running(),
+                 f"进程 {pids}，耗时 {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    try:
+        run_verification()
+    finally:
+        DBManager().close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB_PATH + suffix):
+                os.remove(TEST_DB_PATH + suffix)
@@ -0,0 +1,120 @@
+# 文件名: web/asset_cache.py
+
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+# 页面和静态文件在服务启动时一次性读入内存：计算强 ETag、为可压缩的内容预先生成 gzip 版本，
+# 之后每次请求只需比较 ETag 或直接返回缓存的字节，不再读文件、渲染模板或压缩。
+# 模板通过 asset_url('js/main.js') 引用带指纹的地址 (/static/js/main.js?v=<指纹>)，
+# 带正确指纹的请求可被浏览器长期缓存；文件内容变化后指纹随之改变，重启服务即生效。
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+GZIP_MIN_SIZE = 256
+
+
+class CachedAsset:
+    """一个已缓存的响应体及其 gzip 版本"""
+
+    __slots__ = ("body", "gzip_body", "media_type", "etag", "gzip_etag", "fingerprint")
+
+    def __init__(self, body: bytes, media_type: str, tag: Optional[str] = None):
+        """tag 为 ETag 的取值 (不含引号)，省略时取内容的哈希"""
+        self.body = body
+        self.media_type = media_type
+        digest = hashlib.sha256(body).hexdigest()
+        self.fingerprint = digest[:12]
+        tag = tag or digest[:32]
+        self.etag = f'"{tag}"'
+        self.gzip_body = None
+        self.gzip_etag = None
+        if len(body) >= GZIP_MIN_SIZE and media_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.gzip_body = compressed
+                # 强 ETag 必须区分不同编码的表示
+                self.gzip_etag = f'"{tag}-gz"'
+
+    def response(self, request: Request, cache_control: str = REVALIDATE_CACHE_CONTROL) -> Response:
+        """根据 If-None-Match 与 Accept-Encoding 返回 304、gzip 或原始内容"""
+        use_gzip = self.gzip_body is not None and "gzip" in request.headers.get("accept-encoding", "")
+        etag = self.gzip_etag if use_gzip else self.etag
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if self.gzip_body is not None:
+            headers["Vary"] = "Accept-Encoding"
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, (self.etag, self.gzip_etag)):
+            return Response(status_code=304, headers=headers)
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzip_body, media_type=self.media_type, headers=headers)
+        return Response(self.body, media_type=self.media_type, headers=headers)
+
+
+def _etag_matches(header: str, etags) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match 使用弱比较，忽略 W/ 前缀
+    candidates = {tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip() for tag in header.split(",")}
+    return any(etag in candidates for etag in etags if etag)
+
+
+def _media_type(path: str) -> str:
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+class AssetCache:
+    """静态文件与静态页面的内存缓存"""
+
+    def __init__(self, static_dir: str, static_prefix: str = "/static"):
+        self.static_dir = static_dir
+        self.static_prefix = static_prefix
+        self.assets: Dict[str, CachedAsset] = {}
+        self.pages: Dict[str, CachedAsset] = {}
+
+    def load(self):
+        """(重新) 读入静态目录下的全部文件"""
+        assets = {}
+        for root, _, files in os.walk(self.static_dir):
+            for name in files:
+                full_path = os.path.join(root, name)
+                relative = os.path.relpath(full_path, self.static_dir).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    assets[relative] = CachedAsset(f.read(), _media_type(name))
+        self.assets = assets
+        self.pages = {}
+
+    def url(self, path: str) -> str:
+        """模板中使用的静态文件地址，附带内容指纹"""
+        asset = self.assets.get(path)
+        if asset is None:
+            return f"{self.static_prefix}/{path}"
+        return f"{self.static_prefix}/{path}?v={asset.fingerprint}"
+
+    def add_page(self, name: str, html: str):
+        self.pages[name] = CachedAsset(html.encode("utf-8"), "text/html; charset=utf-8")
+
+    def page_response(self, name: str, request: Request) -> Optional[Response]:
+        page = self.pages.get(name)
+        return page.response(request) if page is not None else None
+
+    def asset_response(self, path: str, request: Request) -> Optional[Response]:
+        asset = self.assets.get(path)
+        if asset is None:
+            return None
+        # 只有带当前指纹的请求才能长期缓存，否则每次都要凭 ETag 重新验证
+        if request.query_params.get("v") == asset.fingerprint:
+            return asset.response(request, IMMUTABLE_CACHE_CONTROL)
+        return asset.response(request)
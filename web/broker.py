@@ -0,0 +1,161 @@
+# 文件名: web/broker.py
+
+import json
+import secrets
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from typing import Callable, Dict, List, Optional
+
+from web.scoreboard import new_epoch, scoreboard_key
+
+
+# 多进程部署时，桌面程序通过本地代理(broker)把 send_command 的指令扇出给所有Web工作进程。
+# 使用 multiprocessing.connection (仅监听 127.0.0.1 并带认证密钥)，Windows 与 Linux 都可用。
+# 消息为 JSON：
+#   桌面 -> 工作进程  {"op": "cmd", "topic": ..., "command": {...}} / {"op": "shutdown", "drain_timeout": 0.5}
+#   工作进程 -> 桌面  {"op": "ready", "pid": 1234}
+
+
+class CommandBroker:
+    """桌面程序一侧的指令代理：接受工作进程的连接，并把每条指令编码一次后发给全部工作进程"""
+
+    def __init__(self, on_worker_ready: Optional[Callable[[int], None]] = None):
+        self.authkey = secrets.token_bytes(32)
+        self.listener = Listener(("127.0.0.1", 0), authkey=self.authkey)
+        self.address = self.listener.address
+        self.on_worker_ready = on_worker_ready
+        self._lock = threading.Lock()
+        # 发送锁保证多线程调用 put 时帧不会交错，且记分板序号与发送顺序一致
+        self._send_lock = threading.Lock()
+        self._workers: List = []
+        self._closed = False
+        # 记分板序号由代理统一分配，保证各工作进程的序号一致 (客户端重连到任意进程都能续传)；
+        # 同时保留每个记分板最新的一次完整比分，供后启动的工作进程追平状态。
+        # 序号随代理重新计数，纪元标识本代理分配的序号，客户端据此识别代理重启
+        self.epoch = new_epoch()
+        self._score_seqs: Dict[str, int] = {}
+        self._latest_scores: Dict[str, bytes] = {}
+        self._accept_thread = threading.Thread(target=self._accept_loop, name="CommandBrokerAccept", daemon=True)
+        self._accept_thread.start()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn = self.listener.accept()
+            except Exception:
+                if self._closed:
+                    return
+                continue  # 认证失败等，忽略该连接
+            with self._send_lock:
+                try:
+                    for payload in self._latest_scores.values():
+                        conn.send_bytes(payload)
+                except OSError:
+                    continue
+                with self._lock:
+                    self._workers.append(conn)
+            threading.Thread(target=self._read_loop, args=(conn,), name="CommandBrokerRead", daemon=True).start()
+
+    def _read_loop(self, conn):
+        try:
+            while True:
+                message = json.loads(conn.recv_bytes())
+                if message.get("op") == "ready" and self.on_worker_ready:
+                    self.on_worker_ready(message.get("pid"))
+        except (EOFError, OSError, ValueError):
+            self._drop(conn)
+
+    def _drop(self, conn):
+        with self._lock:
+            if conn in self._workers:
+                self._workers.remove(conn)
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    @property
+    def worker_count(self) -> int:
+        return len(self._workers)
+
+    def _send_all(self, payload: bytes):
+        with self._lock:
+            workers = list(self._workers)
+        for conn in workers:
+            try:
+                conn.send_bytes(payload)
+            except OSError:
+                self._drop(conn)
+
+    def put(self, item):
+        """与 CommandBridge.put 相同的接口，item 为 (topic, command)"""
+        topic, command = item
+        with self._send_lock:
+            if command and command.get("type") == "score_update":
+                key = scoreboard_key(topic)
+                seq = self._score_seqs[key] = self._score_seqs.get(key, 0) + 1
+                command = dict(command, seq=seq, epoch=self.epoch)
+                payload = json.dumps({"op": "cmd", "topic": topic, "command": command}).encode("utf-8")
+                self._latest_scores[key] = payload
+            else:
+                payload = json.dumps({"op": "cmd", "topic": topic, "command": command}).encode("utf-8")
+            self._send_all(payload)
+
+    def request_shutdown(self, drain_timeout: float):
+        with self._send_lock:
+            self._send_all(json.dumps({"op": "shutdown", "drain_timeout": drain_timeout}).encode("utf-8"))
+
+    def close(self):
+        self._closed = True
+        try:
+            self.listener.close()
+        except OSError:
+            pass
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for conn in workers:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+class BrokerSubscriber(threading.Thread):
+    """工作进程一侧：连接到桌面程序的代理，把收到的指令转交给本进程的 CommandBridge"""
+
+    def __init__(self, address, authkey: bytes, on_command: Callable, on_shutdown: Callable[[float], None]):
+        super().__init__(name="BrokerSubscriber", daemon=True)
+        self.address = tuple(address)
+        self.authkey = authkey
+        self.on_command = on_command
+        self.on_shutdown = on_shutdown
+        self.conn = None
+        self._connected = threading.Event()
+
+    def run(self):
+        for _ in range(100):
+            try:
+                self.conn = Client(self.address, authkey=self.authkey)
+                break
+            except OSError:
+                time.sleep(0.05)
+        else:
+            print(f"错误: 工作进程无法连接到指令代理 {self.address}")
+            return
+        self._connected.set()
+        try:
+            while True:
+                message = json.loads(self.conn.recv_bytes())
+                op = message.get("op")
+                if op == "cmd":
+                    self.on_command((message.get("topic"), message.get("command")))
+                elif op == "shutdown":
+                    self.on_shutdown(message.get("drain_timeout", 0.5))
+        except (EOFError, OSError):
+            # 桌面程序退出，工作进程随之停止
+            self.on_shutdown(0.0)
+
+    def notify_ready(self, pid: int):
+        if self._connected.wait(10):
+            self.conn.send_bytes(json.dumps({"op": "ready", "pid": pid}).encode("utf-8"))
@@ -0,0 +1,133 @@
+# 文件名: web/catalog.py
+
+import hashlib
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from web.asset_cache import CachedAsset
+from web.framing import dumps_json_bytes
+
+JSON_MEDIA_TYPE = "application/json"
+REVERSE_SUFFIX = "_rvs"
+
+
+def map_to_api(row: dict) -> dict:
+    """数据库中的地图记录 -> API 输出格式"""
+    try:
+        tags = json.loads(row.get("tags") or "[]")
+    except ValueError:
+        tags = []
+    return {
+        "id": row["id"],
+        "theme": row.get("theme"),
+        "names": {lang: row.get(f"name_{lang}") for lang in ("cn", "tw", "kr", "en")},
+        "difficulty": row.get("difficulty"),
+        "game_type": row.get("game_type"),
+        "has_reverse_mode": bool(row.get("has_reverse_mode")),
+        "tags": tags,
+    }
+
+
+class CatalogSnapshot:
+    """某一版本的地图库数据及其已生成的响应 (整体替换，读取时无需加锁)"""
+
+    def __init__(self, version: Optional[int], rows: List[dict], pools: Dict[str, List[str]]):
+        self.version = version
+        self.maps = [map_to_api(row) for row in rows]
+        self.maps_by_id = {item["id"]: item for item in self.maps}
+        self.pools = pools
+        self.responses: Dict[tuple, Optional[CachedAsset]] = {}
+
+    def build_maps_page(self, theme: Optional[str], game_type: Optional[str], difficulty: Optional[int],
+                        page: int, page_size: int) -> dict:
+        items = [item for item in self.maps
+                 if (theme is None or item["theme"] == theme)
+                 and (game_type is None or item["game_type"] == game_type)
+                 and (difficulty is None or item["difficulty"] == difficulty)]
+        start = (page - 1) * page_size
+        return {
+            "version": self.version,
+            "total": len(items),
+            "page": page,
+            "page_size": page_size,
+            "items": items[start:start + page_size],
+        }
+
+    def build_themes(self) -> dict:
+        counts: Dict[str, int] = {}
+        for item in self.maps:
+            theme = item["theme"] or "unknown"
+            counts[theme] = counts.get(theme, 0) + 1
+        return {
+            "version": self.version,
+            "themes": [{"theme": theme, "map_count": count} for theme, count in sorted(counts.items())],
+        }
+
+    def build_pool(self, name: str) -> Optional[dict]:
+        selected = self.pools.get(name)
+        if selected is None:
+            return None
+        items = []
+        for display_id in selected:
+            reverse = display_id.endswith(REVERSE_SUFFIX)
+            map_id = display_id[:-len(REVERSE_SUFFIX)] if reverse else display_id
+            # 地图池中可能保留着已从地图库中删除的地图，此时 map 为 null
+            items.append({"id": display_id, "reverse": reverse, "map": self.maps_by_id.get(map_id)})
+        return {"version": self.version, "name": name, "maps": items}
+
+
+class CatalogCache:
+    """
+    地图库与地图池的读穿透缓存 (供 /api/maps、/api/pools、/api/themes 使用)。
+
+    数据按数据库中的 catalog_version 整体缓存：每隔 check_interval 秒最多查询一次版本号，
+    版本变化时重新加载全部地图和地图池，并丢弃已生成的响应。其余请求完全在内存中完成，
+    每个响应 (按查询参数区分) 在同一版本内只序列化一次，ETag 由版本号和查询参数构成。
+    """
+
+    def __init__(self, db, check_interval: float = 1.0, max_responses: int = 256):
+        self.db = db
+        self.check_interval = check_interval
+        self.max_responses = max_responses
+        self.snapshot = CatalogSnapshot(None, [], {})
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def needs_refresh(self) -> bool:
+        return time.monotonic() - self._checked_at >= self.check_interval
+
+    def refresh(self):
+        """检查版本号，必要时重新加载 (会访问数据库，请在线程池中调用)"""
+        with self._lock:
+            if not self.needs_refresh():
+                return
+            if self.db.get_catalog_version() != self.snapshot.version:
+                self.snapshot = CatalogSnapshot(*self.db.get_catalog_snapshot())
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        """下次请求时立即重新检查版本号"""
+        self._checked_at = float("-inf")
+
+    def get(self, key: tuple, build: Callable[[CatalogSnapshot], Optional[dict]]) -> Optional[CachedAsset]:
+        """
+        取出缓存的响应；没有时调用 build(snapshot) 生成。
+        build 返回 None 表示资源不存在，同样会被缓存。
+        """
+        snapshot = self.snapshot
+        responses = snapshot.responses
+        try:
+            return responses[key]
+        except KeyError:
+            pass
+        payload = build(snapshot)
+        entry = None
+        if payload is not None:
+            digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:12]
+            entry = CachedAsset(dumps_json_bytes(payload), JSON_MEDIA_TYPE, tag=f"catalog-{snapshot.version}-{digest}")
+        if len(responses) >= self.max_responses:
+            responses.pop(next(iter(responses)))
+        responses[key] = entry
+        return entry
@@ -0,0 +1,99 @@
+# 文件名: web/command_bridge.py
+
+import asyncio
+import threading
+from typing import Any, List, Optional, Tuple
+
+# 一条指令: (频道, 指令字典)，频道为 None 表示广播给所有连接
+Command = Tuple[Any, dict]
+
+
+class CommandBridge:
+    """
+    桌面程序(Qt线程)与Web服务(asyncio事件循环)之间的线程安全指令桥。
+
+    put() 可在任意线程中调用：事件循环就绪后，通过 call_soon_threadsafe
+    直接唤醒循环，不再需要轮询；循环启动前投递的指令会先暂存，绑定后统一补发。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: List[Command] = []
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """在事件循环线程中调用，将桥接器绑定到当前运行的循环"""
+        with self._lock:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            pending, self._pending = self._pending, []
+            # 持锁补发：其他线程此时调用 put() 会等到补发完成，新指令不会排到暂存指令之前
+            for command in pending:
+                self._queue.put_nowait(command)
+        if pending:
+            print(f"信息: 补发 {len(pending)} 条在服务未运行期间投递的指令。")
+
+    def unbind(self) -> int:
+        """
+        服务停止时在事件循环线程中调用，解除绑定后投递的指令重新进入暂存区。
+        队列中尚未处理的指令按原顺序移回暂存区，返回移回的条数。
+        """
+        with self._lock:
+            q = self._queue
+            self._loop = None
+            self._queue = None
+            leftover = []
+            while q is not None:
+                try:
+                    leftover.append(q.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            self._pending[:0] = leftover
+        return len(leftover)
+
+    def take_pending(self) -> List[Command]:
+        """取走暂存区中的全部指令 (多进程部署启动时转交给指令代理)"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    def _deliver(self, q: asyncio.Queue, command: Command):
+        # 在事件循环线程中执行；投递后、执行前桥接器可能已解除绑定，此时放回暂存区
+        with self._lock:
+            if self._queue is q:
+                q.put_nowait(command)
+            else:
+                self._pending.append(command)
+
+    def put(self, command: Command):
+        """线程安全地投递一条指令 (兼容原 queue.Queue 的接口)"""
+        with self._lock:
+            loop, q = self._loop, self._queue
+            if loop is None or loop.is_closed():
+                self._pending.append(command)
+                return
+        try:
+            loop.call_soon_threadsafe(self._deliver, q, command)
+        except RuntimeError:
+            # 事件循环恰好在此刻关闭
+            with self._lock:
+                self._pending.append(command)
+
+    def qsize(self) -> int:
+        """当前积压的指令数量 (近似值)"""
+        q = self._queue
+        return len(self._pending) + (q.qsize() if q is not None else 0)
+
+    async def get_batch(self) -> List[Command]:
+        """
+        等待至少一条指令到达，然后一次性取走所有已积压的指令。
+        必须在已绑定的事件循环中调用。
+        """
+        q = self._queue
+        batch = [await q.get()]
+        while True:
+            try:
+                batch.append(q.get_nowait())
+            except asyncio.QueueEmpty:
+                return batch
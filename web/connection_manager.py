@@ -0,0 +1,364 @@
+# 文件名: web/connection_manager.py
+
+import asyncio
+import re
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional, Set, Union
+
+from fastapi import WebSocket
+
+from web import metrics
+from web.framing import EncodedMessage, DEFAULT_FORMAT
+
+# 慢客户端处理策略：
+#   drop_oldest - 队列满时丢弃最旧的一帧
+#   coalesce    - 队列满时优先丢弃与新消息同类型的旧帧 (新值覆盖旧值)，没有同类帧时丢弃最旧的一帧
+#   disconnect  - 队列满时直接断开该客户端，由其重连
+SLOW_CLIENT_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# 心跳：连接在 heartbeat_interval 秒内没有收到客户端任何消息时，服务器发送一条 ping 消息，
+# 客户端应回复 {"action": "pong"}；再过 heartbeat_timeout 秒仍无回应 (idle)，
+# 或一帧写入超过 heartbeat_timeout 秒仍未完成 (stalled，对端已不再读取)，即视为死连接并移除。
+DEFAULT_HEARTBEAT_INTERVAL = 15.0
+DEFAULT_HEARTBEAT_TIMEOUT = 10.0
+
+# 频道(主题)：所有连接都自动订阅 ALL_TOPIC 和自己的 user:<用户名> 频道，
+# 其余频道 (比赛/队伍/角色) 由客户端在连接时或通过 subscribe 消息自行订阅。
+ALL_TOPIC = "all"
+USER_TOPIC_PREFIX = "user:"
+TOPIC_REGEX = re.compile(r"^(match|team|role):[A-Za-z0-9_\-]{1,64}$")
+MAX_TOPICS_PER_CLIENT = 16
+
+
+def is_valid_client_topic(topic: str) -> bool:
+    """客户端可自行订阅的频道：match:<id> / team:<id> / role:<name>"""
+    return bool(TOPIC_REGEX.match(topic))
+
+
+def user_topic(username: str) -> str:
+    return f"{USER_TOPIC_PREFIX}{username}"
+
+
+class ClientConnection:
+    """单个WebSocket连接：拥有独立的有界发送队列和写协程"""
+
+    def __init__(self, websocket: WebSocket, username: str, max_queue_size: int, policy: str,
+                 frame_format: str = DEFAULT_FORMAT):
+        self.websocket = websocket
+        self.username = username
+        self.frame_format = frame_format
+        self.max_queue_size = max_queue_size
+        self.policy = policy
+        self.queue = deque()  # 元素为 (coalesce_key, EncodedMessage)
+        self.sent_count = 0
+        self.dropped_count = 0
+        self.max_depth = 0
+        self.topics: Set[str] = set()
+        self.closed = False
+        self.sending = False
+        self.on_close = None
+        now = asyncio.get_running_loop().time()
+        self.last_seen = now     # 最后一次收到客户端消息的时间
+        self.last_ping = now     # 最后一次发送 ping 的时间
+        self.send_started = now  # 当前这一帧开始写入的时间 (sending 为 True 时有效)
+        self._wakeup = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer_task = asyncio.create_task(self._writer())
+
+    def enqueue(self, encoded: EncodedMessage, coalesce_key=None) -> bool:
+        """
+        将一条已封装的消息放入发送队列 (非阻塞)，实际帧格式在发送时按本连接的格式取用。
+        返回 False 表示该连接已关闭或因落后过多被断开。
+        """
+        if self.closed:
+            return False
+        if len(self.queue) >= self.max_queue_size:
+            if self.policy == "disconnect":
+                print(f"警告: 选手 '{self.username}' 发送队列已满 ({len(self.queue)})，断开连接。")
+                metrics.slow_disconnects_total.inc()
+                self.abort(1013)
+                return False
+            self._make_room(coalesce_key)
+        self.queue.append((coalesce_key, encoded))
+        depth = len(self.queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        self._wakeup.set()
+        return True
+
+    def _make_room(self, coalesce_key):
+        if self.policy == "coalesce" and coalesce_key is not None:
+            for i, (key, _) in enumerate(self.queue):
+                if key == coalesce_key:
+                    del self.queue[i]
+                    self.dropped_count += 1
+                    metrics.messages_dropped_total.inc()
+                    return
+        self.queue.popleft()
+        self.dropped_count += 1
+        metrics.messages_dropped_total.inc()
+
+    async def _writer(self):
+        websocket = self.websocket
+        try:
+            while True:
+                while not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                _, encoded = self.queue.popleft()
+                data, is_binary = encoded.frame(self.frame_format)
+                self.send_started = asyncio.get_running_loop().time()
+                self.sending = True
+                if is_binary:
+                    await websocket.send_bytes(data)
+                else:
+                    await websocket.send_text(data)
+                self.sending = False
+                self.sent_count += 1
+                metrics.messages_out_total.inc()
+                metrics.send_lag.observe(time.perf_counter() - encoded.created_at)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"信息: 向选手 '{self.username}' 发送失败，连接将被移除: {e}")
+            await self.close()
+
+    def stop(self):
+        """停止写协程并清空队列，不触碰底层连接"""
+        self.closed = True
+        self.queue.clear()
+        task = self._writer_task
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+    @property
+    def busy(self) -> bool:
+        """是否还有未发完的帧"""
+        return bool(self.queue) or self.sending
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        """停止写协程并关闭底层连接 (可重复调用)"""
+        if self.closed:
+            return
+        self._detach()
+        await self._close_socket(code, reason)
+
+    def abort(self, code: int, reason: str = ""):
+        """立即从管理器中移除本连接，关闭帧在后台发送 (对端可能已无响应，不等待)"""
+        if self.closed:
+            return
+        self._detach()
+        asyncio.create_task(self._close_socket(code, reason))
+
+    def touch(self):
+        """收到客户端消息时调用，刷新存活时间"""
+        self.last_seen = asyncio.get_running_loop().time()
+
+    def _detach(self):
+        self.stop()
+        if self.on_close:
+            self.on_close(self)
+
+    async def _close_socket(self, code: int, reason: str = ""):
+        try:
+            await self.websocket.close(code=code, reason=reason or None)
+        except Exception:
+            pass  # 连接可能已经断开
+
+    def send_message(self, message: dict) -> bool:
+        """只发给本连接的消息 (如订阅确认、续传补发)"""
+        return self.enqueue(EncodedMessage(message))
+
+    def stats(self) -> dict:
+        return {
+            "format": self.frame_format,
+            "depth": len(self.queue),
+            "max_depth": self.max_depth,
+            "sent": self.sent_count,
+            "dropped": self.dropped_count,
+        }
+
+
+class ConnectionManager:
+    def __init__(self, max_queue_size: int = 256, slow_client_policy: str = "coalesce",
+                 heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL,
+                 heartbeat_timeout: float = DEFAULT_HEARTBEAT_TIMEOUT):
+        if slow_client_policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"未知的慢客户端策略: {slow_client_policy}")
+        self.max_queue_size = max_queue_size
+        self.slow_client_policy = slow_client_policy
+        self.heartbeat_interval = heartbeat_interval  # 为 0 时关闭心跳
+        self.heartbeat_timeout = heartbeat_timeout
+        self.active_connections: Dict[str, ClientConnection] = {}
+        # 频道 -> 订阅该频道的连接集合，扇出时只遍历目标受众
+        self.topic_subscribers: Dict[str, Set[ClientConnection]] = {}
+
+    async def connect(self, websocket: WebSocket, username: str, topics: Iterable[str] = (),
+                      frame_format: str = DEFAULT_FORMAT) -> ClientConnection:
+        await websocket.accept()
+        connection = ClientConnection(websocket, username, self.max_queue_size, self.slow_client_policy,
+                                      frame_format)
+        connection.on_close = self._forget
+        previous = self.active_connections.get(username)
+        if previous is not None:
+            self._forget(previous)
+        self.active_connections[username] = connection
+        self._add_subscription(connection, ALL_TOPIC)
+        self._add_subscription(connection, user_topic(username))
+        self.subscribe(connection, topics)
+        connection.start()
+        metrics.connections_total.inc()
+        if previous is not None:
+            # 同一账号重复登录时，旧连接让位给新连接
+            await previous.close(code=1000)
+        return connection
+
+    def _forget(self, connection: ClientConnection):
+        if self.active_connections.get(connection.username) is connection:
+            del self.active_connections[connection.username]
+        for topic in connection.topics:
+            subscribers = self.topic_subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self.topic_subscribers[topic]
+        connection.topics.clear()
+
+    def _add_subscription(self, connection: ClientConnection, topic: str):
+        connection.topics.add(topic)
+        self.topic_subscribers.setdefault(topic, set()).add(connection)
+
+    def subscribe(self, connection: ClientConnection, topics: Iterable[str]) -> list:
+        """为连接订阅频道，忽略非法频道名及超出上限的部分，返回实际新增的频道"""
+        added = []
+        for topic in topics:
+            if connection.closed or not is_valid_client_topic(topic) or topic in connection.topics:
+                continue
+            if len(connection.topics) >= MAX_TOPICS_PER_CLIENT + 2:  # +2: all 与 user:<用户名>
+                break
+            self._add_subscription(connection, topic)
+            added.append(topic)
+        return added
+
+    def unsubscribe(self, connection: ClientConnection, topics: Iterable[str]) -> list:
+        """取消订阅客户端自选的频道 (all 与 user:<用户名> 不可取消)"""
+        removed = []
+        for topic in topics:
+            if topic not in connection.topics or not is_valid_client_topic(topic):
+                continue
+            connection.topics.discard(topic)
+            subscribers = self.topic_subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self.topic_subscribers[topic]
+            removed.append(topic)
+        return removed
+
+    def disconnect(self, username: str, connection: Optional[ClientConnection] = None):
+        """移除连接；传入 connection 时仅当其仍是当前连接才移除，避免误删重连后的新连接"""
+        current = self.active_connections.get(username)
+        if current is None or (connection is not None and current is not connection):
+            return
+        current.stop()
+        self._forget(current)
+
+    def audience(self, topic: Union[str, Iterable[str], None] = None) -> Set[ClientConnection]:
+        """计算一个或多个频道的受众 (并集，自动去重)"""
+        if topic is None:
+            topic = ALL_TOPIC
+        if isinstance(topic, str):
+            return set(self.topic_subscribers.get(topic, ()))
+        audience = set()
+        for name in topic:
+            audience.update(self.topic_subscribers.get(name, ()))
+        return audience
+
+    async def publish(self, message: dict, topic: Union[str, Iterable[str], None] = None) -> int:
+        """
+        向指定频道发布消息：每条消息每种帧格式只编码一次，然后放入受众各自的发送队列。
+        topic 为 None 时等同于广播；返回投递到的连接数。
+        """
+        audience = self.audience(topic)
+        if not audience:
+            return 0
+        encoded = EncodedMessage(message)
+        start = encoded.created_at
+        # 合并键包含频道，避免不同比赛的同类消息互相覆盖
+        topic_key = topic if isinstance(topic, str) or topic is None else tuple(sorted(topic))
+        coalesce_key = (topic_key, message.get("type"))
+        for connection in audience:
+            connection.enqueue(encoded, coalesce_key)
+        metrics.fanout_duration.observe(time.perf_counter() - start)
+        return len(audience)
+
+    async def broadcast(self, message: dict) -> int:
+        """向所有连接的客户端广播消息"""
+        return await self.publish(message, ALL_TOPIC)
+
+    def check_liveness(self) -> int:
+        """
+        检查一次所有连接：向沉默的连接发送 ping，移除超时未回应或写入卡住的连接。
+        返回本次移除的连接数。
+        """
+        interval, timeout = self.heartbeat_interval, self.heartbeat_timeout
+        if not interval:
+            return 0
+        now = asyncio.get_running_loop().time()
+        reaped = 0
+        for connection in list(self.active_connections.values()):
+            if connection.sending and now - connection.send_started > timeout:
+                reason = "stalled"
+            elif now - connection.last_seen > interval + timeout and connection.last_ping > connection.last_seen:
+                reason = "idle"
+            else:
+                if now - connection.last_seen >= interval and now - connection.last_ping >= interval:
+                    connection.last_ping = now
+                    connection.send_message({"type": "ping"})
+                continue
+            print(f"警告: 选手 '{connection.username}' 的连接已无响应 ({reason})，移除连接。")
+            metrics.reaped_total.inc(labels=(reason,))
+            connection.abort(1001, "heartbeat timeout")
+            reaped += 1
+        return reaped
+
+    async def run_heartbeat(self):
+        """后台心跳任务，随服务启动，在事件循环中周期性调用 check_liveness"""
+        while True:
+            interval = self.heartbeat_interval
+            # 检查周期取间隔与超时中较小者的一半，使超时判定的误差不超过其一半
+            await asyncio.sleep(max(0.05, min(interval, self.heartbeat_timeout) / 2) if interval else 1.0)
+            try:
+                self.check_liveness()
+            except Exception as e:
+                print(f"错误: 心跳检查失败: {e}")
+
+    async def close_all(self, code: int = 1001, reason: str = "", drain_timeout: float = 0.5) -> dict:
+        """
+        关闭所有连接：先在 drain_timeout 内等待各连接的发送队列排空，再逐个发送关闭帧。
+        返回关闭的连接数以及超时后仍未发出的帧数。
+        """
+        connections = list(self.active_connections.values())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + drain_timeout
+        while any(c.busy for c in connections) and loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        undelivered = sum(len(c.queue) for c in connections)
+        await asyncio.gather(*(c.close(code, reason) for c in connections), return_exceptions=True)
+        return {"closed": len(connections), "undelivered": undelivered}
+
+    def get_queue_stats(self) -> dict:
+        """返回各连接的发送队列深度及汇总信息"""
+        per_client = {name: conn.stats() for name, conn in list(self.active_connections.items())}
+        depths = [s["depth"] for s in per_client.values()]
+        return {
+            "clients": len(per_client),
+            "total_depth": sum(depths),
+            "max_depth": max(depths, default=0),
+            "total_dropped": sum(s["dropped"] for s in per_client.values()),
+            "topics": {topic: len(subs) for topic, subs in list(self.topic_subscribers.items())},
+            "per_client": per_client,
+        }
@@ -0,0 +1,91 @@
+# 文件名: web/framing.py
+
+import json
+import time
+import zlib
+from typing import Dict, Tuple
+
+# --- 可选依赖：更快的JSON编码器 / 紧凑的二进制编码 ---
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# 帧格式 (客户端在连接时通过 ?format=... 选择)：
+#   json         - 文本帧，兼容旧客户端 (默认)
+#   json-bin     - 二进制帧，UTF-8 JSON，每次广播只编码一次
+#   json-deflate - 二进制帧，超过阈值的消息在广播时压缩一次 (而不是每个连接各压一次)
+#   msgpack      - 二进制帧，MessagePack 编码 (未安装 msgpack 时退化为 json-bin)
+FRAME_FORMATS = ("json", "json-bin", "json-deflate", "msgpack")
+DEFAULT_FORMAT = "json"
+
+# 二进制帧的首字节标记负载类型，客户端据此选择解码方式
+TAG_JSON = b"\x01"
+TAG_JSON_DEFLATE = b"\x02"
+TAG_MSGPACK = b"\x03"
+
+# 小于该长度的消息压缩收益很小，直接按 json-bin 发送
+DEFLATE_MIN_SIZE = 512
+DEFLATE_LEVEL = 6
+
+
+def negotiate_format(requested: str) -> str:
+    """根据客户端请求和服务端能力确定实际使用的帧格式"""
+    if requested not in FRAME_FORMATS:
+        return DEFAULT_FORMAT
+    if requested == "msgpack" and not MSGPACK_AVAILABLE:
+        return "json-bin"
+    return requested
+
+
+def dumps_json_bytes(message) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(message)
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class EncodedMessage:
+    """
+    一条待发送的消息。各格式的帧在第一次需要时编码并缓存，
+    因此一次广播无论有多少客户端，每种格式最多只编码一次。
+    """
+
+    __slots__ = ("message", "created_at", "_json_bytes", "_frames")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self.created_at = time.perf_counter()  # 用于统计发送队列延迟
+        self._json_bytes = None
+        self._frames: Dict[str, Tuple[object, bool]] = {}
+
+    def json_bytes(self) -> bytes:
+        if self._json_bytes is None:
+            self._json_bytes = dumps_json_bytes(self.message)
+        return self._json_bytes
+
+    def frame(self, fmt: str) -> Tuple[object, bool]:
+        """返回 (数据, 是否为二进制帧)"""
+        cached = self._frames.get(fmt)
+        if cached is not None:
+            return cached
+        if fmt == "json-bin":
+            cached = (TAG_JSON + self.json_bytes(), True)
+        elif fmt == "json-deflate":
+            raw = self.json_bytes()
+            if len(raw) >= DEFLATE_MIN_SIZE:
+                cached = (TAG_JSON_DEFLATE + zlib.compress(raw, DEFLATE_LEVEL), True)
+            else:
+                cached = self.frame("json-bin")
+        elif fmt == "msgpack":
+            cached = (TAG_MSGPACK + msgpack.packb(self.message, use_bin_type=True), True)
+        else:
+            cached = (self.json_bytes().decode("utf-8"), False)
+        self._frames[fmt] = cached
+        return cached
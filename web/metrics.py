@@ -0,0 +1,147 @@
+# 文件名: web/metrics.py
+
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Web服务的运行指标，通过 /metrics 以 Prometheus 文本格式 (0.0.4) 导出。
+# 所有指标只在事件循环线程中更新 (或在抓取时通过回调读取)，因此无需加锁，
+# 每次记录只是一次整数/浮点加法，生产环境可以常开。
+# 多进程部署时，每个工作进程各自统计，/metrics 返回处理本次请求的那个进程的数值。
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 延迟类直方图的默认分桶 (秒)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """单调递增的计数器，可带一组固定的标签名"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {} if labelnames else {(): 0}
+
+    def inc(self, amount=1, labels: Tuple[str, ...] = ()):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: Tuple[str, ...] = ()):
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in sorted(self._values.items())]
+
+
+class Gauge:
+    """在抓取时通过回调读取当前值的仪表 (热路径上没有任何开销)"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram:
+    """固定分桶的直方图，记录一次观测只需一次二分查找和两次加法"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.bounds = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.bounds) + 1)  # 最后一格对应 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_format_value(float(bound))}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_format_value(self.sum)}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """收集全部指标并按 Prometheus 文本格式输出"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"重复注册的指标: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, documentation, callback))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# --- Web服务使用的指标 (仪表类指标由 web/server.py 注册回调) ---
+registry = MetricsRegistry()
+
+logins_total = registry.counter("web_logins_total", "登录请求次数 (按结果区分)", ("result",))
+login_duration = registry.histogram("web_login_duration_seconds", "处理一次登录请求的耗时 (秒)")
+connections_total = registry.counter("web_connections_total", "已接受的WebSocket连接数")
+messages_in_total = registry.counter("web_messages_received_total", "从客户端收到的消息数")
+messages_out_total = registry.counter("web_messages_sent_total", "已发给客户端的帧数")
+messages_dropped_total = registry.counter("web_messages_dropped_total", "因客户端落后而被丢弃或合并的帧数")
+reaped_total = registry.counter("web_reaped_connections_total", "因心跳超时 (idle) 或写入卡住 (stalled) 被移除的连接数", ("reason",))
+slow_disconnects_total = registry.counter("web_slow_client_disconnects_total", "按 disconnect 策略被断开的慢客户端数")
+commands_total = registry.counter("web_commands_total", "收到的桌面程序指令数")
+fanout_duration = registry.histogram("web_broadcast_fanout_seconds", "一条消息放入全部受众发送队列的耗时 (秒)")
+send_lag = registry.histogram("web_send_queue_lag_seconds", "帧从发布到写入客户端连接的等待时间 (秒)")
@@ -0,0 +1,128 @@
+# 文件名: web/scoreboard.py
+
+import secrets
+from collections import deque
+from typing import Dict, List, Optional
+
+from web.connection_manager import ALL_TOPIC
+
+_MISSING = object()
+
+
+def scoreboard_key(topic) -> str:
+    """记分板按发布目标区分：None 即全体广播，频道列表按排序后的组合作为键"""
+    if topic is None:
+        return ALL_TOPIC
+    if isinstance(topic, str):
+        return topic
+    return ",".join(sorted(topic))
+
+
+def new_epoch() -> str:
+    """生成新的记分板纪元标识"""
+    return secrets.token_hex(8)
+
+
+class Scoreboard:
+    """
+    单个频道的权威记分板。
+    每次更新只生成带序号的增量 (score_delta)，并在有界环形缓冲区中保留最近的增量，
+    供重连的客户端凭最后收到的序号补齐；缺口超出缓冲区时改发紧凑的完整快照。
+    序号属于某个纪元 (epoch)：服务 (或多进程部署时的指令代理) 重启后序号从 1 重新开始，纪元随之改变，
+    客户端据此丢弃旧纪元下保存的记分板，而不是把新的较小序号当作过期消息。
+    """
+
+    def __init__(self, topic: str, history_size: int = 256, epoch: Optional[str] = None):
+        self.topic = topic
+        self.epoch = epoch or new_epoch()
+        self.seq = 0
+        self.round = None
+        self.scores: dict = {}
+        self.history = deque(maxlen=history_size)  # 元素为 (seq, delta消息)
+
+    def apply_update(self, round_number, scores: dict, seq: Optional[int] = None,
+                     epoch: Optional[str] = None) -> Optional[dict]:
+        """
+        用一次完整比分更新当前状态，返回对应的增量消息；没有任何变化时返回 None。
+        多进程部署时序号和纪元由指令代理统一分配 (seq / epoch)，此时即使比分未变也会推进序号以保持各进程一致；
+        纪元改变 (代理重启) 时记分板从序号 0 重新开始。
+        """
+        if epoch is not None and epoch != self.epoch:
+            self.epoch = epoch
+            self.seq = 0
+            self.history.clear()
+        if seq is not None and seq <= self.seq:
+            return None  # 重复或过期的更新
+        changes = {}
+        for key, value in scores.items():
+            if self.scores.get(key, _MISSING) != value:
+                changes[key] = value
+        removed = [key for key in self.scores if key not in scores]
+        if seq is None:
+            if not changes and not removed and round_number == self.round:
+                return None
+            seq = self.seq + 1
+        elif seq != self.seq + 1:
+            # 跳过了部分序号 (例如工作进程晚于其他进程启动)，旧增量无法衔接，续传时改发快照
+            self.history.clear()
+
+        self.seq = seq
+        self.round = round_number
+        self.scores = dict(scores)
+        delta = {
+            "type": "score_delta",
+            "topic": self.topic,
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "round": round_number,
+            "changes": changes,
+            "removed": removed,
+        }
+        self.history.append((self.seq, delta))
+        return delta
+
+    def snapshot(self) -> dict:
+        return {
+            "type": "score_snapshot",
+            "topic": self.topic,
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "round": self.round,
+            "scores": self.scores,
+        }
+
+    def replay_since(self, last_seq: Optional[int], epoch: Optional[str] = None) -> List[dict]:
+        """
+        返回客户端从 last_seq 追到最新状态所需的消息：
+        缓冲区覆盖缺口时返回缺失的增量，否则 (或客户端没有任何状态、状态属于其他纪元时) 返回一个快照。
+        :param epoch: 客户端状态所属的纪元，None 表示客户端没有提供 (按当前纪元处理)
+        """
+        if self.seq == 0:
+            return []
+        if epoch is not None and epoch != self.epoch:
+            return [self.snapshot()]
+        if last_seq is not None and 0 <= last_seq <= self.seq:
+            if last_seq == self.seq:
+                return []
+            if self.history and self.history[0][0] <= last_seq + 1:
+                return [delta for seq, delta in self.history if seq > last_seq]
+        return [self.snapshot()]
+
+
+class ScoreboardRegistry:
+    """按频道管理记分板"""
+
+    def __init__(self, history_size: int = 256):
+        self.history_size = history_size
+        # 本进程内新建的记分板共用一个纪元
+        self.epoch = new_epoch()
+        self.boards: Dict[str, Scoreboard] = {}
+
+    def get(self, topic: str) -> Scoreboard:
+        board = self.boards.get(topic)
+        if board is None:
+            board = self.boards[topic] = Scoreboard(topic, self.history_size, self.epoch)
+        return board
+
+    def find(self, topic: str) -> Optional[Scoreboard]:
+        return self.boards.get(topic)
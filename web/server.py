@@ -1,17 +1,27 @@
 # 文件名: web/server.py (V2 - 修正路径问题)
 
 import asyncio
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Form, Request
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles # <-- 导入 StaticFiles
+import time
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Form, Request, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
-from typing import List
-import queue
+from typing import List, Optional
 import json
 import os # <-- 新增导入
+import urllib.parse
 
 # --- 导入我们之前编写的核心服务 ---
 from core.auth_manager import AuthManager
+from core.db_manager import DBManager
+from web import metrics
+from web.asset_cache import AssetCache
+from web.catalog import CatalogCache
+from web.command_bridge import CommandBridge
+from web.connection_manager import ConnectionManager
+from web.framing import negotiate_format
+from web.scoreboard import ScoreboardRegistry, scoreboard_key
+from web.thumbnails import PIL_AVAILABLE, ThumbnailService
 
 # --- 初始化 ---
 app = FastAPI()
@@ -23,87 +33,308 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 static_path = os.path.join(current_dir, "static")
 templates_path = os.path.join(current_dir, "templates")
 
-# 使用绝对路径来挂载静态文件目录和模板目录
-app.mount("/static", StaticFiles(directory=static_path), name="static")
+# 静态文件和页面在启动时读入内存缓存 (带 ETag 与预压缩的 gzip 版本)，模板通过 asset_url() 引用带指纹的地址
+assets = AssetCache(static_path)
 templates = Jinja2Templates(directory=templates_path)
+templates.env.globals["asset_url"] = assets.url
 # --- 路径修正结束 ---
 
+# 不依赖请求内容的页面，启动时渲染一次
+STATIC_PAGES = ("login.html", "dashboard.html")
 
-# 这个队列是桌面程序与Web服务之间通信的桥梁
-command_queue = queue.Queue()
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: dict[str, WebSocket] = {}
-
-    async def connect(self, websocket: WebSocket, username: str):
-        await websocket.accept()
-        self.active_connections[username] = websocket
-
-    def disconnect(self, username: str):
-        if username in self.active_connections:
-            del self.active_connections[username]
-
-    async def broadcast(self, message: dict):
-        """向所有连接的客户端广播消息"""
-        message_str = json.dumps(message)
-        for connection in self.active_connections.values():
-            await connection.send_text(message_str)
+# 这个桥接器是桌面程序与Web服务之间通信的桥梁 (线程安全，事件驱动)
+command_queue = CommandBridge()
 
 manager = ConnectionManager()
+scoreboards = ScoreboardRegistry()
 auth_manager = AuthManager()
+catalog = CatalogCache(DBManager())
+thumbnails = ThumbnailService()
+
+# 仪表类指标在抓取时读取当前状态
+metrics.registry.gauge("web_connected_clients", "当前WebSocket连接数", lambda: len(manager.active_connections))
+metrics.registry.gauge("web_command_queue_depth", "尚未处理的桌面程序指令数", lambda: command_queue.qsize())
+metrics.registry.gauge("web_send_queue_depth_total", "所有连接发送队列中的帧数之和",
+                       lambda: manager.get_queue_stats()["total_depth"])
+metrics.registry.gauge("web_send_queue_depth_max", "单个连接发送队列的最大深度",
+                       lambda: manager.get_queue_stats()["max_depth"])
 
 # --- 后台任务：处理来自主程序的指令 ---
 async def process_commands():
-    """一个无限循环的后台任务，用于处理指令队列"""
+    """一个无限循环的后台任务：指令到达即被唤醒，每次唤醒批量处理所有积压指令"""
     while True:
-        try:
-            command = command_queue.get_nowait()
+        batch = await command_queue.get_batch()
+        metrics.commands_total.inc(len(batch))
+        for topic, command in batch:
             if command:
-                await manager.broadcast(command)
-        except queue.Empty:
-            await asyncio.sleep(0.1)
+                try:
+                    if command.get("type") == "score_update":
+                        # 完整比分只用于更新权威记分板，实际下发的是带序号的增量
+                        board = scoreboards.get(scoreboard_key(topic))
+                        command = board.apply_update(command.get("round"), command.get("scores") or {},
+                                                     command.get("seq"), command.get("epoch"))
+                        if command is None:
+                            continue
+                    await manager.publish(command, topic)
+                except Exception as e:
+                    print(f"错误: 发布指令失败: {e}")
+
+async def drain_connections(timeout: float = 0.5):
+    """
+    服务停止前调用：先处理完已投递的指令，再排空各连接的发送队列，
+    最后以 1012 (服务重启) 关闭所有WebSocket连接，客户端据此自动重连并续传记分板。
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while command_queue.qsize() and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+    # 之后投递的指令会暂存在桥接器中，待服务重新启动后补发；超时仍未处理的指令也移回暂存区
+    requeued = command_queue.unbind()
+    if requeued:
+        print(f"警告: 停止服务时仍有 {requeued} 条指令未处理，已移回暂存区。")
+    result = await manager.close_all(code=1012, reason="service restart",
+                                     drain_timeout=max(0.0, deadline - loop.time()))
+    result["requeued"] = requeued
+    if result["undelivered"]:
+        print(f"警告: 停止服务时仍有 {result['undelivered']} 帧未能发出。")
+    print(f"信息: 已关闭 {result['closed']} 个WebSocket连接。")
+    return result
+
+def apply_settings(settings: dict):
+    """在服务启动前应用 WebServiceManager 中与连接管理相关的配置"""
+    manager.heartbeat_interval = settings["heartbeat_interval"]
+    manager.heartbeat_timeout = settings["heartbeat_timeout"]
 
 @app.on_event("startup")
 async def startup_event():
+    assets.load()
+    for name in STATIC_PAGES:
+        assets.add_page(name, templates.get_template(name).render())
+    command_queue.bind(asyncio.get_running_loop())
     asyncio.create_task(process_commands())
+    asyncio.create_task(manager.run_heartbeat())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    command_queue.unbind()
 
 # --- HTTP API 端点 ---
 
 @app.get("/", response_class=HTMLResponse)
 async def get_login_page(request: Request):
     """提供登录页面"""
-    return templates.TemplateResponse("login.html", {"request": request})
+    return assets.page_response("login.html", request)
 
 @app.post("/login")
 async def handle_login(username: str = Form(...), password: str = Form(...)):
     """处理用户登录请求"""
-    if auth_manager.verify_password(username, password):
-        token = auth_manager.generate_session_token(username)
-        return {"status": "success", "token": token}
-    return {"status": "error", "message": "用户名或密码错误"}
+    start = time.perf_counter()
+    # PBKDF2 哈希耗时较长，放到线程池中执行，避免阻塞事件循环上的广播
+    if await run_in_threadpool(auth_manager.verify_password, username, password):
+        token = await run_in_threadpool(auth_manager.generate_session_token, username)
+        result = {"status": "success", "token": token}
+    else:
+        result = {"status": "error", "message": "用户名或密码错误"}
+    metrics.login_duration.observe(time.perf_counter() - start)
+    metrics.logins_total.inc(labels=(result["status"],))
+    return result
 
 @app.get("/dashboard", response_class=HTMLResponse)
 async def get_dashboard(request: Request):
     """提供选手仪表盘页面"""
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return assets.page_response("dashboard.html", request)
+
+@app.get("/static/{path:path}")
+async def get_static(path: str, request: Request):
+    """提供静态文件 (内容在启动时缓存，新增文件需重启服务)"""
+    response = assets.asset_response(path, request)
+    if response is None:
+        raise HTTPException(status_code=404)
+    return response
+
+@app.get("/metrics")
+async def get_metrics():
+    """以 Prometheus 文本格式导出运行指标"""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+# --- 地图库只读 API (读穿透缓存，支持条件请求) ---
+
+async def refresh_catalog():
+    if catalog.needs_refresh():
+        await run_in_threadpool(catalog.refresh)
+
+async def catalog_response(request: Request, key: tuple, build):
+    await refresh_catalog()
+    entry = catalog.get(key, build)
+    if entry is None:
+        raise HTTPException(status_code=404)
+    return entry.response(request)
+
+@app.get("/api/maps")
+async def api_maps(request: Request,
+                   theme: Optional[str] = None,
+                   game_type: Optional[str] = Query(None, alias="type"),
+                   difficulty: Optional[int] = None,
+                   page: int = Query(1, ge=1),
+                   page_size: int = Query(50, ge=1, le=200)):
+    """分页列出地图，可按主题、类型和难度筛选"""
+    key = ("maps", theme, game_type, difficulty, page, page_size)
+    return await catalog_response(
+        request, key, lambda snapshot: snapshot.build_maps_page(theme, game_type, difficulty, page, page_size))
+
+@app.get("/api/themes")
+async def api_themes(request: Request):
+    """列出所有主题及其地图数量"""
+    return await catalog_response(request, ("themes",), lambda snapshot: snapshot.build_themes())
+
+@app.get("/api/pools/{name}")
+async def api_pool(name: str, request: Request):
+    """获取一个地图池及其中各地图的详情"""
+    return await catalog_response(request, ("pool", name), lambda snapshot: snapshot.build_pool(name))
+
+# --- 缩略图与雪碧图 ---
+
+@app.get("/thumbnails/{map_id}.png")
+async def get_thumbnail(map_id: str, request: Request):
+    """单张地图缩略图 (支持 ETag 与 Range；服务器支持时由 sendfile 直接发送文件)"""
+    path = thumbnails.thumbnail_path(map_id)
+    try:
+        stat_result = os.stat(path) if path else None
+    except OSError:
+        stat_result = None
+    if stat_result is None:
+        raise HTTPException(status_code=404)
+    etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="image/png", headers=headers, stat_result=stat_result)
+
+async def get_atlas(kind: str, name: str, display_ids):
+    if not PIL_AVAILABLE:
+        raise HTTPException(status_code=503, detail="服务器未安装 Pillow，无法生成雪碧图")
+    key = f"{kind}:{name}"
+    atlas = thumbnails.cached_atlas(key, display_ids)
+    if atlas is None:
+        image_url = f"/api/atlas/{kind}s/{urllib.parse.quote(name, safe='')}/image"
+        atlas = await run_in_threadpool(thumbnails.get_atlas, key, display_ids, image_url)
+    return atlas
+
+async def pool_map_ids(name: str):
+    await refresh_catalog()
+    display_ids = catalog.snapshot.pools.get(name)
+    if display_ids is None:
+        raise HTTPException(status_code=404)
+    return display_ids
+
+async def theme_map_ids(theme: str):
+    await refresh_catalog()
+    display_ids = [item["id"] for item in catalog.snapshot.maps if item["theme"] == theme]
+    if not display_ids:
+        raise HTTPException(status_code=404)
+    return display_ids
+
+@app.get("/api/atlas/pools/{name}")
+async def api_pool_atlas(name: str, request: Request):
+    """地图池的雪碧图索引: {image, width, height, sprites: {地图ID: [x, y, 宽, 高]}, missing}"""
+    atlas = await get_atlas("pool", name, await pool_map_ids(name))
+    return atlas.index.response(request)
+
+@app.get("/api/atlas/pools/{name}/image")
+async def api_pool_atlas_image(name: str, request: Request):
+    atlas = await get_atlas("pool", name, await pool_map_ids(name))
+    if atlas.image is None:
+        raise HTTPException(status_code=404)
+    return thumbnails.image_response(atlas, request)
+
+@app.get("/api/atlas/themes/{theme}")
+async def api_theme_atlas(theme: str, request: Request):
+    """主题的雪碧图索引，格式同地图池"""
+    atlas = await get_atlas("theme", theme, await theme_map_ids(theme))
+    return atlas.index.response(request)
+
+@app.get("/api/atlas/themes/{theme}/image")
+async def api_theme_atlas_image(theme: str, request: Request):
+    atlas = await get_atlas("theme", theme, await theme_map_ids(theme))
+    if atlas.image is None:
+        raise HTTPException(status_code=404)
+    return thumbnails.image_response(atlas, request)
 
 # --- WebSocket 端点 ---
 
+def resume_scoreboards(connection, seqs: dict, epochs: Optional[dict] = None):
+    """
+    为客户端补齐其有权查看的所有记分板。
+    seqs 为 {记分板频道: 客户端最后收到的序号}，未提供的记分板直接下发快照；
+    epochs 为 {记分板频道: 这些序号所属的纪元}，与服务器当前纪元不同 (服务重启过) 时也直接下发快照。
+    """
+    epochs = epochs or {}
+    for key, board in list(scoreboards.boards.items()):
+        if not any(part in connection.topics for part in key.split(",")):
+            continue
+        last_seq = seqs.get(key)
+        if not isinstance(last_seq, int):
+            last_seq = None
+        epoch = epochs.get(key)
+        if not isinstance(epoch, str):
+            epoch = None
+        for message in board.replay_since(last_seq, epoch):
+            connection.send_message(message)
+
+def handle_client_message(connection, data: str):
+    """处理客户端发来的消息：订阅/退订频道，以及重连后按序号补齐记分板"""
+    try:
+        message = json.loads(data)
+    except ValueError:
+        message = None
+    if not isinstance(message, dict):
+        print(f"收到来自 '{connection.username}' 的消息: {data}")
+        return
+
+    action = message.get("action")
+    topics = message.get("topics") or []
+    if isinstance(topics, str):
+        topics = [topics]
+    if action == "subscribe":
+        added = manager.subscribe(connection, topics)
+        connection.send_message({"type": "subscribed", "topics": added})
+    elif action == "unsubscribe":
+        removed = manager.unsubscribe(connection, topics)
+        connection.send_message({"type": "unsubscribed", "topics": removed})
+    elif action == "pong":
+        pass  # 存活时间已在收到消息时刷新
+    elif action == "resume":
+        seqs = message.get("seqs")
+        epochs = message.get("epochs")
+        resume_scoreboards(connection, seqs if isinstance(seqs, dict) else {},
+                           epochs if isinstance(epochs, dict) else {})
+    else:
+        print(f"收到来自 '{connection.username}' 的消息: {data}")
+
 @app.websocket("/ws/{token}")
 async def websocket_endpoint(websocket: WebSocket, token: str):
     """处理选手的WebSocket连接"""
-    username = auth_manager.verify_session_token(token)
+    username = await run_in_threadpool(auth_manager.verify_session_token, token)
     if not username:
         await websocket.close(code=1008)
         return
 
-    await manager.connect(websocket, username)
-    print(f"信息: 选手 '{username}' 已连接。")
+    # 客户端在连接时通过 ?topics=match:A1,team:red,role:player 订阅频道
+    topics = [t.strip() for t in websocket.query_params.get("topics", "").split(",") if t.strip()]
+    # 帧格式通过 ?format=json|json-bin|json-deflate|msgpack 协商，默认文本JSON
+    frame_format = negotiate_format(websocket.query_params.get("format", ""))
+    connection = await manager.connect(websocket, username, topics, frame_format)
+    print(f"信息: 选手 '{username}' 已连接 (帧格式: {frame_format})，订阅频道: {sorted(connection.topics)}")
     try:
         while True:
             data = await websocket.receive_text()
-            print(f"收到来自 '{username}' 的消息: {data}")
-    except WebSocketDisconnect:
-        manager.disconnect(username)
+            metrics.messages_in_total.inc()
+            connection.touch()
+            handle_client_message(connection, data)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: 连接已被服务端关闭 (例如慢客户端被断开)
+        pass
+    finally:
+        manager.disconnect(username, connection)
         print(f"信息: 选手 '{username}' 已断开连接。")
\ No newline at end of file
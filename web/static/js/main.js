@@ -28,6 +28,102 @@ if (document.getElementById('loginForm')) {
     });
 }
 
+// --- WebSocket 帧解码 ---
+// 文本帧为JSON；二进制帧首字节为类型标记: 0x01 JSON, 0x02 zlib压缩的JSON, 0x03 MessagePack
+const FRAME_TAG_JSON = 0x01;
+const FRAME_TAG_JSON_DEFLATE = 0x02;
+const FRAME_TAG_MSGPACK = 0x03;
+const utf8Decoder = new TextDecoder('utf-8');
+
+// 精简的 MessagePack 解码器，覆盖服务器可能发出的所有类型
+function decodeMsgpack(bytes) {
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    let offset = 0;
+    const readStr = (length) => {
+        const value = utf8Decoder.decode(bytes.subarray(offset, offset + length));
+        offset += length;
+        return value;
+    };
+    const readBin = (length) => {
+        const value = bytes.slice(offset, offset + length);
+        offset += length;
+        return value;
+    };
+    const readArray = (length) => {
+        const value = new Array(length);
+        for (let i = 0; i < length; i++) value[i] = read();
+        return value;
+    };
+    const readMap = (length) => {
+        const value = {};
+        for (let i = 0; i < length; i++) {
+            const key = read();
+            value[key] = read();
+        }
+        return value;
+    };
+    const read = () => {
+        const type = view.getUint8(offset++);
+        if (type <= 0x7f) return type;
+        if (type >= 0xe0) return type - 0x100;
+        if ((type & 0xf0) === 0x80) return readMap(type & 0x0f);
+        if ((type & 0xf0) === 0x90) return readArray(type & 0x0f);
+        if ((type & 0xe0) === 0xa0) return readStr(type & 0x1f);
+        let value;
+        switch (type) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: value = view.getUint8(offset); offset += 1; return readBin(value);
+            case 0xc5: value = view.getUint16(offset); offset += 2; return readBin(value);
+            case 0xc6: value = view.getUint32(offset); offset += 4; return readBin(value);
+            case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+            case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+            case 0xcc: value = view.getUint8(offset); offset += 1; return value;
+            case 0xcd: value = view.getUint16(offset); offset += 2; return value;
+            case 0xce: value = view.getUint32(offset); offset += 4; return value;
+            case 0xcf: value = Number(view.getBigUint64(offset)); offset += 8; return value;
+            case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+            case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+            case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+            case 0xd3: value = Number(view.getBigInt64(offset)); offset += 8; return value;
+            case 0xd9: value = view.getUint8(offset); offset += 1; return readStr(value);
+            case 0xda: value = view.getUint16(offset); offset += 2; return readStr(value);
+            case 0xdb: value = view.getUint32(offset); offset += 4; return readStr(value);
+            case 0xdc: value = view.getUint16(offset); offset += 2; return readArray(value);
+            case 0xdd: value = view.getUint32(offset); offset += 4; return readArray(value);
+            case 0xde: value = view.getUint16(offset); offset += 2; return readMap(value);
+            case 0xdf: value = view.getUint32(offset); offset += 4; return readMap(value);
+            default: throw new Error(`不支持的 MessagePack 类型: 0x${type.toString(16)}`);
+        }
+    };
+    return read();
+}
+
+async function inflate(bytes) {
+    const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+async function decodeFrame(data) {
+    if (typeof data === 'string') return JSON.parse(data);
+    const bytes = new Uint8Array(data);
+    const payload = bytes.subarray(1);
+    switch (bytes[0]) {
+        case FRAME_TAG_JSON: return JSON.parse(utf8Decoder.decode(payload));
+        case FRAME_TAG_JSON_DEFLATE: return JSON.parse(utf8Decoder.decode(await inflate(payload)));
+        case FRAME_TAG_MSGPACK: return decodeMsgpack(payload);
+        default: throw new Error(`未知的帧类型: ${bytes[0]}`);
+    }
+}
+
+// 默认选择浏览器能解码的最紧凑格式，也可通过 /dashboard?format=json 等手动指定
+function preferredFrameFormat() {
+    const requested = new URLSearchParams(window.location.search).get('format');
+    if (requested) return requested;
+    return typeof DecompressionStream === 'function' ? 'json-deflate' : 'json-bin';
+}
+
 // 仪表盘页面逻辑
 if (document.getElementById('dashboard')) {
     const statusDiv = document.getElementById('status');
@@ -40,37 +136,141 @@ if (document.getElementById('dashboard')) {
     } else {
         // 使用 ws:// 或 wss:// (for https)
         const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const wsUrl = `${wsProtocol}//${window.location.host}/ws/${token}`;
-        const socket = new WebSocket(wsUrl);
+        // 频道订阅：可通过 /dashboard?topics=match:A1,team:red,role:player 指定
+        const topics = new URLSearchParams(window.location.search).get('topics') || '';
+        const wsParams = new URLSearchParams({ format: preferredFrameFormat() });
+        if (topics) wsParams.set('topics', topics);
+        const wsUrl = `${wsProtocol}//${window.location.host}/ws/${token}?${wsParams}`;
+
+        // 本地记分板副本: { 频道: { epoch, seq, round, scores } }，存入 sessionStorage 以便刷新/重连后续传。
+        // 服务重启后序号重新从 1 开始、纪元 (epoch) 改变，旧纪元的副本不能再按序号比较
+        const boards = JSON.parse(sessionStorage.getItem('scoreboards') || '{}');
+        let socket = null;
+        let reconnectDelay = 1000;
+        let resumePending = false;
 
-        socket.onopen = () => {
-            statusDiv.textContent = "已连接到比赛服务器。";
-            console.log("WebSocket connection established.");
+        const saveBoards = () => sessionStorage.setItem('scoreboards', JSON.stringify(boards));
+
+        const renderBoards = () => {
+            const topicsShown = Object.keys(boards);
+            if (topicsShown.length === 0) return;
+            // 简单地将分数数据显示为JSON字符串，多个记分板按频道分开
+            scoreboardDiv.innerHTML = topicsShown.map((topic) => {
+                const title = topicsShown.length > 1 ? `<h3>${topic}</h3>` : '';
+                return `${title}<pre>${JSON.stringify(boards[topic].scores, null, 2)}</pre>`;
+            }).join('');
         };
 
-        socket.onmessage = (event) => {
-            console.log("Message from server: ", event.data);
-            const message = JSON.parse(event.data);
-
-            // 根据消息类型更新UI
-            if (message.type === 'score_update') {
-                statusDiv.textContent = `第 ${message.round} 局分数已更新！`;
-                // 简单地将分数数据显示为JSON字符串
-                scoreboardDiv.innerHTML = `<pre>${JSON.stringify(message.scores, null, 2)}</pre>`;
-            } else if (message.type === 'broadcast') {
-                statusDiv.textContent = `通知: ${message.text}`;
+        const requestResume = () => {
+            if (!socket || socket.readyState !== WebSocket.OPEN || resumePending) return;
+            resumePending = true;
+            const seqs = {};
+            const epochs = {};
+            for (const [topic, board] of Object.entries(boards)) {
+                seqs[topic] = board.seq;
+                if (board.epoch) epochs[topic] = board.epoch;
             }
-            // ...未来可以扩展更多消息类型
+            socket.send(JSON.stringify({ action: 'resume', seqs, epochs }));
+        };
+
+        const applySnapshot = (message) => {
+            const board = boards[message.topic];
+            // 同一纪元内序号更大的副本更新，快照已过期；纪元不同 (服务重启过) 时总是以快照为准
+            if (board && board.epoch === message.epoch && board.seq > message.seq) return;
+            boards[message.topic] = {
+                epoch: message.epoch, seq: message.seq, round: message.round, scores: message.scores,
+            };
+            resumePending = false;
+            saveBoards();
+            renderBoards();
         };
 
-        socket.onclose = () => {
-            statusDiv.textContent = "与服务器的连接已断开。";
-            console.log("WebSocket connection closed.");
+        const applyDelta = (message) => {
+            const board = boards[message.topic];
+            if (!board) return;  // 尚无基础状态，等待快照
+            if (board.epoch !== message.epoch) {
+                // 服务重启过，本地副本的序号已失效：丢弃副本并请求新纪元的快照
+                delete boards[message.topic];
+                saveBoards();
+                requestResume();
+                return;
+            }
+            if (message.seq <= board.seq) return;  // 重复的增量
+            if (message.seq !== board.seq + 1) {
+                // 出现缺口 (例如消息被丢弃)，向服务器请求补齐
+                requestResume();
+                return;
+            }
+            for (const [key, value] of Object.entries(message.changes)) board.scores[key] = value;
+            for (const key of message.removed) delete board.scores[key];
+            board.seq = message.seq;
+            board.round = message.round;
+            resumePending = false;
+            saveBoards();
+            renderBoards();
+            statusDiv.textContent = `第 ${message.round} 局分数已更新！`;
         };
 
-        socket.onerror = (error) => {
-            statusDiv.textContent = "连接发生错误。";
-            console.error("WebSocket error: ", error);
+        const connect = () => {
+            socket = new WebSocket(wsUrl);
+            socket.binaryType = 'arraybuffer';
+            // 压缩帧需要异步解码，用一条Promise链保证消息按到达顺序处理
+            let decodeChain = Promise.resolve();
+
+            socket.onopen = () => {
+                statusDiv.textContent = "已连接到比赛服务器。";
+                console.log("WebSocket connection established.");
+                reconnectDelay = 1000;
+                resumePending = false;
+                // 带上各记分板最后收到的序号，服务器据此补发缺失的增量或快照
+                requestResume();
+            };
+
+            socket.onmessage = (event) => {
+                decodeChain = decodeChain
+                    .then(() => decodeFrame(event.data))
+                    .then(handleMessage)
+                    .catch((error) => console.error("Failed to handle message: ", error));
+            };
+
+            const handleMessage = (message) => {
+                console.log("Message from server: ", message);
+
+                // 根据消息类型更新UI
+                if (message.type === 'score_delta') {
+                    applyDelta(message);
+                } else if (message.type === 'score_snapshot') {
+                    applySnapshot(message);
+                } else if (message.type === 'ping') {
+                    // 服务器心跳，回复后连接不会被当作死连接移除
+                    socket.send(JSON.stringify({ action: 'pong' }));
+                } else if (message.type === 'broadcast') {
+                    statusDiv.textContent = `通知: ${message.text}`;
+                }
+                // ...未来可以扩展更多消息类型
+            };
+
+            socket.onclose = (event) => {
+                console.log("WebSocket connection closed.");
+                if (event.code === 1008) {
+                    // 令牌无效，返回登录页
+                    localStorage.removeItem('authToken');
+                    window.location.href = '/';
+                    return;
+                }
+                statusDiv.textContent = "与服务器的连接已断开，正在重连...";
+                // 1012: 服务器正在重启，很快就会恢复
+                setTimeout(connect, event.code === 1012 ? 300 : reconnectDelay);
+                reconnectDelay = Math.min(reconnectDelay * 2, 15000);
+            };
+
+            socket.onerror = (error) => {
+                statusDiv.textContent = "连接发生错误。";
+                console.error("WebSocket error: ", error);
+            };
         };
+
+        renderBoards();
+        connect();
     }
 }
\ No newline at end of file
@@ -0,0 +1,165 @@
+# 文件名: web/thumbnails.py
+
+import hashlib
+import io
+import math
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+from web.asset_cache import CachedAsset, IMMUTABLE_CACHE_CONTROL
+from web.framing import dumps_json_bytes
+
+# 地图缩略图由地图导入流程缓存到 data/thumbnails/<地图ID>.png。
+# 网页上展示一整个地图池或主题时，服务器把其中所有缩略图拼成一张雪碧图 (sprite atlas)，
+# 并附带一个 JSON 索引 (每张缩略图在大图中的位置)，整个地图池只需请求一次图片。
+# 雪碧图以 (地图ID列表, 各缩略图的修改时间和大小) 的哈希作为签名缓存在内存中，
+# 只有地图池内容或缩略图文件变化时才重新生成。
+
+DEFAULT_THUMBNAIL_DIR = "data/thumbnails"
+REVERSE_SUFFIX = "_rvs"
+MAP_ID_REGEX = re.compile(r"^[A-Za-z0-9_\-]{1,128}$")
+
+
+def base_map_id(display_id: str) -> str:
+    """反向地图 (<地图ID>_rvs) 与正向地图共用同一张缩略图"""
+    return display_id[:-len(REVERSE_SUFFIX)] if display_id.endswith(REVERSE_SUFFIX) else display_id
+
+
+class SpriteAtlas:
+    """一张已生成的雪碧图及其索引"""
+
+    def __init__(self, signature: str, image: Optional[CachedAsset], index: dict):
+        self.signature = signature
+        self.image = image
+        self.index = CachedAsset(dumps_json_bytes(index), "application/json", tag=f"atlas-{signature}")
+        self.checked_at = time.monotonic()
+
+
+class ThumbnailService:
+    def __init__(self, thumb_dir: str = DEFAULT_THUMBNAIL_DIR, check_interval: float = 1.0, max_atlases: int = 32):
+        self.thumb_dir = thumb_dir
+        self.check_interval = check_interval
+        self.max_atlases = max_atlases
+        self.atlases: Dict[Tuple[str, Tuple[str, ...]], SpriteAtlas] = {}
+        self._lock = threading.Lock()
+
+    def thumbnail_path(self, map_id: str) -> Optional[str]:
+        """单张缩略图的文件路径 (反向地图使用正向地图的缩略图)；地图ID不合法时返回 None (防止路径穿越)"""
+        if not MAP_ID_REGEX.match(map_id):
+            return None
+        return os.path.join(self.thumb_dir, f"{base_map_id(map_id)}.png")
+
+    def _stat_thumbnails(self, map_ids: Sequence[str]) -> Dict[str, os.stat_result]:
+        stats = {}
+        for map_id in map_ids:
+            path = self.thumbnail_path(map_id)
+            if path is None:
+                continue
+            try:
+                stats[map_id] = os.stat(path)
+            except OSError:
+                pass
+        return stats
+
+    def cached_atlas(self, name: str, display_ids: Sequence[str]) -> Optional[SpriteAtlas]:
+        """
+        在内存中查找仍然有效的雪碧图 (不访问磁盘，可在事件循环中调用)。
+        距上次检查缩略图文件超过 check_interval 秒时返回 None，由 get_atlas 重新检查。
+        """
+        atlas = self.atlases.get((name, tuple(display_ids)))
+        if atlas is not None and time.monotonic() - atlas.checked_at < self.check_interval:
+            return atlas
+        return None
+
+    def get_atlas(self, name: str, display_ids: Sequence[str], image_url: str) -> SpriteAtlas:
+        """
+        返回雪碧图，必要时重新生成 (会读写磁盘和解码图片，请在线程池中调用)。
+        :param name: 缓存键，如 'pool:决赛' 或 'theme:village'
+        :param display_ids: 地图ID列表 (可含 _rvs 反向地图)，顺序即索引顺序
+        :param image_url: 雪碧图的地址，索引中会附上签名作为版本参数
+        """
+        if not PIL_AVAILABLE:
+            raise RuntimeError("Pillow 未安装，无法生成雪碧图。")
+        key = (name, tuple(display_ids))
+        map_ids = list(dict.fromkeys(base_map_id(display_id) for display_id in display_ids))
+        with self._lock:
+            stats = self._stat_thumbnails(map_ids)
+            digest = hashlib.sha1()
+            for map_id in map_ids:
+                st = stats.get(map_id)
+                digest.update(f"{map_id}:{st.st_mtime_ns if st else 0}:{st.st_size if st else 0};".encode("utf-8"))
+            for display_id in display_ids:
+                digest.update(display_id.encode("utf-8") + b";")
+            signature = digest.hexdigest()[:16]
+
+            atlas = self.atlases.get(key)
+            if atlas is not None and atlas.signature == signature:
+                atlas.checked_at = time.monotonic()
+                return atlas
+            atlas = self._build(signature, display_ids, [m for m in map_ids if m in stats], image_url)
+            if key not in self.atlases and len(self.atlases) >= self.max_atlases:
+                self.atlases.pop(next(iter(self.atlases)))
+            self.atlases[key] = atlas
+            return atlas
+
+    def _build(self, signature: str, display_ids: Sequence[str], map_ids: List[str], image_url: str) -> SpriteAtlas:
+        images = {}
+        for map_id in map_ids:
+            try:
+                with Image.open(self.thumbnail_path(map_id)) as img:
+                    images[map_id] = img.convert("RGBA")
+            except (OSError, ValueError) as e:
+                print(f"警告: 无法读取缩略图 '{map_id}': {e}")
+
+        sprites, missing = {}, []
+        png = None
+        width = height = 0
+        if images:
+            # 按最大的缩略图尺寸划分网格，列数取平方根使整张图接近正方形
+            cell_w = max(img.width for img in images.values())
+            cell_h = max(img.height for img in images.values())
+            columns = math.ceil(math.sqrt(len(images)))
+            rows = math.ceil(len(images) / columns)
+            width, height = columns * cell_w, rows * cell_h
+            sheet = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+            positions = {}
+            for i, (map_id, img) in enumerate(images.items()):
+                x, y = (i % columns) * cell_w, (i // columns) * cell_h
+                sheet.paste(img, (x, y))
+                positions[map_id] = [x, y, img.width, img.height]
+            buffer = io.BytesIO()
+            sheet.save(buffer, format="PNG")
+            png = CachedAsset(buffer.getvalue(), "image/png", tag=signature)
+            for display_id in display_ids:
+                position = positions.get(base_map_id(display_id))
+                if position is None:
+                    missing.append(display_id)
+                else:
+                    sprites[display_id] = position
+        else:
+            missing = list(display_ids)
+
+        index = {
+            "image": f"{image_url}?v={signature}" if png is not None else None,
+            "width": width,
+            "height": height,
+            "sprites": sprites,   # {地图ID: [x, y, 宽, 高]}
+            "missing": missing,   # 没有缩略图的地图
+        }
+        return SpriteAtlas(signature, png, index)
+
+    @staticmethod
+    def image_response(atlas: SpriteAtlas, request):
+        """雪碧图本身：带当前签名的地址可长期缓存"""
+        if request.query_params.get("v") == atlas.signature:
+            return atlas.image.response(request, IMMUTABLE_CACHE_CONTROL)
+        return atlas.image.response(request)
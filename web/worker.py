@@ -0,0 +1,83 @@
+# 文件名: web/worker.py
+
+import asyncio
+import os
+
+import uvicorn
+
+
+class NotifyingServer(uvicorn.Server):
+    """在端口绑定成功后回调通知的 uvicorn.Server"""
+
+    def __init__(self, config, on_started):
+        super().__init__(config)
+        self._on_started = on_started
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if self.started:
+            self._on_started(asyncio.get_running_loop())
+
+
+def build_config(app, settings: dict) -> uvicorn.Config:
+    """根据 WebServiceManager 的配置构建 uvicorn.Config"""
+    return uvicorn.Config(
+        app,
+        host=settings["host"],
+        port=settings["port"],
+        loop=settings["loop"],
+        log_level=settings["log_level"],
+        # permessage-deflate 在握手时与每个客户端协商，但压缩按连接进行，CPU开销随客户端数增长；
+        # 大多数客户端使用 json-deflate 帧格式 (每次广播只压缩一次) 时可以关闭
+        ws_per_message_deflate=settings["per_message_deflate"],
+        timeout_graceful_shutdown=settings["graceful_timeout"],
+    )
+
+
+def run_worker(settings: dict, sockets, broker_address, broker_authkey: bytes, db_path: str):
+    """
+    Web工作进程入口 (多进程部署时由桌面程序以 spawn 方式启动)。
+    监听套接字由父进程绑定后传入，各工作进程共享同一端口；
+    指令经本地代理送达，会话令牌通过共享数据库校验。
+    """
+    # 必须在导入Web服务之前初始化数据库，确保与桌面程序使用同一个数据库文件
+    from core.db_manager import DBManager
+    DBManager(db_path)
+
+    from web.broker import BrokerSubscriber
+    from web.server import app, apply_settings, command_queue, drain_connections
+
+    state = {"server": None, "loop": None}
+
+    def on_shutdown(drain_timeout):
+        server, loop = state["server"], state["loop"]
+        if server is None:
+            return
+        if loop is None or loop.is_closed():
+            server.should_exit = True
+            return
+
+        async def shutdown():
+            try:
+                result = await drain_connections(drain_timeout)
+                if result["requeued"]:
+                    # 工作进程随后退出，暂存区中的指令不会再被处理
+                    print(f"警告: 工作进程 {os.getpid()} 退出，丢弃 {result['requeued']} 条未处理的指令。")
+            finally:
+                server.should_exit = True
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop)
+        except RuntimeError:
+            server.should_exit = True
+
+    subscriber = BrokerSubscriber(broker_address, broker_authkey, command_queue.put, on_shutdown)
+
+    def on_started(loop):
+        state["loop"] = loop
+        subscriber.notify_ready(os.getpid())
+
+    apply_settings(settings)
+    server = state["server"] = NotifyingServer(build_config(app, settings), on_started)
+    subscriber.start()
+    server.run(sockets=sockets)